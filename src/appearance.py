@@ -0,0 +1,149 @@
+"""@package docstring
+Visible signature appearances built from a signature image.
+
+Decoding, resampling and compressing the image is by far the most
+expensive part of a visible signature, so the encoded image data and
+the appearance stream are cached per (image file, box size) and only
+copied into each signed document.
+"""
+import os
+import zlib
+import functools
+from dataclasses import dataclass
+
+from pyhanko.pdf_utils import generic, layout
+from pyhanko.pdf_utils.content import AppearanceContent, ResourceType
+from pyhanko.pdf_utils.generic import pdf_name
+from pyhanko.stamp import BaseStampStyle
+
+## Maximum number of (image, box size) entries kept in memory.
+APPEARANCE_CACHE_SIZE = 32
+## Image resolution relative to the box size in points (2 = 144 dpi).
+IMAGE_SCALE = 2
+IMAGE_RESOURCE_NAME = '/SigImage'
+
+
+class ImageAppearance:
+    """Encoded signature image and appearance stream for one box size."""
+
+    def __init__(self, width, height, pixel_size, color_space, image_data, smask_data, content):
+        self.width = width
+        self.height = height
+        self.pixel_size = pixel_size
+        self.color_space = color_space
+        self.image_data = image_data
+        self.smask_data = smask_data
+        self.content = content
+
+    def _image_stream(self, color_space, data, smask_ref=None):
+        """Build image XObject from already compressed pixel data."""
+
+        dict_data = {
+            pdf_name('/Type'): pdf_name('/XObject'),
+            pdf_name('/Subtype'): pdf_name('/Image'),
+            pdf_name('/Width'): generic.NumberObject(self.pixel_size[0]),
+            pdf_name('/Height'): generic.NumberObject(self.pixel_size[1]),
+            pdf_name('/ColorSpace'): pdf_name(color_space),
+            pdf_name('/BitsPerComponent'): generic.NumberObject(8),
+            pdf_name('/Filter'): pdf_name('/FlateDecode'),
+        }
+        if smask_ref is not None:
+            dict_data[pdf_name('/SMask')] = smask_ref
+        return generic.StreamObject(dict_data, encoded_data=data)
+
+    def add_image(self, writer):
+        """Add the image XObject to writer, return its reference."""
+
+        smask_ref = None
+        if self.smask_data is not None:
+            smask_ref = writer.add_object(self._image_stream('/DeviceGray', self.smask_data))
+        return writer.add_object(self._image_stream(self.color_space, self.image_data, smask_ref))
+
+
+def _load_image_appearance(image_path, width, height):
+    """Decode, resample and compress image for the given box size."""
+
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        img.load()
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+    max_size = (max(1, int(width * IMAGE_SCALE)), max(1, int(height * IMAGE_SCALE)))
+    img.thumbnail(max_size, Image.LANCZOS)
+
+    smask_data = None
+    if has_alpha:
+        smask_data = zlib.compress(img.getchannel('A').tobytes())
+        img = img.convert('RGB')
+    image_data = zlib.compress(img.tobytes())
+
+    # keep aspect ratio, center the image inside the box
+    scale = min(width / img.width, height / img.height)
+    draw_width, draw_height = img.width * scale, img.height * scale
+    content = b'q %g 0 0 %g %g %g cm %s Do Q' % (
+        draw_width, draw_height,
+        (width - draw_width) / 2, (height - draw_height) / 2,
+        IMAGE_RESOURCE_NAME.encode('ascii')
+    )
+    return ImageAppearance(width, height, img.size, '/DeviceRGB', image_data, smask_data, content)
+
+
+@functools.lru_cache(maxsize=APPEARANCE_CACHE_SIZE)
+def _cached_image_appearance(image_path, mtime_ns, width, height):
+    """Cached variant of _load_image_appearance, keyed also by file mtime."""
+
+    return _load_image_appearance(image_path, width, height)
+
+
+def get_image_appearance(image_path, width, height):
+    """Return cached appearance of image_path for a box of given size."""
+
+    image_path = os.path.abspath(image_path)
+    return _cached_image_appearance(image_path, os.stat(image_path).st_mtime_ns, width, height)
+
+
+def clear_appearance_cache():
+    """Drop all cached signature appearances."""
+
+    _cached_image_appearance.cache_clear()
+
+
+def appearance_cache_info():
+    """Return hit/miss statistics of the appearance cache."""
+
+    return _cached_image_appearance.cache_info()
+
+
+class CachedImageStamp(AppearanceContent):
+    """Signature appearance drawing a cached image appearance."""
+
+    def __init__(self, writer, appearance, box):
+        super().__init__(writer=writer, box=box)
+        self.appearance = appearance
+
+    def render(self):
+        self.set_resource(
+            category=ResourceType.XOBJECT,
+            name=pdf_name(IMAGE_RESOURCE_NAME),
+            value=self.appearance.add_image(self._ensure_writer)
+        )
+        return self.appearance.content
+
+
+@dataclass(frozen=True)
+class ImageStampStyle(BaseStampStyle):
+    """Stamp style rendering the signature image scaled into the field box."""
+
+    image_path: str = None
+    cached: bool = True
+
+    def create_stamp(self, writer, box, text_params):
+        if not (box and box.width_defined and box.height_defined):
+            raise layout.LayoutError("Image signature appearance requires a field box.")
+        if self.cached:
+            appearance = get_image_appearance(self.image_path, box.width, box.height)
+        else:
+            appearance = _load_image_appearance(self.image_path, box.width, box.height)
+        return CachedImageStamp(writer, appearance, box)
@@ -0,0 +1,220 @@
+"""@package docstring
+Sign and verify the PDF members of ZIP and TAR archives.
+
+Members are read straight from the input archive into memory, signed
+into memory and written to the output archive; nothing is extracted to
+disk. Other members, and PDF members that fail to sign, pass through
+unchanged with their metadata. A JSON manifest with the result and
+SHA-256 of every file member is added to the output archive as
+signing-manifest.json. TAR archives are read and written as streams,
+so compressed tarballs need no random access.
+"""
+import io
+import os
+import json
+import copy
+import hashlib
+import tarfile
+import zipfile
+import datetime
+from collections import namedtuple
+
+from tracing import span
+
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = {
+    ".tar": "", ".tar.gz": "gz", ".tgz": "gz", ".tar.bz2": "bz2", ".tbz2": "bz2", ".tar.xz": "xz", ".txz": "xz",
+}
+MANIFEST_NAME = "signing-manifest.json"
+## Earliest date_time a ZIP member can have.
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+MemberResult = namedtuple("MemberResult", ["name", "action", "size", "sha256", "error", "signatures"])
+
+
+def _suffix(path):
+    lower = path.lower()
+    for suffix in sorted(ZIP_SUFFIXES + tuple(TAR_SUFFIXES), key=len, reverse=True):
+        if lower.endswith(suffix):
+            return path[len(path) - len(suffix):]
+    return None
+
+
+def is_archive(path):
+    """True for paths with a ZIP or TAR suffix."""
+
+    return _suffix(path) is not None
+
+
+def archive_output_path(path, output_dir=None):
+    """Output path of a signed archive, same format as the input."""
+
+    suffix = _suffix(path)
+    output_file = f"{path[:-len(suffix)]}_signed{suffix}"
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        output_file = os.path.join(output_dir, os.path.basename(output_file))
+    return output_file
+
+
+def _is_pdf(name):
+    return name.lower().endswith(".pdf")
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest() if data is not None else None
+
+
+def _read_members(path):
+    """(name, info, data) of every member, data None for non-files."""
+
+    if _suffix(path).lower() in ZIP_SUFFIXES:
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                yield info.filename, info, None if info.is_dir() else archive.read(info)
+    else:
+        with tarfile.open(path, "r|*") as archive:
+            for info in archive:
+                yield info.name, info, archive.extractfile(info).read() if info.isfile() else None
+
+
+class _ArchiveWriter:
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        suffix = _suffix(path).lower()
+        if suffix in ZIP_SUFFIXES:
+            self.archive = zipfile.ZipFile(self.tmp_path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.tmp_path, f"w|{TAR_SUFFIXES[suffix]}")
+
+    def add(self, info, data):
+        if isinstance(self.archive, zipfile.ZipFile):
+            if not isinstance(info, zipfile.ZipInfo):
+                info = self._zip_info(info)
+            self.archive.writestr(info, data if data is not None else b"")
+        else:
+            if not isinstance(info, tarfile.TarInfo):
+                info = self._tar_info(info)
+            info = copy.copy(info)
+            if data is None:
+                self.archive.addfile(info)
+            else:
+                info.size = len(data)
+                self.archive.addfile(info, io.BytesIO(data))
+
+    def add_new(self, name, data):
+        if isinstance(self.archive, zipfile.ZipFile):
+            info = zipfile.ZipInfo(name, datetime.datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+        else:
+            info = tarfile.TarInfo(name)
+            info.mtime = int(datetime.datetime.now().timestamp())
+            info.mode = 0o644
+        self.add(info, data)
+
+    def _zip_info(self, tar_info):
+        # ZIP dates start in 1980, tarballs of reproducible builds often carry mtime 0
+        date_time = max(datetime.datetime.fromtimestamp(tar_info.mtime).timetuple()[:6], ZIP_EPOCH)
+        info = zipfile.ZipInfo(tar_info.name + ("/" if tar_info.isdir() else ""), date_time)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = (tar_info.mode & 0xFFFF) << 16
+        return info
+
+    def _tar_info(self, zip_info):
+        info = tarfile.TarInfo(zip_info.filename.rstrip("/"))
+        info.mtime = int(datetime.datetime(*zip_info.date_time).timestamp())
+        info.mode = (zip_info.external_attr >> 16) & 0o7777 or 0o644
+        if zip_info.is_dir():
+            info.type = tarfile.DIRTYPE
+            info.mode |= 0o111
+        return info
+
+    def close(self, keep):
+        self.archive.close()
+        if keep:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+
+def _manifest(archive_path, results):
+    return json.dumps({
+        "archive": os.path.basename(archive_path),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "members": [result._asdict() for result in results],
+    }, indent=2).encode("utf-8")
+
+
+def write_manifest(path, archive_path, results):
+    """Write manifest of member results to path."""
+
+    with open(path, "wb") as f:
+        f.write(_manifest(archive_path, results))
+
+
+def sign_archive(input_path, output_path, sign_stream, log=None):
+    """Sign the PDF members of an archive into an archive of the output_path format.
+
+    sign_stream(input, output) signs one PDF from and to binary streams.
+    Members failing to sign are copied unchanged and listed as failed in
+    the manifest. Returns list of MemberResult.
+    """
+
+    log = log or (lambda message: None)
+    results = []
+    writer = _ArchiveWriter(output_path)
+    try:
+        for name, info, data in _read_members(input_path):
+            if name == MANIFEST_NAME:
+                # replaced by the manifest of this run
+                continue
+            if data is None or not _is_pdf(name):
+                writer.add(info, data)
+                results.append(MemberResult(name, "passed", len(data or b""), _sha256(data), None, None))
+                continue
+            output = io.BytesIO()
+            try:
+                with span("sign_archive_member", member=name):
+                    sign_stream(io.BytesIO(data), output)
+            except Exception as e:
+                log(f"Error signing {name}: {e}")
+                writer.add(info, data)
+                results.append(MemberResult(name, "failed", len(data), _sha256(data), str(e), None))
+                continue
+            signed = output.getvalue()
+            writer.add(info, signed)
+            results.append(MemberResult(name, "signed", len(signed), _sha256(signed), None, None))
+            log(f"Signed {name}")
+        writer.add_new(MANIFEST_NAME, _manifest(input_path, results))
+    except BaseException:
+        writer.close(keep=False)
+        raise
+    writer.close(keep=True)
+    return results
+
+
+def verify_archive(input_path, verify_stream, log=None):
+    """Verify the PDF members of an archive.
+
+    verify_stream(input, name) returns the list of per-signature result
+    dicts of one PDF. Returns list of MemberResult.
+    """
+
+    log = log or (lambda message: None)
+    results = []
+    for name, info, data in _read_members(input_path):
+        if data is None or not _is_pdf(name):
+            results.append(MemberResult(name, "skipped", len(data or b""), _sha256(data), None, None))
+            continue
+        digest = _sha256(data)
+        try:
+            with span("verify_archive_member", member=name):
+                signatures = verify_stream(io.BytesIO(data), name)
+        except Exception as e:
+            log(f"Error verifying {name}: {e}")
+            results.append(MemberResult(name, "failed", len(data), digest, str(e), None))
+            continue
+        results.append(MemberResult(name, "verified" if signatures else "unsigned", len(data), digest, None,
+                                    signatures))
+    return results
@@ -0,0 +1,251 @@
+"""@package docstring
+Benchmarks of signing and verification code paths.
+
+Run e.g. `python bench.py sign --key signer.key --cert signer.pem input.pdf`.
+"""
+import os
+import time
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from pyhanko.sign import signers, fields
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+from signing import DEFAULT_FIELD_BOX, build_signature_meta, sign_document
+from appearance import ImageStampStyle, clear_appearance_cache, appearance_cache_info
+from timestamping import PooledHTTPTimeStamper
+from local_tsa import LocalTSA
+from deferred_signing import DeferredBatchSigner, HTTPSignerBackend
+from remote_signer import RemoteSignerServer, load_backend
+from field_provisioning import FieldLayout, provision_document
+from key_storage import KDFS, DEFAULT_KDF_COST, PASSPHRASE_ALPHABET, UnlockedKeyCache, encrypt_private_key
+
+
+def report(name, timings):
+    """Print timing summary of one benchmark case."""
+
+    timings_ms = [t * 1000 for t in timings]
+    click.echo(
+        f"{name:<28} n={len(timings_ms):<4} "
+        f"mean={statistics.mean(timings_ms):8.2f} ms  "
+        f"median={statistics.median(timings_ms):8.2f} ms  "
+        f"max={max(timings_ms):8.2f} ms"
+    )
+
+
+def time_runs(func, count):
+    """Call func count times, return list of wall times in seconds."""
+
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def load_signer(key, cert, chain, passphrase):
+    """Load signer used by benchmarks."""
+
+    return signers.SimpleSigner.load(
+        key, cert,
+        ca_chain_files=list(chain),
+        key_passphrase=passphrase.encode() if passphrase else None
+    )
+
+
+@click.group()
+def cli():
+    """Benchmarks of the PDF signing tool."""
+
+
+@cli.command()
+@click.argument("pdf_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--key", required=True, type=click.Path(exists=True), help="Signer private key.")
+@click.option("--cert", required=True, type=click.Path(exists=True), help="Signer certificate.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", default=None, help="Private key passphrase.")
+@click.option("--image", default=None, type=click.Path(exists=True), help="Signature image.")
+@click.option("-n", "--count", default=20, show_default=True, help="Documents per case.")
+def sign(pdf_file, key, cert, chain, passphrase, image, count):
+    """Compare invisible and visible signing cost."""
+
+    try:
+        cms_signer = load_signer(key, cert, chain, passphrase)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "signed.pdf")
+
+        def run(create_field, stamp_style=None):
+            return lambda i: sign_document(
+                pdf_file, output_file, cms_signer,
+                build_signature_meta(f"BenchSignature{i}"),
+                create_field=create_field,
+                field_box=DEFAULT_FIELD_BOX,
+                stamp_style=stamp_style
+            )
+
+        report("invisible", time_runs(run(False), count))
+        report("visible (text stamp)", time_runs(run(True), count))
+        if image:
+            report("visible (image, uncached)", time_runs(
+                run(True, ImageStampStyle(image_path=image, cached=False)), count
+            ))
+            clear_appearance_cache()
+            report("visible (image, cached)", time_runs(
+                run(True, ImageStampStyle(image_path=image)), count
+            ))
+            click.echo(f"appearance cache: {appearance_cache_info()}")
+
+
+@cli.command()
+@click.option("--tsa-url", default=None, help="TSA to benchmark (default: local stand-in TSA).")
+@click.option("--delay", default=0.0, show_default=True, help="Artificial latency of the local TSA in seconds.")
+@click.option("-n", "--count", default=50, show_default=True, help="Timestamp requests per case.")
+@click.option("-j", "--jobs", default=4, show_default=True, help="Concurrent requests.")
+def timestamp(tsa_url, delay, count, jobs):
+    """Measure TSA latency, pooled vs one connection per request."""
+
+    import asyncio
+    from pyhanko.sign.timestamps.requests_client import HTTPTimeStamper
+
+    local_tsa = None
+    if not tsa_url:
+        local_tsa = LocalTSA(delay=delay).start()
+        tsa_url = local_tsa.url
+        click.echo(f"Using local TSA at {tsa_url}")
+
+    digest = bytes(32)
+    try:
+        unpooled = HTTPTimeStamper(tsa_url)
+        report("unpooled, sequential", time_runs(
+            lambda i: asyncio.run(unpooled.async_timestamp(digest, 'sha256')), count
+        ))
+
+        pooled = PooledHTTPTimeStamper(tsa_url, max_concurrency=jobs)
+        report("pooled, sequential", time_runs(
+            lambda i: pooled.timestamp(digest, 'sha256'), count
+        ))
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            start = time.perf_counter()
+            list(executor.map(lambda i: pooled.timestamp(digest, 'sha256'), range(count)))
+            elapsed = time.perf_counter() - start
+        click.echo(
+            f"pooled, {jobs} concurrent: {count / elapsed:.1f} req/s, "
+            f"mean latency {pooled.mean_latency() * 1000:.2f} ms"
+        )
+    finally:
+        if local_tsa:
+            local_tsa.stop()
+
+
+@cli.command()
+@click.argument("layout_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("pdf_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("-n", "--count", default=50, show_default=True, help="Documents per case.")
+def provision(layout_file, pdf_file, count):
+    """Compare per-field append_signature_field with a compiled field layout."""
+
+    layout = FieldLayout.load(layout_file)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "fields.pdf")
+
+        def append_fields(i):
+            with open(pdf_file, 'rb') as doc:
+                w = IncrementalPdfFileWriter(doc)
+                for field in layout.fields:
+                    fields.append_signature_field(w, fields.SigFieldSpec(
+                        sig_field_name=field.name, on_page=field.page, box=field.box
+                    ))
+                with open(output_file, 'wb') as out:
+                    w.write(out)
+
+        report(f"append_signature_field x{len(layout.fields)}", time_runs(append_fields, count))
+        report("compiled layout", time_runs(lambda i: provision_document(pdf_file, output_file, layout), count))
+
+
+@cli.command()
+@click.argument("pdf_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--key", required=True, type=click.Path(exists=True), help="Signer private key.")
+@click.option("--cert", required=True, type=click.Path(exists=True), help="Signer certificate.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", default=None, help="Private key passphrase.")
+@click.option("--delay", default=0.05, show_default=True, help="Simulated remote signer round-trip in seconds.")
+@click.option("-n", "--count", default=20, show_default=True, help="Documents per case.")
+def remote(pdf_file, key, cert, chain, passphrase, delay, count):
+    """Compare per-document and batched two-phase signing."""
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            RemoteSignerServer(load_backend(key, cert, chain, passphrase), delay=delay) as server:
+        jobs = [
+            (pdf_file, os.path.join(tmp_dir, f"signed{i}.pdf"), build_signature_meta("Signature1"), None)
+            for i in range(count)
+        ]
+        for batch_size in (1, count):
+            batch_signer = DeferredBatchSigner(HTTPSignerBackend(server.url), batch_size=batch_size)
+            round_trips = server.round_trips
+            start = time.perf_counter()
+            results = batch_signer.sign_documents(jobs)
+            elapsed = time.perf_counter() - start
+            failed = sum(1 for r in results if r.error is not None)
+            click.echo(
+                f"batch size {batch_size:<4} {elapsed / count * 1000:8.2f} ms/doc, "
+                f"{server.round_trips - round_trips} round-trip(s), {failed} failed"
+            )
+
+
+@cli.command()
+@click.option("--kdf", "kdfs", multiple=True, type=click.Choice(KDFS), help="KDF to measure, default all.")
+@click.option("--cost", "costs", multiple=True, type=int,
+              help="Cost to measure, default the KDF's default with half and double of it.")
+@click.option("--passphrase-length", default=24, show_default=True,
+              help="Length of generated passphrases, for the brute-force estimate.")
+@click.option("--attacker-cores", default=10000, show_default=True,
+              help="Cores of the assumed attacker, for the brute-force estimate.")
+@click.option("-n", "--count", default=5, show_default=True, help="Unlocks per case.")
+def unlock(kdfs, costs, passphrase_length, attacker_cores, count):
+    """Cost of unlocking a key file per KDF and cost, against brute-force time."""
+
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    guesses = {
+        "4-digit PIN": 9000,
+        f"{passphrase_length}-char generated": len(PASSPHRASE_ALPHABET) ** passphrase_length,
+    }
+    unlocked_key_file = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for kdf in kdfs or KDFS:
+            default = DEFAULT_KDF_COST[kdf]
+            for cost in costs or (default // 2, default, default * 2):
+                key_file = os.path.join(tmp_dir, f"{kdf}-{cost}.key")
+                try:
+                    data = encrypt_private_key(private_key, "bench", kdf, cost)
+                except ValueError as e:
+                    click.echo(f"{kdf} cost {cost}: {e}")
+                    continue
+                with open(key_file, "wb") as f:
+                    f.write(data)
+                # a fresh cache per run measures the full KDF cost of every unlock
+                timings = time_runs(lambda i: UnlockedKeyCache().private_key_info(key_file, "bench"), count)
+                report(f"{kdf} cost {cost}", timings)
+                unlocked_key_file = key_file
+                per_guess = statistics.mean(timings)
+                for name, space in guesses.items():
+                    seconds = space * per_guess / 2 / attacker_cores
+                    click.echo(f"    {name}: {seconds / 86400 / 365:.3g} years on average, "
+                               f"{attacker_cores} cores" if seconds > 86400 * 365 else
+                               f"    {name}: {seconds:.3g} s on average, {attacker_cores} cores")
+        if unlocked_key_file:
+            cache = UnlockedKeyCache()
+            cache.private_key_info(unlocked_key_file, "bench")
+            report("cached unlock", time_runs(lambda i: cache.private_key_info(unlocked_key_file, "bench"), count))
+
+
+if __name__ == '__main__':
+    cli()
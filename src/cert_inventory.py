@@ -0,0 +1,286 @@
+"""@package docstring
+Inventory of certificate files with expiry and chain health, persisted in SQLite.
+
+Generated signer certificates are valid for a year, intermediates for
+five and roots for ten years, and signing with an expired certificate
+only fails when a document is signed. The inventory indexes every
+certificate file in the configured directories (the key directory,
+"cert_directories" of the profile config and the directories of profile
+certificates) and reports certificates whose chain expires soon, has
+expired or is broken: issuer missing, issuer not a CA or a signature
+that does not verify.
+
+Like the signature catalog, files are keyed by path, size and
+modification time, so a scan only parses files that changed since the
+last one and is cheap enough to run whenever a worker starts.
+Run `python cli.py certs scan`.
+"""
+import os
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+
+from asn1crypto import pem, x509 as asn1_x509
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+
+DEFAULT_INVENTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pdf-signer", "certificates.db")
+## Chains expiring within this many days are reported as expiring.
+DEFAULT_WARN_DAYS = 30
+## Extensions of scanned certificate files, PEM (also bundles) or DER.
+CERT_EXTENSIONS = (".pem", ".crt", ".cer", ".der")
+## Health states, most severe first.
+STATUSES = ("broken", "expired", "not-yet-valid", "expiring", "ok")
+
+ScanResult = namedtuple("ScanResult", ["paths", "parsed", "removed", "errors"])
+CertificateHealth = namedtuple("CertificateHealth", [
+    "fingerprint", "subject", "paths", "not_after", "chain_expires", "status", "problem",
+])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS certificates (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    subject_hash TEXT NOT NULL,
+    issuer_hash TEXT NOT NULL,
+    key_id TEXT,
+    authority_key_id TEXT,
+    not_before TEXT NOT NULL,
+    not_after TEXT NOT NULL,
+    is_ca INTEGER NOT NULL,
+    der BLOB NOT NULL,
+    PRIMARY KEY (path, idx)
+);
+CREATE INDEX IF NOT EXISTS certificates_fingerprint ON certificates(fingerprint);
+"""
+
+
+def read_certificates(cert_file):
+    """asn1crypto certificates of a PEM (one or more) or DER file."""
+
+    with open(cert_file, 'rb') as f:
+        data = f.read()
+    if pem.detect(data):
+        # other blocks, e.g. a key kept in the same .pem, are skipped
+        return [asn1_x509.Certificate.load(der) for type_name, _, der in pem.unarmor(data, multiple=True)
+                if type_name in ("CERTIFICATE", "X509 CERTIFICATE", "TRUSTED CERTIFICATE")]
+    cert = asn1_x509.Certificate.load(data)
+    cert.native  # parse fully, so garbage fails here and not in a report
+    return [cert]
+
+
+def _utc(moment):
+    return moment.replace(tzinfo=datetime.UTC) if moment.tzinfo is None else moment.astimezone(datetime.UTC)
+
+
+class CertificateInventory:
+    """SQLite index of the certificates in a set of directories."""
+
+    def __init__(self, path=DEFAULT_INVENTORY_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self.reads = 0
+
+    def _stored(self, cert_file, stat):
+        row = self._conn.execute(
+            "SELECT size, mtime_ns FROM files WHERE path = ?", (cert_file,)
+        ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def update(self, cert_file):
+        """Index cert_file unless its entry is current, return True if it was read."""
+
+        cert_file = os.path.abspath(cert_file)
+        stat = os.stat(cert_file)
+        with self._lock:
+            if self._stored(cert_file, stat):
+                return False
+        error = None
+        try:
+            certs = read_certificates(cert_file)
+        except Exception as e:
+            certs, error = [], str(e) or type(e).__name__
+        rows = []
+        for index, cert in enumerate(certs):
+            validity = cert['tbs_certificate']['validity']
+            rows.append((
+                cert_file, index, cert.sha256.hex(), cert.subject.human_friendly,
+                cert.subject.sha256.hex(), cert.issuer.sha256.hex(),
+                cert.key_identifier.hex() if cert.key_identifier else None,
+                cert.authority_key_identifier.hex() if cert.authority_key_identifier else None,
+                _utc(validity['not_before'].native).isoformat(), _utc(validity['not_after'].native).isoformat(),
+                int(bool(cert.ca)), cert.dump(),
+            ))
+        with self._lock, self._conn:
+            self.reads += 1
+            self._conn.execute("DELETE FROM files WHERE path = ?", (cert_file,))
+            self._conn.execute(
+                "INSERT INTO files (path, size, mtime_ns, error) VALUES (?, ?, ?, ?)",
+                (cert_file, stat.st_size, stat.st_mtime_ns, error)
+            )
+            self._conn.executemany(
+                "INSERT INTO certificates (path, idx, fingerprint, subject, subject_hash, issuer_hash, key_id, "
+                "authority_key_id, not_before, not_after, is_ca, der) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return True
+
+    def scan(self, directories, files=()):
+        """Index certificate files of directories and files.
+
+        Subdirectories are not descended into, a key directory may well
+        be the working directory. Entries of files that disappeared from
+        the scanned directories are removed. Returns a ScanResult.
+        """
+
+        found = {os.path.abspath(path) for path in files if os.path.isfile(path)}
+        scanned = set()
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            scanned.add(os.path.abspath(directory))
+            with os.scandir(directory) as entries:
+                found.update(os.path.abspath(entry.path) for entry in entries
+                             if entry.is_file() and os.path.splitext(entry.name)[1].lower() in CERT_EXTENSIONS)
+        parsed = sum(1 for path in sorted(found) if self.update(path))
+        with self._lock, self._conn:
+            stale = [path for (path,) in self._conn.execute("SELECT path FROM files")
+                     if path not in found and os.path.dirname(path) in scanned]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in stale])
+            errors = self._conn.execute(
+                "SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path"
+            ).fetchall()
+        return ScanResult(sorted(found), parsed, len(stale), [(path, error) for path, error in errors if path in found])
+
+    def fingerprints(self, cert_file):
+        """Fingerprints of the certificates indexed for cert_file."""
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint FROM certificates WHERE path = ? ORDER BY idx", (os.path.abspath(cert_file),)
+            ).fetchall()
+        return [fingerprint for (fingerprint,) in rows]
+
+    def health(self, now=None, warn_days=DEFAULT_WARN_DAYS, paths=None):
+        """CertificateHealth of indexed certificates, most severe first.
+
+        paths restricts the report, and the issuers considered, to those
+        files, e.g. the paths of the last ScanResult. A certificate's
+        chain expires with the first certificate on the path to its root;
+        the issuer is looked up by name and key identifier and its
+        signature checked.
+        """
+
+        now = _utc(now or datetime.datetime.now(datetime.UTC))
+        warn_until = now + datetime.timedelta(days=warn_days)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fingerprint, subject, subject_hash, issuer_hash, key_id, authority_key_id, "
+                "not_before, not_after, is_ca, der, path FROM certificates ORDER BY path, idx"
+            ).fetchall()
+        if paths is not None:
+            paths = {os.path.abspath(path) for path in paths}
+            rows = [row for row in rows if row[-1] in paths]
+        certs = {}
+        for fingerprint, subject, subject_hash, issuer_hash, key_id, aki, not_before, not_after, is_ca, der, path \
+                in rows:
+            cert = certs.setdefault(fingerprint, {
+                'fingerprint': fingerprint, 'subject': subject, 'subject_hash': subject_hash,
+                'issuer_hash': issuer_hash, 'key_id': key_id, 'aki': aki, 'is_ca': bool(is_ca), 'der': der,
+                'not_before': datetime.datetime.fromisoformat(not_before),
+                'not_after': datetime.datetime.fromisoformat(not_after), 'paths': [],
+            })
+            cert['paths'].append(path)
+        by_subject = {}
+        for cert in certs.values():
+            by_subject.setdefault(cert['subject_hash'], []).append(cert)
+
+        parsed = {}
+        verified = {}
+
+        def loaded(cert):
+            if cert['fingerprint'] not in parsed:
+                parsed[cert['fingerprint']] = x509.load_der_x509_certificate(cert['der'])
+            return parsed[cert['fingerprint']]
+
+        def issued_by(cert, issuer):
+            key = (cert['fingerprint'], issuer['fingerprint'])
+            if key not in verified:
+                try:
+                    loaded(cert).verify_directly_issued_by(loaded(issuer))
+                    verified[key] = True
+                except (ValueError, TypeError, InvalidSignature):
+                    verified[key] = False
+            return verified[key]
+
+        def find_issuer(cert):
+            # a certificate whose issuer has the same name cannot be its own issuer unless self-signed
+            candidates = [issuer for issuer in by_subject.get(cert['issuer_hash'], ())
+                          if issuer is not cert
+                          and (not cert['aki'] or not issuer['key_id'] or cert['aki'] == issuer['key_id'])]
+            # prefer a currently valid issuer, e.g. after a CA was renewed
+            candidates.sort(key=lambda issuer: issuer['not_after'], reverse=True)
+            for issuer in candidates:
+                if issued_by(cert, issuer):
+                    return issuer, None
+            if candidates:
+                return None, "signature does not verify with issuer " + candidates[0]['subject']
+            return None, "issuer not found"
+
+        def chain(cert):
+            path, problem = [cert], None
+            while True:
+                current = path[-1]
+                if current['subject_hash'] == current['issuer_hash'] and issued_by(current, current):
+                    return path, problem
+                issuer, problem = find_issuer(current)
+                if issuer is None:
+                    return path, problem
+                if not issuer['is_ca']:
+                    return path, f"issuer {issuer['subject']} is not a CA"
+                if issuer in path:
+                    return path, "issuer loop"
+                path.append(issuer)
+
+        report = []
+        for cert in certs.values():
+            path, problem = chain(cert)
+            chain_expires = min(link['not_after'] for link in path)
+            if problem:
+                status = "broken"
+            elif chain_expires <= now:
+                status = "expired"
+            elif any(link['not_before'] > now for link in path):
+                status = "not-yet-valid"
+            elif chain_expires <= warn_until:
+                status = "expiring"
+            else:
+                status = "ok"
+            if not problem and chain_expires < cert['not_after']:
+                expiring_link = min(path, key=lambda link: link['not_after'])
+                problem = f"chain expires with {expiring_link['subject']}"
+            report.append(CertificateHealth(
+                cert['fingerprint'], cert['subject'], cert['paths'], cert['not_after'], chain_expires, status, problem
+            ))
+        report.sort(key=lambda health: (STATUSES.index(health.status), health.chain_expires))
+        return report
+
+    def close(self):
+        """Close database connection."""
+
+        self._conn.close()
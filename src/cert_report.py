@@ -0,0 +1,169 @@
+"""@package docstring
+Certificate detail reports shown for verified signatures.
+
+Extracting AIA, key identifiers, basic constraints and policies means
+parsing several extensions. In bulk verification the same signer
+certificate appears in thousands of documents, so reports are built once
+per certificate fingerprint and their text is rendered only on demand.
+"""
+import threading
+import functools
+from collections import OrderedDict, namedtuple
+
+## Maximum number of certificate reports kept in memory.
+REPORT_CACHE_SIZE = 256
+
+ReportCacheInfo = namedtuple("ReportCacheInfo", ["hits", "misses", "currsize", "maxsize"])
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def format_hex(byte_string):
+    """Format bytes as colon separated hex."""
+
+    if byte_string is None:
+        return "Not Present"
+    if isinstance(byte_string, bytes):
+        return byte_string.hex(':')
+    return str(byte_string)
+
+
+class CertificateReport:
+    """Structured details of one certificate, extracted once."""
+
+    def __init__(self, cert):
+        self.fingerprint = cert.sha256.hex()
+        self.subject = cert.subject.human_friendly
+        self.issuer = cert.issuer.human_friendly
+        self.serial_number = cert.serial_number
+
+        aia = cert.authority_information_access_value
+        self.aia = None if not aia else [
+            (access_description['access_method'].native,
+             access_description['access_location'].name,
+             access_description['access_location'].native)
+            for access_description in aia
+        ]
+
+        self.ski = cert.key_identifier
+
+        akid = cert.authority_key_identifier_value
+        self.aki = None
+        if akid:
+            native_akid = akid.native
+            issuers = None
+            if native_akid.get('authority_cert_issuer'):
+                issuers = [
+                    "Directory Name (details omitted for brevity, see below)" if 'directory_name' in gn_dict
+                    else f"{gn_dict.get('type', 'Unknown')}: {gn_dict.get('value', 'N/A')}"
+                    for gn_dict in native_akid['authority_cert_issuer']
+                ]
+            self.aki = {
+                'key_identifier': native_akid.get('key_identifier'),
+                'issuers': issuers,
+                'issuer_serial': cert.authority_issuer_serial,
+                'serial': native_akid.get('authority_cert_serial_number'),
+            }
+
+        self.is_ca = cert.ca
+        basic_constraints = cert.basic_constraints_value
+        self.basic_constraints = None if not basic_constraints else basic_constraints.native
+
+        policies = cert.certificate_policies_value
+        self.policies = None if not policies else [
+            (policy_info.get('policy_identifier', 'Unknown OID'), len(policy_info.get('policy_qualifiers') or ()))
+            for policy_info in policies.native or ()
+        ]
+
+    @functools.cached_property
+    def lines(self):
+        """Rendered report lines, built on first access."""
+
+        lines = [f"Subject: {self.subject}", f"Issuer: {self.issuer}", f"Serial Number: {self.serial_number}"]
+
+        if self.aia:
+            lines.append("Authority Information Access (AIA):")
+            for method, location_type, location in self.aia:
+                lines.append(f"  - Method: {method}")
+                lines.append(f"    Location ({location_type}): {location}")
+        else:
+            lines.append("Authority Information Access (AIA): Not Present")
+
+        lines.append(f"Subject Key Identifier (SKI): {format_hex(self.ski)}")
+
+        if self.aki:
+            lines.append("Authority Key Identifier (AKI):")
+            lines.append(f"  Key Identifier: {format_hex(self.aki['key_identifier'])}")
+            issuers = self.aki['issuers']
+            lines.append(f"  Authority Cert Issuer: {'; '.join(issuers) if issuers else 'Not Present'}")
+            lines.append(f"  Authority Cert Issuer & Serial (from cert direct attr): "
+                         f"{self.aki['issuer_serial'] or 'Not Present'}")
+            serial = self.aki['serial']
+            lines.append(f"  Authority Cert Serial Number: {serial if serial is not None else 'Not Present'}")
+        else:
+            lines.append("Authority Key Identifier (AKI): Not Present")
+
+        lines.append("Basic Constraints:")
+        lines.append(f"  Is CA (direct attribute): {self.is_ca}")
+        if self.basic_constraints:
+            path_len = self.basic_constraints.get('path_len_constraint')
+            lines.append(f"  Is CA (from extension): {self.basic_constraints.get('ca', False)}")
+            lines.append(f"  Path Length Constraint: {path_len if path_len is not None else 'Not Specified'}")
+        else:
+            lines.append("  (Extension not present or could not be parsed)")
+
+        if self.policies is None:
+            lines.append("Certificate Policies: Not Present (extension not present)")
+        elif not self.policies:
+            lines.append("Certificate Policies:")
+            lines.append("  No policies defined in extension.")
+        else:
+            lines.append("Certificate Policies:")
+            for oid, qualifiers in self.policies:
+                qualifiers_text = f" (has {qualifiers} qualifier(s))" if qualifiers else ""
+                lines.append(f"  - Policy OID: {oid}{qualifiers_text}")
+        return lines
+
+    def render(self, indent=""):
+        """Report as text."""
+
+        return "\n".join(indent + line for line in self.lines)
+
+
+def get_certificate_report(cert):
+    """Return cached report of cert, keyed by its SHA-256 fingerprint."""
+
+    global _hits, _misses
+    fingerprint = cert.sha256
+    with _reports_lock:
+        report = _reports.get(fingerprint)
+        if report is not None:
+            _reports.move_to_end(fingerprint)
+            _hits += 1
+            return report
+    report = CertificateReport(cert)
+    with _reports_lock:
+        _misses += 1
+        _reports[fingerprint] = report
+        while len(_reports) > REPORT_CACHE_SIZE:
+            _reports.popitem(last=False)
+    return report
+
+
+def clear_report_cache():
+    """Drop all cached certificate reports."""
+
+    global _hits, _misses
+    with _reports_lock:
+        _reports.clear()
+        _hits = _misses = 0
+
+
+def report_cache_info():
+    """Return hit/miss statistics of the report cache."""
+
+    with _reports_lock:
+        return ReportCacheInfo(_hits, _misses, len(_reports), REPORT_CACHE_SIZE)
@@ -0,0 +1,1096 @@
+"""@package docstring
+Command line interface for headless batch signing.
+
+Run e.g. `python cli.py sign --key signer.key --cert signer.pem *.pdf`.
+"""
+import os
+import sys
+import pstats
+import cProfile
+import threading
+import contextlib
+
+import click
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_der_private_key
+from cryptography.x509 import load_der_x509_certificate
+from pyhanko.keys import load_cert_from_pemder
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.validation import KeyUsageConstraints
+
+from signing import (DEFAULT_FIELD_BOX, parse_field_box, build_signature_meta,
+                     signed_output_path, sign_document)
+from appearance import ImageStampStyle
+from timestamping import DEFAULT_TSA_URL, get_timestamper
+from deferred_signing import DeferredBatchSigner, HTTPSignerBackend, field_spec_for
+from revocation import REVOCATION_MODES, build_validation_context
+from metrics import (REGISTRY, KEY_LOAD_SECONDS, DOCUMENTS_VERIFIED, VERIFY_SECONDS, BYTES_PROCESSED,
+                     MetricsServer, record_failure)
+from tracing import TRACE_FORMATS, enable_tracing, write_trace, span
+from signature_index import DEFAULT_CATALOG_PATH, SignatureCatalog
+from modification_analysis import ANALYSIS_LEVELS, CachingDiffPolicy, validate_signature, signature_verdict
+from job_queue import (DEFAULT_VISIBILITY_TIMEOUT, DEFAULT_MAX_ATTEMPTS, SQLiteJobBroker, default_worker_id,
+                       run_worker)
+from profiles import DEFAULT_CONFIG_PATH, ProfileError, get_config
+from key_storage import (KDFS, DEFAULT_KDF, DEFAULT_KDF_COST, generate_passphrase, is_pkcs12, load_signer,
+                         write_pkcs12, write_private_key)
+from field_provisioning import FieldLayout, LayoutError, provision_document, provisioned_output_path
+from cert_inventory import DEFAULT_INVENTORY_PATH, DEFAULT_WARN_DAYS, CertificateInventory
+from verification_report import JsonlWriter, signature_record, unsigned_record, document_error_record
+from archive_batch import archive_output_path, is_archive, sign_archive, verify_archive, write_manifest
+from pdf_encryption import PdfCredentials, load_password_file
+from multi_signing import SignerStep, prefetch_signer_revocation_info, sign_successively
+from scheduler import (DEFAULT_MEMORY_BUDGET, DEFAULT_LARGE_FILE_SIZE, WORKER_TYPES, PROCESSES_AVAILABLE,
+                       SizeAwareScheduler, format_report)
+from ltv import PADES_LEVELS, TIMESTAMPED_LEVELS, LTV_LEVELS, LTVBatch, build_ltv_context, split_trust_roots
+
+
+def scheduler_options(command):
+    """Options of commands processing files through SizeAwareScheduler."""
+
+    options = [
+        click.option("-j", "--jobs", default=1, show_default=True, help="Documents processed concurrently."),
+        click.option("--memory-budget", default=DEFAULT_MEMORY_BUDGET // 1024 ** 2, show_default=True,
+                     help="Estimated memory of documents in flight, in MiB."),
+        click.option("--large-file-size", default=DEFAULT_LARGE_FILE_SIZE // 1024 ** 2, show_default=True,
+                     help="Documents from this size on, in MiB, run with --large-jobs parallelism."),
+        click.option("--large-jobs", default=1, show_default=True, help="Large documents processed concurrently."),
+        click.option("--workers", "worker_type", default="auto", show_default=True, type=click.Choice(WORKER_TYPES),
+                     help="Run --jobs in worker processes, using every CPU core, or in threads that share one; "
+                          "auto picks processes on Linux unless the work needs threads."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def build_scheduler(jobs, memory_budget, large_file_size, large_jobs, worker_type, needs_threads=None):
+    """SizeAwareScheduler from scheduler_options values.
+
+    needs_threads names what keeps the work out of worker processes, if anything.
+    """
+
+    if worker_type == "processes":
+        if not PROCESSES_AVAILABLE:
+            raise click.UsageError("--workers processes is only available on Linux.")
+        if needs_threads:
+            raise click.UsageError(f"--workers processes cannot be used with {needs_threads}.")
+    return SizeAwareScheduler(
+        max_workers=jobs,
+        memory_budget=memory_budget * 1024 ** 2,
+        large_file_size=large_file_size * 1024 ** 2,
+        large_workers=large_jobs,
+        processes=worker_type == "processes" or (worker_type == "auto" and not needs_threads)
+    )
+
+
+def pdf_password_options(command):
+    """Options supplying passwords of encrypted PDF documents."""
+
+    options = [
+        click.option("--pdf-password", "pdf_passwords", multiple=True, envvar="PDF_SIGNER_PDF_PASSWORD",
+                     help="User or owner password of encrypted PDF files, tried in order."),
+        click.option("--pdf-password-file", default=None, type=click.Path(exists=True, dir_okay=False),
+                     help="JSON file mapping file name patterns to PDF passwords."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def build_credentials(pdf_passwords, pdf_password_file, extra_password_files=()):
+    """PdfCredentials of a batch from pdf_password_options values.
+
+    Patterns of extra_password_files (e.g. of signer profiles) apply
+    where pdf_password_file has none.
+    """
+
+    per_file = {}
+    for path in (pdf_password_file,) + tuple(extra_password_files):
+        if not path:
+            continue
+        try:
+            for pattern, password in load_password_file(path).items():
+                per_file.setdefault(pattern, password)
+        except (OSError, ValueError) as e:
+            raise click.BadParameter(str(e), param_hint="--pdf-password-file")
+    return PdfCredentials(pdf_passwords, per_file)
+
+
+def _load_signing_profile(ctx, param, name):
+    if not name:
+        return None
+    config = get_config(ctx.find_root().params.get('config_path'))
+    try:
+        profile = config.profile(name)
+    except ProfileError as e:
+        raise click.BadParameter(str(e), ctx=ctx, param=param)
+    # options not given on the command line default to the profile
+    settings = {
+        'key': profile.key, 'cert': profile.cert, 'chain': profile.chain, 'pkcs11_module': profile.pkcs11_module,
+        'pkcs11_token': profile.pkcs11_token, 'pkcs11_key_label': profile.pkcs11_key_label,
+        'pkcs11_cert_label': profile.pkcs11_cert_label, 'field_name': profile.field_name,
+        'create_field': profile.create_field, 'box': ", ".join(str(c) for c in profile.field_box),
+        'page': profile.field_page, 'location': profile.location, 'contact_info': profile.contact_info,
+        'image': profile.image, 'timestamp': profile.timestamp, 'tsa_url': profile.tsa_url,
+        'pades_level': profile.pades_level, 'pdf_password_file': profile.pdf_password_file,
+    }
+    ctx.default_map = dict(ctx.default_map or {}, **{key: value for key, value in settings.items() if value is not None})
+    return profile
+
+
+def signing_profile_option(command):
+    """--signing-profile option, applied before all other options."""
+
+    return click.option(
+        "--signing-profile", "profile", default=None, envvar="PDF_SIGNER_PROFILE", is_eager=True,
+        callback=_load_signing_profile, expose_value=True,
+        help="Named signing profile of the config file, explicit options override it."
+    )(command)
+
+
+def output_path_for(pdf_file, output_dir):
+    """Output path of pdf_file, optionally placed in output_dir."""
+
+    output_file = signed_output_path(pdf_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        output_file = os.path.join(output_dir, os.path.basename(output_file))
+    return output_file
+
+
+@click.group()
+@click.option("--config", "config_path", default=None, envvar="PDF_SIGNER_CONFIG",
+              type=click.Path(dir_okay=False), help=f"Signing profile config, default {DEFAULT_CONFIG_PATH}.")
+@click.option("--metrics-file", default=None, type=click.Path(dir_okay=False),
+              help="Write Prometheus textfile metrics on exit.")
+@click.option("--metrics-port", default=None, type=int, help="Serve /metrics on this local port while running.")
+@click.option("--trace", "trace_file", default=None, type=click.Path(dir_okay=False),
+              help="Record phase spans and write them to this JSON file on exit.")
+@click.option("--trace-format", default="chrome", show_default=True, type=click.Choice(TRACE_FORMATS),
+              help="Chrome trace or OpenTelemetry OTLP/JSON.")
+@click.option("--profile", "profile_file", default=None, type=click.Path(dir_okay=False),
+              help="Run under cProfile, write stats to this file and print the top entries. "
+                   "Profiles the main thread only, use with -j 1.")
+@click.pass_context
+def cli(ctx, config_path, metrics_file, metrics_port, trace_file, trace_format, profile_file):
+    """PDF signing tool."""
+
+    if trace_file:
+        enable_tracing()
+        ctx.call_on_close(lambda: write_trace(trace_file, trace_format))
+    if profile_file:
+        profiler = cProfile.Profile()
+
+        def dump_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+        ctx.call_on_close(dump_profile)
+        profiler.enable()
+
+    if metrics_port is not None:
+        server = MetricsServer(port=metrics_port).start()
+        ctx.call_on_close(server.stop)
+    if metrics_file:
+        ctx.call_on_close(lambda: REGISTRY.write_textfile(metrics_file))
+
+
+@cli.command()
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@signing_profile_option
+@click.option("--key", type=click.Path(exists=True), help="Signer private key or PKCS#12 bundle.")
+@click.option("--cert", type=click.Path(exists=True), help="Signer certificate, default from a PKCS#12 --key.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", envvar="PDF_SIGNER_PASSPHRASE", default=None, help="Private key passphrase.")
+@click.option("--pkcs11-module", default=None, type=click.Path(exists=True),
+              help="PKCS#11 module, e.g. /usr/lib/softhsm/libsofthsm2.so.")
+@click.option("--pkcs11-token", default=None, help="PKCS#11 token label.")
+@click.option("--pkcs11-key-label", default=None, help="Label of the private key on the token.")
+@click.option("--pkcs11-cert-label", default=None, help="Label of the certificate on the token.")
+@click.option("--pkcs11-pin", envvar="PDF_SIGNER_PKCS11_PIN", default=None, help="PKCS#11 user PIN.")
+@click.option("--remote-signer", default=None, help="URL of external signer, enables two-phase signing.")
+@click.option("--batch-size", default=64, show_default=True, help="Digests per external signer round-trip.")
+@scheduler_options
+@click.option("--output-dir", default=None, type=click.Path(file_okay=False), help="Directory of signed files.")
+@click.option("--field", "field_name", default="Signature1", show_default=True, help="Signature field name.")
+@click.option("--create-field", is_flag=True, help="Create signature field if it does not exist.")
+@click.option("--box", default=", ".join(str(c) for c in DEFAULT_FIELD_BOX), show_default=True,
+              help="Box of created field: x1, y1, x2, y2.")
+@click.option("--page", default=0, show_default=True, help="Page of created field.")
+@click.option("--image", default=None, type=click.Path(exists=True), help="Signature image.")
+@click.option("--location", default=None, help="Signing location.")
+@click.option("--contact-info", default=None, help="Signer contact info.")
+@click.option("--timestamp", is_flag=True, help="Add RFC 3161 signature timestamp.")
+@click.option("--tsa-url", default=DEFAULT_TSA_URL, show_default=True, help="Timestamp server URL.")
+@click.option("--pades-level", default="B-B", show_default=True, type=click.Choice(PADES_LEVELS),
+              help="PAdES baseline level, B-T and above imply --timestamp.")
+@click.option("--trust-root", multiple=True, type=click.Path(exists=True),
+              help="Extra trust root for B-LT/B-LTA validation info, e.g. of the TSA. "
+                   "Self-signed --chain certificates are trusted too.")
+@click.option("--revocation-mode", default="hard-fail", show_default=True,
+              type=click.Choice(REVOCATION_MODES[1:]), help="Revocation check of B-LT/B-LTA validation info.")
+@pdf_password_options
+@click.pass_context
+def sign(ctx, pdf_files, profile, key, cert, chain, passphrase, pkcs11_module, pkcs11_token, pkcs11_key_label,
+         pkcs11_cert_label, pkcs11_pin, remote_signer, batch_size, jobs, output_dir, field_name,
+         create_field, box, page, image, location, contact_info, timestamp, tsa_url, pades_level,
+         trust_root, revocation_mode, pdf_passwords, pdf_password_file, memory_budget, large_file_size, large_jobs,
+         worker_type):
+    """Sign one or more PDF files.
+
+    Local signing starts the largest files first and keeps the estimated
+    memory of files in flight within --memory-budget.
+    """
+
+    field_box = parse_field_box(box)
+    timestamp = timestamp or pades_level in TIMESTAMPED_LEVELS
+    timestamper = get_timestamper(tsa_url) if timestamp else None
+    # document keys are cached for the whole batch
+    credentials = build_credentials(pdf_passwords, pdf_password_file)
+    failures = 0
+
+    if pades_level in LTV_LEVELS:
+        chain_certs = [load_cert_from_pemder(path) for path in chain]
+        if key and is_pkcs12(key):
+            try:
+                bundle_signer = load_signer(key, cert, chain, passphrase)
+            except ValueError as e:
+                raise click.UsageError(str(e))
+            chain_certs = list(bundle_signer.cert_registry)
+        trust_roots, other_certs = split_trust_roots(chain_certs)
+        trust_roots += [load_cert_from_pemder(path) for path in trust_root]
+        if not trust_roots:
+            raise click.UsageError(f"PAdES {pades_level} requires --trust-root or a root certificate in --chain.")
+        context_state = threading.local()
+
+        def validation_context():
+            # validation contexts are not thread-safe, revocation data is shared through the cache
+            if not hasattr(context_state, 'context'):
+                context_state.context = build_ltv_context(trust_roots, other_certs, revocation_mode)
+            return context_state.context
+    else:
+        def validation_context():
+            return None
+
+    def signature_meta():
+        return build_signature_meta(field_name, location, contact_info, pades_level, validation_context())
+
+    if remote_signer:
+        archives = [pdf_file for pdf_file in pdf_files if is_archive(pdf_file)]
+        if archives:
+            raise click.UsageError(f"--remote-signer signs PDF files only, not archives: {', '.join(archives)}")
+        batch_signer = DeferredBatchSigner(
+            HTTPSignerBackend(remote_signer), batch_size=batch_size, timestamper=timestamper,
+            credentials=credentials
+        )
+        batch_jobs = [
+            (pdf_file, output_path_for(pdf_file, output_dir),
+             signature_meta(),
+             field_spec_for(field_name, create_field, field_box, page))
+            for pdf_file in pdf_files
+        ]
+        for result in batch_signer.sign_documents(batch_jobs, log=click.echo):
+            if result.error is None:
+                click.echo(f"Signed {result.pdf_file} -> {result.output_file}")
+            else:
+                failures += 1
+                click.echo(f"Error signing {result.pdf_file}: {result.error}", err=True)
+        sys.exit(1 if failures else 0)
+
+    if pkcs11_module:
+        from pkcs11_backend import get_session_pool
+        with KEY_LOAD_SECONDS.time(backend="pkcs11"), span("load_key", backend="pkcs11"):
+            pool = get_session_pool(
+                pkcs11_module,
+                token_label=pkcs11_token,
+                user_pin=pkcs11_pin,
+                key_label=pkcs11_key_label,
+                cert_label=pkcs11_cert_label,
+                cert_file=cert,
+                ca_chain_files=chain,
+                size=jobs
+            )
+        borrow_signer = pool.signer
+    elif profile and profile.key and (key, cert) == (profile.key, profile.cert) and \
+            tuple(chain) == profile.chain:
+        config = get_config(ctx.find_root().params.get('config_path'))
+
+        def borrow_signer():
+            # a signer per document, the key is unlocked once through the key cache
+            return contextlib.nullcontext(config.signer(profile.name, passphrase))
+    elif key and (cert or is_pkcs12(key)):
+        # asn1crypto objects parse lazily and are not thread-safe, and signers
+        # should not outlive the key cache, so every document gets its own signer
+        def borrow_signer():
+            with KEY_LOAD_SECONDS.time(backend="file"), span("load_key", backend="file"):
+                return contextlib.nullcontext(load_signer(key, cert, chain, passphrase))
+    else:
+        raise click.UsageError("One of --key/--cert, a PKCS#12 --key, --pkcs11-module or --remote-signer is required.")
+
+    if profile and image and image == profile.image:
+        stamp_style = get_config(ctx.find_root().params.get('config_path')).stamp_style(profile.name)
+    else:
+        stamp_style = ImageStampStyle(image_path=image, border_width=0) if image else None
+
+    def sign_one(pdf_file):
+        if is_archive(pdf_file):
+            return sign_archive_one(pdf_file)
+        output_file = output_path_for(pdf_file, output_dir)
+        try:
+            with borrow_signer() as cms_signer:
+                sign_document(
+                    pdf_file, output_file, cms_signer,
+                    signature_meta(),
+                    create_field=create_field,
+                    field_box=field_box,
+                    field_page=page,
+                    stamp_style=stamp_style,
+                    timestamper=timestamper,
+                    credentials=credentials
+                )
+            click.echo(f"Signed {pdf_file} -> {output_file}")
+            return True
+        except Exception as e:
+            click.echo(f"Error signing {pdf_file}: {e}", err=True)
+            return False
+
+    def sign_archive_one(archive_file):
+        output_file = archive_output_path(archive_file, output_dir)
+        try:
+            with borrow_signer() as cms_signer:
+                def sign_stream(doc, output):
+                    sign_document(
+                        doc, output, cms_signer,
+                        signature_meta(),
+                        create_field=create_field,
+                        field_box=field_box,
+                        field_page=page,
+                        stamp_style=stamp_style,
+                        timestamper=timestamper,
+                        credentials=credentials
+                    )
+                results = sign_archive(archive_file, output_file, sign_stream,
+                                       log=lambda message: click.echo(f"{archive_file}: {message}", err=True))
+        except Exception as e:
+            click.echo(f"Error signing {archive_file}: {e}", err=True)
+            return False
+        signed = sum(1 for result in results if result.action == "signed")
+        failed = sum(1 for result in results if result.action == "failed")
+        click.echo(f"Signed {signed} PDF member(s) of {archive_file} -> {output_file}"
+                   + (f", {failed} failed and copied unchanged" if failed else ""))
+        return not failed
+
+    # token sessions and the per-host TSA limit cannot be shared with forked workers
+    needs_threads = "--pkcs11-module" if pkcs11_module else "timestamps" if timestamp else None
+    scheduler = build_scheduler(jobs, memory_budget, large_file_size, large_jobs, worker_type, needs_threads)
+    if scheduler.processes and key:
+        # unlock once here, forked workers inherit the key cache instead of each running the KDF
+        try:
+            load_signer(key, cert, chain, passphrase)
+        except ValueError:
+            # reported with every document
+            pass
+    results, report = scheduler.run(sign_one, pdf_files, queue="sign")
+    click.echo(format_report(report), err=True)
+    sys.exit(0 if all(ok is True for ok in results) else 1)
+
+
+@cli.command("provision-fields")
+@click.argument("layout_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--output-dir", default=None, type=click.Path(file_okay=False),
+              help="Directory of provisioned files, default *_fields.pdf next to the input.")
+@pdf_password_options
+@scheduler_options
+def provision_fields(layout_file, pdf_files, output_dir, pdf_passwords, pdf_password_file, jobs, memory_budget,
+                     large_file_size, large_jobs, worker_type):
+    """Add the empty signature fields of a JSON layout to PDF files.
+
+    The layout is {"fields": [{"name": ..., "page": ..., "box": [x1, y1, x2, y2]}, ...]},
+    negative pages count from the last page. Existing fields are kept.
+    """
+
+    try:
+        layout = FieldLayout.load(layout_file)
+    except LayoutError as e:
+        raise click.BadParameter(str(e), param_hint="LAYOUT_FILE")
+    credentials = build_credentials(pdf_passwords, pdf_password_file)
+
+    def provision_one(pdf_file):
+        output_file = provisioned_output_path(pdf_file, output_dir)
+        try:
+            result = provision_document(pdf_file, output_file, layout, credentials=credentials)
+        except Exception as e:
+            click.echo(f"Error provisioning {pdf_file}: {e}", err=True)
+            return False
+        click.echo(f"Provisioned {pdf_file} -> {output_file}: {len(result.added)} added, "
+                   f"{len(result.existing)} existing")
+        return True
+
+    scheduler = build_scheduler(jobs, memory_budget, large_file_size, large_jobs, worker_type)
+    results, report = scheduler.run(provision_one, pdf_files, queue="provision")
+    click.echo(format_report(report), err=True)
+    sys.exit(0 if all(ok is True for ok in results) else 1)
+
+
+@cli.command("multi-sign")
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--signer", "signer_specs", multiple=True, required=True, metavar="PROFILE[:FIELD]",
+              help="Signing profile and optionally its field, in signing order; repeat for every signer.")
+@click.option("--passphrase", "passphrases", multiple=True,
+              help="Key passphrase, one for all signers or one per --signer in order.")
+@click.option("--trust-root", multiple=True, type=click.Path(exists=True),
+              help="Extra trust root for B-LT/B-LTA validation info.")
+@click.option("--revocation-mode", default="hard-fail", show_default=True,
+              type=click.Choice(REVOCATION_MODES[1:]), help="Revocation check of B-LT/B-LTA validation info.")
+@click.option("--output-dir", default=None, type=click.Path(file_okay=False), help="Directory of signed files.")
+@pdf_password_options
+@scheduler_options
+@click.pass_context
+def multi_sign(ctx, pdf_files, signer_specs, passphrases, trust_root, revocation_mode, output_dir, pdf_passwords,
+               pdf_password_file, jobs, memory_budget, large_file_size, large_jobs, worker_type):
+    """Sign PDF files with several signers in one pass.
+
+    Every --signer adds one incremental revision, e.g. --signer author:Author
+    --signer reviewer:Reviewer --signer approver:Approver. The field
+    defaults to the profile's field.
+    """
+
+    config = get_config(ctx.find_root().params.get('config_path'))
+    if len(passphrases) not in (0, 1, len(signer_specs)):
+        raise click.UsageError("Give one --passphrase for all signers or one per --signer.")
+    signer_profiles = []
+    for number, spec in enumerate(signer_specs):
+        name, _, field_name = spec.partition(":")
+        try:
+            profile = config.profile(name)
+        except ProfileError as e:
+            raise click.BadParameter(str(e), param_hint="--signer")
+        if not profile.key:
+            raise click.BadParameter(f"Profile {name} has no key file.", param_hint="--signer")
+        passphrase = passphrases[number] if len(passphrases) > 1 else (passphrases or (None,))[0]
+        signer_profiles.append((profile, field_name or profile.field_name, passphrase))
+    fields_used = [field_name for _, field_name, _ in signer_profiles]
+    if len(set(fields_used)) != len(fields_used):
+        raise click.UsageError("Every signer needs its own signature field.")
+
+    credentials = build_credentials(pdf_passwords, pdf_password_file,
+                                    [profile.pdf_password_file for profile, _, _ in signer_profiles])
+    extra_roots = [load_cert_from_pemder(path) for path in trust_root]
+    thread_state = threading.local()
+
+    def validation_context(profile):
+        # one context per thread and profile, revocation data is shared through the cache
+        contexts = thread_state.__dict__.setdefault('contexts', {})
+        if profile.name not in contexts:
+            trust_roots, other_certs = split_trust_roots(config.chain(profile.name))
+            if not trust_roots + extra_roots:
+                raise click.UsageError(f"PAdES {profile.pades_level} of profile {profile.name} requires "
+                                       f"--trust-root or a root certificate in its chain.")
+            contexts[profile.name] = build_ltv_context(trust_roots + extra_roots, other_certs, revocation_mode)
+        return contexts[profile.name]
+
+    def signer_steps():
+        steps = []
+        for profile, field_name, passphrase in signer_profiles:
+            timestamp = profile.timestamp or profile.pades_level in TIMESTAMPED_LEVELS
+            steps.append(SignerStep(
+                config.signer(profile.name, passphrase),
+                build_signature_meta(
+                    field_name, profile.location, profile.contact_info, profile.pades_level,
+                    validation_context(profile) if profile.pades_level in LTV_LEVELS else None
+                ),
+                create_field=profile.create_field,
+                field_box=profile.field_box,
+                field_page=profile.field_page,
+                stamp_style=config.stamp_style(profile.name),
+                timestamper=get_timestamper(profile.tsa_url) if timestamp else None
+            ))
+        return steps
+
+    try:
+        # load every key before the first document, so a wrong passphrase fails fast
+        prefetch_signer_revocation_info(signer_steps())
+    except (ProfileError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    def sign_one(pdf_file):
+        output_file = output_path_for(pdf_file, output_dir)
+        try:
+            sign_successively(pdf_file, output_file, signer_steps(), prefetch=False, credentials=credentials)
+        except Exception as e:
+            click.echo(f"Error signing {pdf_file}: {e}", err=True)
+            return False
+        click.echo(f"Signed {pdf_file} by {len(signer_profiles)} signers -> {output_file}")
+        return True
+
+    timestamps = any(profile.timestamp or profile.pades_level in TIMESTAMPED_LEVELS
+                     for profile, _, _ in signer_profiles)
+    scheduler = build_scheduler(jobs, memory_budget, large_file_size, large_jobs, worker_type,
+                                "timestamps" if timestamps else None)
+    results, report = scheduler.run(sign_one, pdf_files, queue="sign")
+    click.echo(format_report(report), err=True)
+    sys.exit(0 if all(ok is True for ok in results) else 1)
+
+
+@cli.command("add-ltv")
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--trust-root", multiple=True, required=True, type=click.Path(exists=True), help="Trust root.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="Intermediate CA certificate.")
+@click.option("--revocation-mode", default="hard-fail", show_default=True, type=click.Choice(REVOCATION_MODES[1:]))
+@click.option("--timestamp", is_flag=True, help="Add archive timestamp (PAdES-B-LTA).")
+@click.option("--tsa-url", default=DEFAULT_TSA_URL, show_default=True, help="Timestamp server URL.")
+@click.option("--in-place", is_flag=True, help="Overwrite input files.")
+@click.option("--output-dir", default=None, type=click.Path(file_okay=False), help="Directory of output files.")
+def add_ltv(pdf_files, trust_root, chain, revocation_mode, timestamp, tsa_url, in_place, output_dir):
+    """Add long-term validation info to signed PDF files."""
+
+    batch = LTVBatch(
+        [load_cert_from_pemder(path) for path in trust_root],
+        [load_cert_from_pemder(path) for path in chain],
+        revocation_mode=revocation_mode,
+        timestamper=get_timestamper(tsa_url) if timestamp else None
+    )
+    jobs = []
+    for pdf_file in pdf_files:
+        if in_place:
+            output_file = pdf_file
+        else:
+            root, ext = os.path.splitext(pdf_file)
+            output_file = f"{root}_ltv{ext or '.pdf'}"
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                output_file = os.path.join(output_dir, os.path.basename(output_file))
+        jobs.append((pdf_file, output_file))
+
+    failures = 0
+    for result in batch.add_ltv(jobs, log=lambda message: click.echo(message, err=True)):
+        if result.error is None:
+            click.echo(f"Added LTV for {result.signatures} signature(s): {result.pdf_file} -> {result.output_file}")
+        else:
+            failures += 1
+    sys.exit(1 if failures else 0)
+
+
+@cli.command()
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--trust-root", multiple=True, required=True, type=click.Path(exists=True), help="Trust root.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="Intermediate CA certificate.")
+@click.option("--revocation-mode", default="soft-fail", show_default=True, type=click.Choice(REVOCATION_MODES))
+@click.option("--analysis-level", default="always", show_default=True, type=click.Choice(ANALYSIS_LEVELS),
+              help="Difference analysis of revisions added after signing; with off, signatures not "
+                   "covering the whole file are reported UNCHECKED.")
+@click.option("--manifest-dir", default=None, type=click.Path(file_okay=False),
+              help="Write a JSON manifest of every ZIP/TAR archive to this directory.")
+@click.option("--jsonl", default=None, type=click.Path(dir_okay=False, allow_dash=True),
+              help="Stream one JSON object per signature to this file, - for stdout instead of the text lines.")
+@pdf_password_options
+@scheduler_options
+def verify(pdf_files, trust_root, chain, revocation_mode, analysis_level, manifest_dir, jsonl, pdf_passwords,
+           pdf_password_file, jobs, memory_budget, large_file_size, large_jobs, worker_type):
+    """Verify all signatures of PDF files, one line per signature.
+
+    PDF members of ZIP and TAR archives are verified in memory and
+    reported as archive!member. With --jsonl, results are also written
+    as JSON Lines while the batch runs.
+    """
+
+    trust_roots = [load_cert_from_pemder(path) for path in trust_root]
+    other_certs = [load_cert_from_pemder(path) for path in chain]
+    key_usage_settings = KeyUsageConstraints(
+        key_usage={'digital_signature', 'nonRepudiation'},
+        match_all_key_usages=False
+    )
+    context_state = threading.local()
+    credentials = build_credentials(pdf_passwords, pdf_password_file)
+    report_writer = JsonlWriter(jsonl) if jsonl else None
+    # JSON Lines on stdout replace the text lines
+    echo = (lambda message: None) if jsonl == "-" else click.echo
+
+    def write_record(record):
+        if report_writer is not None:
+            report_writer.write(record)
+
+    def verify_stream(doc, name):
+        """Verify and print signatures of one document, return their result dicts."""
+
+        if not hasattr(context_state, 'context'):
+            # validation contexts are not thread-safe
+            context_state.context = build_validation_context(trust_roots, other_certs, revocation_mode)
+        results = []
+        with span("verify_document", file=name):
+            try:
+                reader = PdfFileReader(doc)
+                credentials.unlock(reader, name)
+                sigs = reader.embedded_signatures
+            except Exception as e:
+                write_record(document_error_record(name, e))
+                raise
+            if not sigs:
+                echo(f"{name}\t-\t-\tUNSIGNED")
+                write_record(unsigned_record(name))
+                return results
+            BYTES_PROCESSED.inc(doc.seek(0, os.SEEK_END), operation="verify")
+            diff_policy = None if analysis_level == "off" else CachingDiffPolicy(reader)
+            for idx, sig in enumerate(sigs):
+                try:
+                    with VERIFY_SECONDS.time(), span("validate_signature", index=idx, level=analysis_level):
+                        status = validate_signature(
+                            sig, context_state.context, key_usage_settings, analysis_level, diff_policy
+                        )
+                except Exception as e:
+                    record_failure("verify", e)
+                    echo(f"{name}\t{idx}\t{sig.field_name}\tERROR\t{e}")
+                    write_record(signature_record(name, idx, sig, error=e))
+                    results.append({'index': idx, 'field_name': sig.field_name, 'valid': False, 'error': str(e)})
+                    continue
+                # a passing signature whose later revisions were not checked is not reported valid
+                verdict = signature_verdict(status)
+                DOCUMENTS_VERIFIED.inc(result=verdict.lower())
+                echo(f"{name}\t{idx}\t{sig.field_name}\t{verdict}\t{status.coverage.name}")
+                write_record(signature_record(name, idx, sig, status))
+                results.append({
+                    'index': idx, 'field_name': sig.field_name, 'valid': verdict == "VALID",
+                    'coverage': status.coverage.name,
+                })
+        return results
+
+    def all_valid(signatures):
+        return bool(signatures) and all(signature['valid'] for signature in signatures)
+
+    def verify_one(pdf_file):
+        archive = is_archive(pdf_file)
+        try:
+            if archive:
+                results = verify_archive(
+                    pdf_file, lambda doc, member: verify_stream(doc, f"{pdf_file}!{member}"),
+                    log=lambda message: click.echo(f"{pdf_file}: {message}", err=True)
+                )
+                if manifest_dir:
+                    os.makedirs(manifest_dir, exist_ok=True)
+                    write_manifest(os.path.join(manifest_dir, f"{os.path.basename(pdf_file)}.manifest.json"),
+                                   pdf_file, results)
+                return all(result.action == "skipped" or all_valid(result.signatures or ()) for result in results)
+            with open(pdf_file, 'rb') as doc:
+                return all_valid(verify_stream(doc, pdf_file))
+        except Exception as e:
+            record_failure("verify", e)
+            click.echo(f"Error verifying {pdf_file}: {e}", err=True)
+            if archive:
+                # unreadable documents were already reported by verify_stream
+                write_record(document_error_record(pdf_file, e))
+            return False
+
+    scheduler = build_scheduler(jobs, memory_budget, large_file_size, large_jobs, worker_type)
+    try:
+        results, report = scheduler.run(verify_one, pdf_files, queue="verify")
+    finally:
+        if report_writer is not None:
+            report_writer.close()
+    click.echo(format_report(report), err=True)
+    sys.exit(0 if all(ok is True for ok in results) else 1)
+
+
+@cli.command()
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--catalog", "catalog_path", default=DEFAULT_CATALOG_PATH, show_default=True,
+              type=click.Path(dir_okay=False), help="SQLite signature catalog.")
+@click.option("--signer", default=None, help="Substring of the signer subject.")
+@click.option("--after", type=click.DateTime(), default=None, help="Signed at or after (UTC).")
+@click.option("--before", type=click.DateTime(), default=None, help="Signed before (UTC).")
+def index(pdf_files, catalog_path, signer, after, before):
+    """Index signatures of PDF files and list those matching the filters."""
+
+    catalog = SignatureCatalog(catalog_path)
+    for pdf_file in pdf_files:
+        if catalog.update(pdf_file) and catalog.error(pdf_file):
+            click.echo(f"Error indexing {pdf_file}: {catalog.error(pdf_file)}", err=True)
+    for path, entry in catalog.find(signer, after, before, paths=pdf_files):
+        click.echo(f"{path}\t{entry.index}\t{entry.field_name}\t{entry.signing_time or '-'}\t"
+                   f"{entry.signer_subject or '-'}")
+    catalog.close()
+
+
+@cli.group()
+def queue():
+    """Distributed signing through a shared job queue."""
+
+
+@queue.command()
+@click.argument("pdf_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--queue", "queue_path", required=True, type=click.Path(dir_okay=False),
+              help="SQLite job queue, on a filesystem shared by all workers.")
+@click.option("--output-dir", default=None, type=click.Path(file_okay=False), help="Directory of signed files.")
+@click.option("--field", "field_name", default="Signature1", show_default=True, help="Signature field name.")
+@click.option("--create-field", is_flag=True, help="Create signature field if it does not exist.")
+@click.option("--box", default=", ".join(str(c) for c in DEFAULT_FIELD_BOX), show_default=True,
+              help="Box of created field: x1, y1, x2, y2.")
+@click.option("--page", default=0, show_default=True, help="Page of created field.")
+@click.option("--location", default=None, help="Signing location.")
+@click.option("--contact-info", default=None, help="Signer contact info.")
+@click.option("--max-attempts", default=DEFAULT_MAX_ATTEMPTS, show_default=True, help="Attempts before a job fails.")
+@click.pass_context
+def enqueue(ctx, pdf_files, queue_path, output_dir, field_name, create_field, box, page, location, contact_info,
+            max_attempts):
+    """Add signing jobs of PDF files to the queue.
+
+    Field and signer options not given here are taken from the
+    --signing-profile of the worker, if it has one.
+    """
+
+    given = {
+        'field_name': field_name, 'create_field': create_field, 'field_box': list(parse_field_box(box)),
+        'field_page': page, 'location': location, 'contact_info': contact_info,
+    }
+    parameters = {'field_box': 'box', 'field_page': 'page'}
+    # only explicit options are stored, the rest is left to the worker
+    options = {name: value for name, value in given.items()
+               if ctx.get_parameter_source(parameters.get(name, name)) != click.core.ParameterSource.DEFAULT}
+    broker = SQLiteJobBroker(queue_path)
+    # paths are stored absolute, workers may run in other directories
+    ids = broker.enqueue(
+        [(os.path.abspath(pdf_file), os.path.abspath(output_path_for(pdf_file, output_dir)), options)
+         for pdf_file in pdf_files],
+        max_attempts=max_attempts
+    )
+    broker.close()
+    click.echo(f"Enqueued {len(ids)} job(s).")
+
+
+@queue.command()
+@click.option("--queue", "queue_path", required=True, type=click.Path(exists=True, dir_okay=False),
+              help="SQLite job queue.")
+@signing_profile_option
+@click.option("--key", required=True, type=click.Path(exists=True), help="Signer private key or PKCS#12 bundle.")
+@click.option("--cert", type=click.Path(exists=True), help="Signer certificate, default from a PKCS#12 --key.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", envvar="PDF_SIGNER_PASSPHRASE", default=None, help="Private key passphrase.")
+@click.option("--image", default=None, type=click.Path(exists=True), help="Signature image.")
+@click.option("--timestamp", is_flag=True, help="Add RFC 3161 signature timestamp.")
+@click.option("--tsa-url", default=DEFAULT_TSA_URL, show_default=True, help="Timestamp server URL.")
+@click.option("--worker", "worker_id", default=None, help="Worker name, default host:pid.")
+@click.option("--visibility-timeout", default=DEFAULT_VISIBILITY_TIMEOUT, show_default=True,
+              help="Seconds before a job of a silent worker is handed to another one.")
+@click.option("--poll-interval", default=1.0, show_default=True, help="Seconds between polls of an empty queue.")
+@click.option("--exit-when-idle", is_flag=True, help="Exit once the queue has no visible jobs.")
+@click.option("--inventory", "inventory_path", default=DEFAULT_INVENTORY_PATH, show_default=True,
+              type=click.Path(dir_okay=False), help="SQLite certificate inventory checked on start.")
+@pdf_password_options
+@click.pass_context
+def work(ctx, queue_path, profile, key, cert, chain, passphrase, image, timestamp, tsa_url, worker_id,
+         visibility_timeout, poll_interval, exit_when_idle, inventory_path, pdf_passwords, pdf_password_file):
+    """Lease and sign queued jobs until interrupted.
+
+    Jobs use the field and signer options given to enqueue; the others
+    come from --signing-profile, if given.
+
+    On start the certificate inventory is updated and the chain of the
+    signing certificate checked, an expired one stops the worker.
+    """
+
+    def job_signer():
+        # a signer per job, so an idle worker keeps no key beyond the key cache
+        with KEY_LOAD_SECONDS.time(backend="file"), span("load_key", backend="file"):
+            return load_signer(key, cert, chain, passphrase)
+
+    try:
+        signing_fingerprint = job_signer().signing_cert.sha256.hex()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    config = get_config(ctx.find_root().params.get('config_path'))
+    signer_health = check_certificates(config, inventory_path, [path for path in (cert,) + tuple(chain) if path],
+                                       signing_fingerprint)
+    if signer_health and signer_health.status in ("expired", "not-yet-valid"):
+        raise click.ClickException(f"Signing certificate {signer_health.subject} is {signer_health.status} "
+                                   f"(chain valid until {signer_health.chain_expires:%Y-%m-%d}).")
+    timestamper = get_timestamper(tsa_url) if timestamp else None
+    stamp_style = ImageStampStyle(image_path=image, border_width=0) if image else None
+    credentials = build_credentials(pdf_passwords, pdf_password_file)
+    worker_id = worker_id or default_worker_id()
+    # job options enqueue was not given come from the profile, then the enqueue defaults
+    job_defaults = {
+        'field_name': "Signature1", 'create_field': False, 'field_box': DEFAULT_FIELD_BOX, 'field_page': 0,
+        'location': None, 'contact_info': None,
+    }
+    if profile:
+        job_defaults.update(
+            field_name=profile.field_name, create_field=profile.create_field, field_box=profile.field_box,
+            field_page=profile.field_page, location=profile.location, contact_info=profile.contact_info
+        )
+
+    def sign_job(job):
+        options = dict(job_defaults, **job.options)
+        # written aside and moved, a worker whose lease expired never leaves a partial file
+        tmp_file = f"{job.output_file}.{job.lease_token}.tmp"
+        try:
+            sign_document(
+                job.pdf_file, tmp_file, job_signer(),
+                build_signature_meta(options['field_name'], options['location'], options['contact_info']),
+                create_field=options['create_field'],
+                field_box=tuple(options['field_box']),
+                field_page=options['field_page'],
+                stamp_style=stamp_style,
+                timestamper=timestamper,
+                credentials=credentials
+            )
+            os.replace(tmp_file, job.output_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    broker = SQLiteJobBroker(queue_path)
+    click.echo(f"Worker {worker_id} polling {queue_path}", err=True)
+    try:
+        done, failed = run_worker(
+            broker, sign_job, worker=worker_id, visibility_timeout=visibility_timeout,
+            poll_interval=poll_interval, exit_when_idle=exit_when_idle, log=lambda message: click.echo(message, err=True)
+        )
+    except KeyboardInterrupt:
+        done = failed = None
+    finally:
+        broker.close()
+    if done is not None:
+        click.echo(f"Worker {worker_id}: {done} done, {failed} failed attempt(s).", err=True)
+
+
+@queue.command()
+@click.option("--queue", "queue_path", required=True, type=click.Path(exists=True, dir_okay=False),
+              help="SQLite job queue.")
+def status(queue_path):
+    """Show job counts and failed jobs."""
+
+    broker = SQLiteJobBroker(queue_path)
+    click.echo(", ".join(f"{state}: {count}" for state, count in broker.counts().items()))
+    for job_id, pdf_file, attempts, error in broker.failed_jobs():
+        click.echo(f"Failed job {job_id} after {attempts} attempt(s): {pdf_file}: {error}")
+    broker.close()
+
+
+@cli.group()
+def profiles():
+    """Manage named signing profiles."""
+
+
+@profiles.command("list")
+@click.pass_context
+def list_profiles(ctx):
+    """List signing profiles and check their files."""
+
+    config = get_config(ctx.find_root().params.get('config_path'))
+    for name in config.profile_names():
+        marker = "*" if name == config.default_profile else " "
+        try:
+            profile = config.profile(name)
+            click.echo(f"{marker} {name}\t{profile.key or profile.pkcs11_module}\t{profile.cert or '-'}")
+        except ProfileError as e:
+            click.echo(f"{marker} {name}\tinvalid: {e}")
+
+
+@profiles.command("add")
+@click.argument("name")
+@click.option("--key", type=click.Path(exists=True), help="Signer private key or PKCS#12 bundle.")
+@click.option("--cert", type=click.Path(exists=True), help="Signer certificate, default from a PKCS#12 --key.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--pkcs11-module", default=None, type=click.Path(exists=True), help="PKCS#11 module.")
+@click.option("--pkcs11-token", default=None, help="PKCS#11 token label.")
+@click.option("--pkcs11-key-label", default=None, help="Label of the private key on the token.")
+@click.option("--pkcs11-cert-label", default=None, help="Label of the certificate on the token.")
+@click.option("--field", "field_name", default=None, help="Signature field name.")
+@click.option("--create-field", is_flag=True, default=None, help="Create signature field if it does not exist.")
+@click.option("--box", default=None, help="Box of created field: x1, y1, x2, y2.")
+@click.option("--page", default=None, type=int, help="Page of created field.")
+@click.option("--image", default=None, type=click.Path(exists=True), help="Signature image.")
+@click.option("--location", default=None, help="Signing location.")
+@click.option("--contact-info", default=None, help="Signer contact info.")
+@click.option("--timestamp", is_flag=True, default=None, help="Add RFC 3161 signature timestamp.")
+@click.option("--tsa-url", default=None, help="Timestamp server URL.")
+@click.option("--pades-level", default=None, type=click.Choice(PADES_LEVELS), help="PAdES baseline level.")
+@click.option("--pdf-password-file", default=None, type=click.Path(exists=True, dir_okay=False),
+              help="JSON file mapping file name patterns to passwords of PDF files signed with this profile.")
+@click.option("--default", "make_default", is_flag=True, help="Preselect profile in the GUI.")
+@click.pass_context
+def add_profile(ctx, name, key, cert, chain, pkcs11_module, pkcs11_token, pkcs11_key_label, pkcs11_cert_label,
+                field_name, create_field, box, page, image, location, contact_info, timestamp, tsa_url,
+                pades_level, pdf_password_file, make_default):
+    """Add or replace a signing profile."""
+
+    def absolute(path):
+        return os.path.abspath(path) if path else None
+
+    config = get_config(ctx.find_root().params.get('config_path'))
+    config.set_profile(
+        name, key=absolute(key), cert=absolute(cert), chain=[absolute(path) for path in chain],
+        pkcs11_module=absolute(pkcs11_module), pkcs11_token=pkcs11_token, pkcs11_key_label=pkcs11_key_label,
+        pkcs11_cert_label=pkcs11_cert_label, field_name=field_name, create_field=create_field,
+        field_box=list(parse_field_box(box)) if box else None, field_page=page, image=absolute(image),
+        location=location, contact_info=contact_info, timestamp=timestamp, tsa_url=tsa_url,
+        pades_level=pades_level, pdf_password_file=absolute(pdf_password_file)
+    )
+    if make_default:
+        config.data['default_profile'] = name
+        config.save()
+    try:
+        config.profile(name)
+    except ProfileError as e:
+        click.echo(f"Warning: {e}", err=True)
+    click.echo(f"Saved profile {name} in {config.path}")
+
+
+def check_certificates(config, inventory_path, cert_files=(), fingerprint=None, warn_days=DEFAULT_WARN_DAYS):
+    """Scan the configured certificate directories, warn about unhealthy chains.
+
+    Returns the CertificateHealth of fingerprint, or None.
+    """
+
+    inventory = CertificateInventory(inventory_path)
+    try:
+        with span("scan_certificates"):
+            result = inventory.scan(config.certificate_directories(), cert_files)
+            report = inventory.health(warn_days=warn_days, paths=result.paths)
+    finally:
+        inventory.close()
+    for health in report:
+        if health.status != "ok":
+            click.echo(f"Warning: certificate {health.subject} is {health.status}, chain valid until "
+                       f"{health.chain_expires:%Y-%m-%d}{': ' + health.problem if health.problem else ''} "
+                       f"({health.paths[0]})", err=True)
+    return next((health for health in report if health.fingerprint == fingerprint), None)
+
+
+@cli.group()
+def certs():
+    """Certificate inventory of the configured directories."""
+
+
+@certs.command("scan")
+@click.argument("directories", nargs=-1, type=click.Path(exists=True, file_okay=False))
+@click.option("--inventory", "inventory_path", default=DEFAULT_INVENTORY_PATH, show_default=True,
+              type=click.Path(dir_okay=False), help="SQLite certificate inventory.")
+@click.option("--warn-days", default=DEFAULT_WARN_DAYS, show_default=True,
+              help="Report chains expiring within this many days.")
+@click.option("--all", "show_all", is_flag=True, help="List healthy certificates and unreadable files too.")
+@click.pass_context
+def scan_certificates(ctx, directories, inventory_path, warn_days, show_all):
+    """Index certificates and report expiring and broken chains.
+
+    Scans DIRECTORIES and the configured ones: key directory,
+    "cert_directories" of the config and directories of profile
+    certificates. Only files changed since the last scan are parsed.
+    Exits with 1 when a certificate of a profile is not healthy.
+    """
+
+    config = get_config(ctx.find_root().params.get('config_path'))
+    profile_files = {}
+    for name in config.profile_names():
+        try:
+            profile = config.profile(name)
+        except ProfileError:
+            continue
+        if profile.cert:
+            profile_files.setdefault(profile.cert, []).append(name)
+    inventory = CertificateInventory(inventory_path)
+    try:
+        result = inventory.scan(list(directories) + config.certificate_directories(), profile_files)
+        click.echo(f"{len(result.paths)} file(s), {result.parsed} parsed, {result.removed} removed, "
+                   f"{len(result.errors)} without certificates", err=True)
+        if show_all:
+            for path, error in result.errors:
+                click.echo(f"Error reading {path}: {error}", err=True)
+        profile_certs = {}
+        for cert_file, names in profile_files.items():
+            # the signer certificate comes first in its file
+            for fingerprint in inventory.fingerprints(cert_file)[:1]:
+                profile_certs.setdefault(fingerprint, []).extend(names)
+        report = inventory.health(warn_days=warn_days, paths=result.paths)
+    finally:
+        inventory.close()
+    for health in report:
+        if health.status == "ok" and not show_all:
+            continue
+        columns = [health.status, f"{health.chain_expires:%Y-%m-%d}", health.subject, health.paths[0]]
+        if health.problem:
+            columns.append(health.problem)
+        if health.fingerprint in profile_certs:
+            columns.append(f"profiles: {', '.join(profile_certs[health.fingerprint])}")
+        click.echo("\t".join(columns))
+    sys.exit(1 if any(health.status != "ok" for health in report if health.fingerprint in profile_certs) else 0)
+
+
+@cli.group()
+def keys():
+    """Protect private key files."""
+
+
+@keys.command("protect")
+@click.argument("key_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--passphrase", envvar="PDF_SIGNER_PASSPHRASE", default=None, help="Current passphrase of the key.")
+@click.option("--new-passphrase", default=None, help="New passphrase, generated when not given.")
+@click.option("--kdf", default=DEFAULT_KDF, show_default=True, type=click.Choice(KDFS), help="Key derivation.")
+@click.option("--kdf-cost", default=None, type=int,
+              help=f"scrypt N or PBKDF2 iterations, default {DEFAULT_KDF_COST['scrypt']} / "
+                   f"{DEFAULT_KDF_COST['pbkdf2']}. Tune with `bench.py unlock`.")
+@click.option("--output", default=None, type=click.Path(dir_okay=False), help="Output file, default in place.")
+def protect_key(key_file, passphrase, new_passphrase, kdf, kdf_cost, output):
+    """Re-encrypt a private key file with the chosen KDF and cost."""
+
+    with open(key_file, "rb") as f:
+        data = f.read()
+    try:
+        private_key = (load_pem_private_key if data.lstrip().startswith(b"-----") else load_der_private_key)(
+            data, passphrase.encode() if passphrase else None
+        )
+    except (ValueError, TypeError) as e:
+        raise click.ClickException(f"Could not load {key_file}: {e}")
+    generated = new_passphrase is None
+    new_passphrase = new_passphrase or generate_passphrase()
+    output = output or key_file
+    tmp_file = f"{output}.{os.getpid()}.tmp"
+    try:
+        write_private_key(private_key, tmp_file, new_passphrase, kdf, kdf_cost)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--kdf-cost")
+    os.replace(tmp_file, output)
+    click.echo(f"Wrote {output} ({kdf}, cost {kdf_cost or DEFAULT_KDF_COST[kdf]})", err=True)
+    if generated:
+        click.echo(new_passphrase)
+
+
+@keys.command("pkcs12")
+@click.argument("key_file", type=click.Path(exists=True, dir_okay=False))
+@click.option("--cert", required=True, type=click.Path(exists=True), help="Signer certificate.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", envvar="PDF_SIGNER_PASSPHRASE", default=None,
+              help="Passphrase of the key, also protects the bundle.")
+@click.option("--kdf-cost", default=DEFAULT_KDF_COST['pbkdf2'], show_default=True, help="PBKDF2 iterations.")
+@click.option("--output", required=True, type=click.Path(dir_okay=False), help="Bundle file (.p12).")
+def export_pkcs12(key_file, cert, chain, passphrase, kdf_cost, output):
+    """Bundle key, certificate and chain into one PKCS#12 file for --key."""
+
+    with open(key_file, "rb") as f:
+        data = f.read()
+    try:
+        private_key = (load_pem_private_key if data.lstrip().startswith(b"-----") else load_der_private_key)(
+            data, passphrase.encode() if passphrase else None
+        )
+    except (ValueError, TypeError) as e:
+        raise click.ClickException(f"Could not load {key_file}: {e}")
+    # PEM or DER, as everywhere else
+    signer_cert = load_der_x509_certificate(load_cert_from_pemder(cert).dump())
+    ca_certs = [load_der_x509_certificate(load_cert_from_pemder(path).dump()) for path in chain]
+    try:
+        write_pkcs12(private_key, signer_cert, ca_certs, output, passphrase, "pbkdf2", kdf_cost)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--kdf-cost")
+    click.echo(f"Wrote {output} (key, certificate and {len(ca_certs)} chain certificate(s))")
+
+
+@keys.command("passphrase")
+@click.option("--length", default=24, show_default=True, help="Characters, about 5 bits each.")
+def new_passphrase(length):
+    """Print a random passphrase."""
+
+    click.echo(generate_passphrase(length))
+
+
+if __name__ == '__main__':
+    cli()
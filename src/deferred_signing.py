@@ -0,0 +1,282 @@
+"""@package docstring
+Two-phase (deferred) signing with an external signer.
+
+Documents are prepared and their ByteRange digests computed locally.
+The digests of the CMS signed attributes of a whole batch are then sent
+to the external signer in one call, and the returned signature values
+are embedded afterwards. With a remote key this costs one round-trip
+per batch instead of one per document. Documents are written to a
+temporary file next to the output and only renamed to it once signed,
+so a failed document leaves no output file behind. Encrypted documents
+are opened with the PdfCredentials of the batch and keep their encryption.
+"""
+import os
+import base64
+import dataclasses
+import asyncio
+import hashlib
+
+import requests
+from asn1crypto import x509 as asn1_x509
+from pyhanko.sign import signers, fields
+from pyhanko.sign.signers.pdf_signer import PdfTBSDocument, add_mac_to_external_cms
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko_certvalidator.registry import SimpleCertificateStore
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ec, utils
+
+from signing import find_signature_field, unlock_document
+from metrics import DOCUMENTS_SIGNED, BYTES_PROCESSED, QUEUE_DEPTH, record_failure
+
+DEFAULT_BATCH_SIZE = 64
+MD_ALGORITHM = 'sha256'
+
+_HASHES = {
+    'sha256': hashes.SHA256,
+    'sha384': hashes.SHA384,
+    'sha512': hashes.SHA512,
+}
+
+
+class ExternalSignerBackend:
+    """Interface of an external signer holding the private key."""
+
+    def get_certificates(self):
+        """Return (signing_cert, ca_chain) as asn1crypto certificates."""
+
+        raise NotImplementedError
+
+    def sign_digests(self, digests, md_algorithm):
+        """Sign list of pre-computed digests, return list of signature values."""
+
+        raise NotImplementedError
+
+
+def sign_prehashed(private_key, digest, md_algorithm):
+    """Sign pre-computed digest with a cryptography private key."""
+
+    algorithm = utils.Prehashed(_HASHES[md_algorithm]())
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        return private_key.sign(digest, padding.PKCS1v15(), algorithm)
+    if isinstance(private_key, ec.EllipticCurvePrivateKey):
+        return private_key.sign(digest, ec.ECDSA(algorithm))
+    raise ValueError(f"Unsupported key type: {type(private_key).__name__}")
+
+
+class LocalKeyBackend(ExternalSignerBackend):
+    """External signer backend using a private key in this process."""
+
+    def __init__(self, private_key, signing_cert, ca_chain=()):
+        self.private_key = private_key
+        self.signing_cert = signing_cert
+        self.ca_chain = list(ca_chain)
+
+    def get_certificates(self):
+        return self.signing_cert, self.ca_chain
+
+    def sign_digests(self, digests, md_algorithm):
+        return [sign_prehashed(self.private_key, digest, md_algorithm) for digest in digests]
+
+
+class HTTPSignerBackend(ExternalSignerBackend):
+    """Client of an HTTP signing service (see remote_signer.py)."""
+
+    def __init__(self, url, timeout=30, session=None):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self._certificates = None
+
+    def get_certificates(self):
+        if self._certificates is None:
+            res = self.session.get(f"{self.url}/certificates", timeout=self.timeout)
+            res.raise_for_status()
+            data = res.json()
+            signing_cert = asn1_x509.Certificate.load(base64.b64decode(data['signing_cert']))
+            ca_chain = [asn1_x509.Certificate.load(base64.b64decode(c)) for c in data['chain']]
+            self._certificates = (signing_cert, ca_chain)
+        return self._certificates
+
+    def sign_digests(self, digests, md_algorithm):
+        res = self.session.post(
+            f"{self.url}/sign",
+            json={
+                'md_algorithm': md_algorithm,
+                'digests': [base64.b64encode(d).decode('ascii') for d in digests]
+            },
+            timeout=self.timeout
+        )
+        res.raise_for_status()
+        signatures = [base64.b64decode(s) for s in res.json()['signatures']]
+        if len(signatures) != len(digests):
+            raise ValueError(
+                f"External signer returned {len(signatures)} signatures for {len(digests)} digests."
+            )
+        return signatures
+
+
+class PendingSignature:
+    """Document prepared for signing, waiting for its signature value."""
+
+    def __init__(self, pdf_file, output_file, output, prepared_digest, signed_attrs,
+                 post_sign_instr=None, validation_context=None, tmp_file=None, mac_writer=None):
+        self.pdf_file = pdf_file
+        self.output_file = output_file
+        self.output = output
+        self.tmp_file = tmp_file
+        self.prepared_digest = prepared_digest
+        self.signed_attrs = signed_attrs
+        self.post_sign_instr = post_sign_instr
+        self.validation_context = validation_context
+        # writer of an encrypted document with ISO 32004 MAC, whose key the MAC token needs
+        self.mac_writer = mac_writer
+        self.error = None
+
+    @property
+    def tbs_digest(self):
+        """Digest of the signed attributes, i.e. what the key actually signs."""
+
+        return hashlib.new(MD_ALGORITHM, self.signed_attrs.dump()).digest()
+
+    def discard(self, error):
+        """Record error and remove the unfinished output."""
+
+        self.error = error
+        if self.output is not None:
+            self.output.close()
+        if self.tmp_file is not None and os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
+
+
+class DeferredBatchSigner:
+    """Sign batches of documents with an ExternalSignerBackend."""
+
+    def __init__(self, backend, batch_size=DEFAULT_BATCH_SIZE, timestamper=None, credentials=None):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.timestamper = timestamper
+        # PdfCredentials of encrypted documents
+        self.credentials = credentials
+        signing_cert, ca_chain = backend.get_certificates()
+        self.signing_cert = signing_cert
+        self.cert_registry = SimpleCertificateStore.from_certs(ca_chain)
+        self.signature_size = signing_cert.public_key.bit_size // 8 + 16
+
+    def _placeholder_signer(self, signature_value=None):
+        return signers.ExternalSigner(
+            signing_cert=self.signing_cert,
+            cert_registry=self.cert_registry,
+            signature_value=signature_value or self.signature_size
+        )
+
+    async def _prepare(self, pdf_file, output_file, signature_meta, new_field_spec):
+        signature_meta = dataclasses.replace(signature_meta, md_algorithm=MD_ALGORITHM)
+        placeholder = self._placeholder_signer()
+        with open(pdf_file, 'rb') as doc:
+            w = IncrementalPdfFileWriter(doc)
+            unlock_document(w.prev, pdf_file, self.credentials)
+            if new_field_spec and find_signature_field(w.prev, new_field_spec.sig_field_name):
+                new_field_spec = None
+            pdf_signer = signers.PdfSigner(
+                signature_meta, signer=placeholder,
+                timestamper=self.timestamper,
+                new_field_spec=new_field_spec
+            )
+            security_handler = w.security_handler
+            mac_writer = w if security_handler is not None and security_handler.pdf_mac_enabled else None
+            tmp_file = f"{output_file}.{os.getpid()}.tmp"
+            output = open(tmp_file, 'w+b')
+            try:
+                prepared_digest, tbs_document, output = await pdf_signer.async_digest_doc_for_signing(
+                    w, output=output
+                )
+            except Exception:
+                output.close()
+                os.remove(tmp_file)
+                raise
+        signed_attrs = await placeholder.signed_attrs(
+            prepared_digest.document_digest, MD_ALGORITHM, use_pades=True
+        )
+        return PendingSignature(
+            pdf_file, output_file, output, prepared_digest, signed_attrs,
+            # validation info of PAdES-B-LT/LTA is embedded after signing
+            post_sign_instr=tbs_document.post_sign_instructions,
+            validation_context=signature_meta.validation_context,
+            tmp_file=tmp_file, mac_writer=mac_writer
+        )
+
+    async def _finish(self, pending, signature_value):
+        signature_cms = await self._placeholder_signer(signature_value).async_sign_prescribed_attributes(
+            MD_ALGORITHM, pending.signed_attrs, timestamper=self.timestamper
+        )
+        if pending.mac_writer is not None:
+            # the placeholder signer of _prepare reserved room for the token
+            add_mac_to_external_cms(pending.mac_writer, MD_ALGORITHM, signature_cms['content'],
+                                    pending.prepared_digest.document_digest)
+        await PdfTBSDocument.async_finish_signing(
+            pending.output, pending.prepared_digest, signature_cms,
+            post_sign_instr=pending.post_sign_instr,
+            validation_context=pending.validation_context
+        )
+        pending.output.close()
+        os.replace(pending.tmp_file, pending.output_file)
+
+    async def _sign_chunk(self, jobs, log):
+        pending = []
+        for pdf_file, output_file, signature_meta, new_field_spec in jobs:
+            try:
+                pending.append(await self._prepare(pdf_file, output_file, signature_meta, new_field_spec))
+            except Exception as e:
+                log(f"Error preparing {pdf_file}: {e}")
+                pending.append(PendingSignature(pdf_file, output_file, None, None, None))
+                pending[-1].error = e
+
+        ready = [p for p in pending if p.error is None]
+        if ready:
+            log(f"Sending {len(ready)} digest(s) to external signer...")
+            try:
+                signatures = self.backend.sign_digests([p.tbs_digest for p in ready], MD_ALGORITHM)
+                if len(signatures) != len(ready):
+                    # zip() would leave the rest with their placeholder signature
+                    raise ValueError(f"External signer returned {len(signatures)} signatures "
+                                     f"for {len(ready)} digests.")
+            except Exception as e:
+                for p in ready:
+                    p.discard(e)
+                signatures = []
+            for p, signature_value in zip(ready, signatures):
+                try:
+                    await self._finish(p, signature_value)
+                except Exception as e:
+                    p.discard(e)
+        return pending
+
+    def sign_documents(self, jobs, log=None):
+        """Sign (pdf_file, output_file, signature_meta, new_field_spec) jobs.
+
+        Returns list of PendingSignature, whose error is None on success.
+        """
+
+        log = log or (lambda message: None)
+        jobs = list(jobs)
+        results = []
+        QUEUE_DEPTH.inc(len(jobs), queue="deferred")
+        for start in range(0, len(jobs), self.batch_size):
+            chunk = asyncio.run(self._sign_chunk(jobs[start:start + self.batch_size], log))
+            QUEUE_DEPTH.dec(len(chunk), queue="deferred")
+            for p in chunk:
+                if p.error is None:
+                    DOCUMENTS_SIGNED.inc()
+                    BYTES_PROCESSED.inc(os.path.getsize(p.pdf_file), operation="sign")
+                else:
+                    record_failure("sign", p.error)
+            results.extend(chunk)
+        return results
+
+
+def field_spec_for(field_name, create_field, field_box, field_page):
+    """Field spec of a signature field to create, or None."""
+
+    if not create_field:
+        return None
+    return fields.SigFieldSpec(sig_field_name=field_name, on_page=field_page, box=field_box)
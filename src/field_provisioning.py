@@ -0,0 +1,188 @@
+"""@package docstring
+Empty signature fields stamped onto batches of template-generated PDFs.
+
+A layout names the fields to provision, each with its page and box, in a
+JSON file:
+
+{"fields": [{"name": "Author", "page": 0, "box": [50, 50, 250, 110]},
+            {"name": "Approver", "page": -1, "box": "300, 50, 500, 110"}]}
+
+Negative pages count from the last page. The layout is compiled once:
+field dictionaries (flags, rectangle, name) and the appearance stream of
+every box size are built up front, so provisioning a document only
+copies them, adds them to its form and pages, and writes one incremental
+revision. Fields of the same size share one appearance stream within a
+document. Fields that already exist are left alone, so a batch can be
+provisioned again after adding fields to the layout.
+"""
+import os
+import json
+from collections import namedtuple
+
+from pyhanko.pdf_utils import generic
+from pyhanko.pdf_utils.generic import pdf_name
+from pyhanko.pdf_utils.content import RawContent
+from pyhanko.pdf_utils.layout import BoxConstraints
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.sign import fields
+
+from signing import parse_field_box, unlock_document, open_document, document_name, document_size
+from metrics import BYTES_PROCESSED, record_failure
+from tracing import span
+
+LayoutField = namedtuple("LayoutField", ["name", "page", "box"])
+ProvisionResult = namedtuple("ProvisionResult", ["added", "existing"])
+
+
+class LayoutError(ValueError):
+    """Invalid field layout."""
+
+
+def provisioned_output_path(pdf_file, output_dir=None):
+    """Output path of a provisioned document, same name in output_dir or *_fields.pdf next to it."""
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        return os.path.join(output_dir, os.path.basename(pdf_file))
+    root, ext = os.path.splitext(pdf_file)
+    return f"{root}_fields{ext or '.pdf'}"
+
+
+def _layout_field(entry):
+    if not isinstance(entry, dict) or not entry.get('name'):
+        raise LayoutError(f"Layout field needs a name: {entry!r}")
+    name = entry['name']
+    if "." in name:
+        raise LayoutError(f"Field {name}: hierarchical field names are not supported.")
+    box = entry.get('box')
+    try:
+        if isinstance(box, (list, tuple)):
+            box = parse_field_box(", ".join(str(coordinate) for coordinate in box))
+        else:
+            box = parse_field_box(box or "")
+    except ValueError as e:
+        raise LayoutError(f"Field {name}: {e}") from None
+    page = entry.get('page', 0)
+    if not isinstance(page, int):
+        raise LayoutError(f"Field {name}: page must be an integer, got {page!r}")
+    return LayoutField(name, page, box)
+
+
+class FieldLayout:
+    """Compiled signature field layout, shared read-only by the threads of a batch."""
+
+    def __init__(self, layout_fields):
+        self.fields = [field if isinstance(field, LayoutField) else _layout_field(field) for field in layout_fields]
+        if not self.fields:
+            raise LayoutError("Layout has no fields.")
+        names = [field.name for field in self.fields]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise LayoutError(f"Duplicate fields in layout: {', '.join(duplicates)}")
+
+        # field and widget in one dictionary, as pyhanko creates them
+        self._templates = {
+            field.name: fields.SignatureFormField(field.name, box=field.box) for field in self.fields
+        }
+        self._appearances = {}
+        for field in self.fields:
+            size = self._size(field)
+            if size not in self._appearances:
+                appearance = RawContent(b'', box=BoxConstraints(width=size[0], height=size[1])).as_form_xobject()
+                self._appearances[size] = (dict(appearance), appearance.data)
+
+    @classmethod
+    def load(cls, path):
+        """Read a layout from a JSON file: {"fields": [...]} or a plain list of fields."""
+
+        with open(path, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise LayoutError(f"{path}: {e}") from None
+        return cls(data.get('fields', []) if isinstance(data, dict) else data)
+
+    @staticmethod
+    def _size(field):
+        x1, y1, x2, y2 = field.box
+        return (x2 - x1, y2 - y1)
+
+    def apply(self, w, log=None):
+        """Add the missing fields of the layout to an IncrementalPdfFileWriter.
+
+        Returns a ProvisionResult with the names of added and of already
+        existing fields.
+        """
+
+        log = log or (lambda message: None)
+        with span("find_signature_fields"):
+            existing = {name for name, _, _ in fields.enumerate_sig_fields(w.prev)}
+        missing = [field for field in self.fields if field.name not in existing]
+        if not missing:
+            return ProvisionResult([], [field.name for field in self.fields])
+
+        root = w.root
+        if '/AcroForm' in root:
+            form = root['/AcroForm']
+            form_fields = form.get('/Fields')
+            if form_fields is None:
+                form_fields = form[pdf_name('/Fields')] = generic.ArrayObject()
+                w.update_container(form)
+            else:
+                w.update_container(form_fields)
+        else:
+            form = generic.DictionaryObject()
+            form_fields = form[pdf_name('/Fields')] = generic.ArrayObject()
+            root[pdf_name('/AcroForm')] = w.add_object(form)
+            w.update_root()
+        if '/SigFlags' not in form:
+            # SignaturesExist, without append-only until the first signature
+            form[pdf_name('/SigFlags')] = generic.NumberObject(1)
+            w.update_container(form)
+
+        page_refs = {}
+        appearance_refs = {}
+        for field in missing:
+            if field.page not in page_refs:
+                page_refs[field.page] = w.find_page_for_modification(field.page)[0]
+            size = self._size(field)
+            if size not in appearance_refs:
+                dict_data, stream_data = self._appearances[size]
+                # stream objects cache their encoding, so each document gets its own
+                appearance_refs[size] = w.add_object(generic.StreamObject(dict(dict_data), stream_data=stream_data))
+            sig_field = generic.DictionaryObject(self._templates[field.name])
+            sig_field[pdf_name('/P')] = page_refs[field.page]
+            sig_field[pdf_name('/AP')] = generic.DictionaryObject({pdf_name('/N'): appearance_refs[size]})
+            sig_field_ref = w.add_object(sig_field)
+            form_fields.append(sig_field_ref)
+            w.register_annotation(page_refs[field.page], sig_field_ref)
+            log(f"Added signature field {field.name} on page {field.page}.")
+        return ProvisionResult([field.name for field in missing], sorted(existing & set(self._templates)))
+
+
+def provision_document(pdf_file, output_file, layout, log=None, credentials=None):
+    """Write pdf_file with the fields of layout added in one incremental revision.
+
+    pdf_file and output_file are paths or seekable binary streams.
+    Documents that already have every field are copied unchanged.
+    """
+
+    try:
+        with span("provision_fields", file=document_name(pdf_file), fields=len(layout.fields)):
+            with open_document(pdf_file, 'rb') as doc:
+                with span("parse_pdf"):
+                    w = IncrementalPdfFileWriter(doc)
+                unlock_document(w.prev, document_name(pdf_file), credentials)
+                result = layout.apply(w, log=log)
+                with open_document(output_file, 'wb') as out:
+                    if result.added:
+                        with span("write_pdf"):
+                            w.write(out)
+                    else:
+                        doc.seek(0)
+                        out.write(doc.read())
+    except Exception as e:
+        record_failure("provision", e)
+        raise
+    BYTES_PROCESSED.inc(document_size(pdf_file), operation="provision")
+    return result
@@ -0,0 +1,314 @@
+"""@package docstring
+CA-side issuance records, CRL publishing and pre-signed OCSP responses.
+
+Every certificate issued by the generation tab is recorded with its
+status. Publishing signs the CRL and the OCSP responses of all recorded
+certificates of an issuer in one go, so the responder only serves files
+and never signs per request. Re-run `python issuance.py publish` before
+the published nextUpdate, and after every revocation.
+"""
+import os
+import sqlite3
+import datetime
+import threading
+
+import click
+from asn1crypto import x509 as asn1_x509
+from cryptography import x509
+from cryptography.x509 import ocsp
+from cryptography.hazmat.primitives import serialization, hashes
+
+from local_responder import issuer_key_id, load_issuer, RevocationResponder, DEFAULT_VALIDITY
+
+DEFAULT_DB_NAME = "issued.db"
+DEFAULT_PUBLISH_DIR_NAME = "revocation"
+## CertID hash algorithms OCSP responses are pre-signed for.
+OCSP_HASHES = (hashes.SHA1, hashes.SHA256)
+
+REVOCATION_REASONS = {flag.name: flag for flag in x509.ReasonFlags}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS certificates (
+    serial TEXT NOT NULL,
+    issuer_key_id TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    not_after TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'good',
+    revoked_at TEXT,
+    reason TEXT,
+    PRIMARY KEY (issuer_key_id, serial)
+)
+"""
+
+
+class IssuanceDatabase:
+    """SQLite record of issued certificate serials and their status."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def record(self, cert, issuer_public_key):
+        """Record certificate issued by the key as good."""
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO certificates (serial, issuer_key_id, subject, not_after) "
+                "VALUES (?, ?, ?, ?)",
+                (format(cert.serial_number, 'x'), issuer_key_id(issuer_public_key),
+                 cert.subject.rfc4514_string(), cert.not_valid_after_utc.isoformat())
+            )
+
+    def revoke(self, serial_number, reason="unspecified", revoked_at=None, issuer_public_key=None):
+        """Mark certificate as revoked, return number of updated records.
+
+        Serials are only unique per issuer; without issuer_public_key a
+        serial recorded for several issuers raises ValueError.
+        """
+
+        if reason not in REVOCATION_REASONS:
+            raise ValueError(f"Unknown revocation reason: {reason}")
+        revoked_at = revoked_at or datetime.datetime.now(datetime.UTC)
+        serial = format(serial_number, 'x')
+        with self._lock, self._conn:
+            if issuer_public_key is not None:
+                key_ids = [issuer_key_id(issuer_public_key)]
+            else:
+                key_ids = [key_id for key_id, in self._conn.execute(
+                    "SELECT issuer_key_id FROM certificates WHERE serial = ? AND status = 'good'", (serial,)
+                )]
+                if len(key_ids) > 1:
+                    raise ValueError(f"Serial {serial_number:#x} was issued by {len(key_ids)} issuers.")
+            return sum(self._conn.execute(
+                "UPDATE certificates SET status = 'revoked', revoked_at = ?, reason = ? "
+                "WHERE serial = ? AND issuer_key_id = ? AND status = 'good'",
+                (revoked_at.isoformat(), reason, serial, key_id)
+            ).rowcount for key_id in key_ids)
+
+    def entries(self, issuer_public_key, revoked_only=False):
+        """(serial, revoked_at, reason) of certificates issued by the key."""
+
+        query = "SELECT serial, revoked_at, reason FROM certificates WHERE issuer_key_id = ?"
+        if revoked_only:
+            query += " AND status = 'revoked'"
+        with self._lock:
+            rows = self._conn.execute(query, (issuer_key_id(issuer_public_key),)).fetchall()
+        return [
+            (int(serial, 16), datetime.datetime.fromisoformat(revoked_at) if revoked_at else None, reason)
+            for serial, revoked_at, reason in rows
+        ]
+
+    def close(self):
+        """Close database connection."""
+
+        self._conn.close()
+
+
+def crl_path(directory, issuer_public_key):
+    """Path of the published CRL of the key, matching local_responder.crl_url."""
+
+    return os.path.join(directory, "crl", f"{issuer_key_id(issuer_public_key)}.crl")
+
+
+def ocsp_path(directory, issuer_key_hash, serial_number):
+    """Path of the pre-signed OCSP response for serial_number."""
+
+    return os.path.join(directory, "ocsp", issuer_key_hash.hex(), f"{serial_number:x}.der")
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def generate_crl(db, issuer_cert, issuer_key, validity=DEFAULT_VALIDITY):
+    """DER CRL listing every revoked certificate of the issuer."""
+
+    now = datetime.datetime.now(datetime.UTC)
+    builder = (x509.CertificateRevocationListBuilder()
+        .issuer_name(issuer_cert.subject)
+        .last_update(now)
+        .next_update(now + validity))
+    for serial_number, revoked_at, reason in db.entries(issuer_cert.public_key(), revoked_only=True):
+        revoked = (x509.RevokedCertificateBuilder()
+            .serial_number(serial_number)
+            .revocation_date(revoked_at))
+        if reason != "unspecified":
+            revoked = revoked.add_extension(x509.CRLReason(REVOCATION_REASONS[reason]), critical=False)
+        builder = builder.add_revoked_certificate(revoked.build())
+    return builder.sign(issuer_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+
+class OCSPResponseStore:
+    """Directory of OCSP responses signed ahead of time."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def lookup(self, issuer_key_hash, serial_number):
+        """Pre-signed DER response, or None if the certificate is unknown."""
+
+        try:
+            with open(ocsp_path(self.directory, issuer_key_hash, serial_number), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def sign_all(self, db, issuer_cert, issuer_key, validity=DEFAULT_VALIDITY):
+        """Sign and store responses of every certificate of the issuer, return their count."""
+
+        now = datetime.datetime.now(datetime.UTC)
+        issuer_name_der = issuer_cert.subject.public_bytes()
+        public_key_info = asn1_x509.Certificate.load(issuer_cert.public_bytes(serialization.Encoding.DER)).public_key
+        count = 0
+        for serial_number, revoked_at, reason in db.entries(issuer_cert.public_key()):
+            for hash_cls in OCSP_HASHES:
+                name_hash = hashes.Hash(hash_cls())
+                name_hash.update(issuer_name_der)
+                key_hash = getattr(public_key_info, hash_cls.name)
+                builder = (ocsp.OCSPResponseBuilder()
+                    .add_response_by_hash(
+                        issuer_name_hash=name_hash.finalize(),
+                        issuer_key_hash=key_hash,
+                        serial_number=serial_number,
+                        algorithm=hash_cls(),
+                        cert_status=ocsp.OCSPCertStatus.GOOD if revoked_at is None else ocsp.OCSPCertStatus.REVOKED,
+                        this_update=now,
+                        next_update=now + validity,
+                        revocation_time=revoked_at,
+                        revocation_reason=REVOCATION_REASONS[reason] if reason and reason != "unspecified" else None)
+                    .responder_id(ocsp.OCSPResponderEncoding.HASH, issuer_cert))
+                response = builder.sign(issuer_key, hashes.SHA256())
+                _write(ocsp_path(self.directory, key_hash, serial_number),
+                       response.public_bytes(serialization.Encoding.DER))
+                count += 1
+        return count
+
+
+def publish_revocation_info(db, issuer_cert, issuer_key, directory, validity=DEFAULT_VALIDITY):
+    """Write CRL and pre-signed OCSP responses of the issuer to directory."""
+
+    _write(crl_path(directory, issuer_cert.public_key()), generate_crl(db, issuer_cert, issuer_key, validity))
+    return OCSPResponseStore(directory).sign_all(db, issuer_cert, issuer_key, validity)
+
+
+class PublishedResponder(RevocationResponder):
+    """Responder serving published CRLs and pre-signed OCSP responses, never signing."""
+
+    def __init__(self, directory, host="127.0.0.1", port=0, delay=0.0):
+        self.directory = directory
+        self.store = OCSPResponseStore(directory)
+        super().__init__([], host=host, port=port, delay=delay)
+
+    def crl_bytes(self, key_id):
+        try:
+            with open(os.path.join(self.directory, "crl", f"{os.path.basename(key_id)}.crl"), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def ocsp_response_for(self, request):
+        response = self.store.lookup(request.issuer_key_hash, request.serial_number)
+        if response is None:
+            return ocsp.OCSPResponseBuilder.build_unsuccessful(
+                ocsp.OCSPResponseStatus.UNAUTHORIZED
+            ).public_bytes(serialization.Encoding.DER)
+        return response
+
+
+@click.group()
+def cli():
+    """Issued certificate records and revocation publishing."""
+
+
+@cli.command()
+@click.option("--db", "db_path", default=DEFAULT_DB_NAME, show_default=True, type=click.Path(dir_okay=False))
+@click.option("--issuer", required=True, type=click.Path(exists=True), help="Issuer CA certificate.")
+@click.argument("cert_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def record(db_path, issuer, cert_files):
+    """Record certificates issued by ISSUER."""
+
+    with open(issuer, 'rb') as f:
+        issuer_public_key = x509.load_pem_x509_certificate(f.read()).public_key()
+    db = IssuanceDatabase(db_path)
+    for cert_file in cert_files:
+        with open(cert_file, 'rb') as f:
+            db.record(x509.load_pem_x509_certificate(f.read()), issuer_public_key)
+    db.close()
+
+
+@cli.command()
+@click.option("--db", "db_path", default=DEFAULT_DB_NAME, show_default=True, type=click.Path(exists=True))
+@click.option("--reason", default="unspecified", show_default=True, type=click.Choice(sorted(REVOCATION_REASONS)))
+@click.option("--issuer", default=None, type=click.Path(exists=True),
+              help="Issuer CA certificate, required when several issuers used the serial.")
+@click.argument("serial")
+def revoke(db_path, reason, issuer, serial):
+    """Revoke certificate by serial number (decimal or 0x hex)."""
+
+    issuer_public_key = None
+    if issuer:
+        with open(issuer, 'rb') as f:
+            issuer_public_key = x509.load_pem_x509_certificate(f.read()).public_key()
+    db = IssuanceDatabase(db_path)
+    try:
+        revoked = db.revoke(int(serial, 0), reason, issuer_public_key=issuer_public_key)
+    except ValueError as e:
+        raise click.UsageError(f"{e} Name one with --issuer.")
+    finally:
+        db.close()
+    if not revoked:
+        raise click.ClickException(f"No good certificate with serial {serial} recorded"
+                                   + (f" for issuer {issuer}." if issuer else "."))
+    click.echo(f"Revoked {serial}, publish to update CRL and OCSP responses.")
+
+
+@cli.command()
+@click.option("--db", "db_path", default=DEFAULT_DB_NAME, show_default=True, type=click.Path(exists=True))
+@click.option("--cert", "certs", multiple=True, required=True, type=click.Path(exists=True),
+              help="Issuer CA certificate, once per CA.")
+@click.option("--key", "keys", multiple=True, required=True, type=click.Path(exists=True),
+              help="Issuer private key, in the same order as --cert.")
+@click.option("--passphrase", default=None, help="CA private key passphrase.")
+@click.option("--out", "directory", default=DEFAULT_PUBLISH_DIR_NAME, show_default=True,
+              type=click.Path(file_okay=False))
+@click.option("--validity-hours", default=24, show_default=True, help="Time until nextUpdate.")
+def publish(db_path, certs, keys, passphrase, directory, validity_hours):
+    """Sign CRLs and all OCSP responses of the issuers."""
+
+    if len(certs) != len(keys):
+        raise click.UsageError("Every --cert needs a matching --key.")
+    db = IssuanceDatabase(db_path)
+    for cert, key in zip(certs, keys):
+        issuer_cert, issuer_key = load_issuer(cert, key, passphrase)
+        count = publish_revocation_info(
+            db, issuer_cert, issuer_key, directory, datetime.timedelta(hours=validity_hours)
+        )
+        click.echo(f"Published CRL and {count} OCSP response(s) of {issuer_cert.subject.rfc4514_string()}")
+    db.close()
+
+
+@cli.command()
+@click.option("--dir", "directory", default=DEFAULT_PUBLISH_DIR_NAME, show_default=True,
+              type=click.Path(exists=True, file_okay=False))
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8082, show_default=True)
+def serve(directory, host, port):
+    """Serve published CRLs and OCSP responses."""
+
+    responder = PublishedResponder(directory, host, port)
+    click.echo(f"Revocation responder listening on {responder.url}")
+    try:
+        responder.server.serve_forever()
+    except KeyboardInterrupt:
+        responder.server.server_close()
+
+
+if __name__ == '__main__':
+    cli()
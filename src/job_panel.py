@@ -0,0 +1,266 @@
+"""@package docstring
+Queue of background sign and verify jobs shown below the tabs.
+
+Jobs run on a bounded QThreadPool, so the forms stay usable while
+documents are signed or verified. Job functions run in a pool thread and
+must not touch widgets; job.post() runs a callable in the GUI thread,
+job.progress() reports progress and job.check_cancelled() is the point
+where a running job gives up after "Cancel".
+"""
+import time
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtWidgets import (QGroupBox, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSpinBox,
+                             QTreeWidget, QTreeWidgetItem, QProgressBar, QAbstractItemView)
+
+from metrics import QUEUE_DEPTH, record_failure
+
+DEFAULT_MAX_THREADS = 4
+## Interval of elapsed time updates in milliseconds.
+ELAPSED_REFRESH_MS = 250
+
+
+class JobCancelled(Exception):
+    """Raised by check_cancelled() in a job that was cancelled."""
+
+
+class _JobSignals(QObject):
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(str, str)
+    call = pyqtSignal(object)
+
+
+class _JobRunnable(QRunnable):
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        # the panel keeps the runnable, Qt must not delete it after run()
+        self.setAutoDelete(False)
+
+    def run(self):
+        job = self.job
+        if job.cancel_requested:
+            job.signals.finished.emit("Cancelled", "")
+            return
+        job.started = time.monotonic()
+        job.signals.progress.emit(0, "Running")
+        try:
+            message = job.func(job)
+            job.signals.finished.emit("Done", message or "")
+        except JobCancelled:
+            job.signals.finished.emit("Cancelled", "")
+        except Exception as e:
+            record_failure(job.kind, e)
+            job.signals.finished.emit("Failed", str(e))
+
+
+class Job:
+    """One queued job, func(job) runs in a pool thread."""
+
+    def __init__(self, kind, title, func):
+        self.kind = kind
+        self.title = title
+        self.func = func
+        self.status = "Queued"
+        self.started = None
+        self.ended = None
+        self.cancel_requested = False
+        self.signals = None
+        self.runnable = None
+
+    def post(self, func, *args):
+        """Run func(*args) in the GUI thread."""
+
+        self.signals.call.emit(lambda: func(*args))
+
+    def progress(self, percent, message=""):
+        """Report progress in percent."""
+
+        self.signals.progress.emit(int(percent), message)
+
+    def check_cancelled(self):
+        """Raise JobCancelled if the job was cancelled."""
+
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def elapsed(self):
+        """Seconds the job has been running, None before it started."""
+
+        if self.started is None:
+            return None
+        return (self.ended or time.monotonic()) - self.started
+
+
+class InlineJob(Job):
+    """Job run at once in the calling GUI thread, when there is no panel."""
+
+    def post(self, func, *args):
+        func(*args)
+
+    def progress(self, percent, message=""):
+        pass
+
+
+def run_job(panel, kind, title, func):
+    """Submit func(job) to panel, or run it right away without a panel."""
+
+    if panel is not None:
+        return panel.submit(kind, title, func)
+    job = InlineJob(kind, title, func)
+    try:
+        func(job)
+        job.status = "Done"
+    except Exception as e:
+        record_failure(kind, e)
+        job.status = "Failed"
+    return job
+
+
+class JobQueuePanel(QGroupBox):
+    """Job list with status, progress and elapsed time, retry and cancel."""
+
+    def __init__(self, max_threads=DEFAULT_MAX_THREADS):
+        super().__init__("Jobs")
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.jobs = []
+
+        layout = QVBoxLayout()
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Job", "Status", "Progress", "Elapsed", "Message"])
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.tree.setColumnWidth(0, 260)
+
+        buttons = QHBoxLayout()
+        self.retry_button = QPushButton("Retry")
+        self.retry_button.clicked.connect(self.retry_selected)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_selected)
+        self.clear_button = QPushButton("Clear Finished")
+        self.clear_button.clicked.connect(self.clear_finished)
+        self.threads = QSpinBox()
+        self.threads.setRange(1, 64)
+        self.threads.setValue(max_threads)
+        self.threads.valueChanged.connect(self.pool.setMaxThreadCount)
+        self.summary = QLabel()
+        buttons.addWidget(self.retry_button)
+        buttons.addWidget(self.cancel_button)
+        buttons.addWidget(self.clear_button)
+        buttons.addStretch()
+        buttons.addWidget(self.summary)
+        buttons.addWidget(QLabel("Concurrent jobs:"))
+        buttons.addWidget(self.threads)
+
+        layout.addWidget(self.tree)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh_elapsed)
+        self.timer.start(ELAPSED_REFRESH_MS)
+        self.update_summary()
+
+    def submit(self, kind, title, func):
+        """Queue func(job) as a new job and return the Job."""
+
+        job = Job(kind, title, func)
+        job.item = QTreeWidgetItem([title, "Queued", "", "", ""])
+        job.bar = QProgressBar()
+        job.bar.setRange(0, 100)
+        job.bar.setValue(0)
+        self.tree.addTopLevelItem(job.item)
+        self.tree.setItemWidget(job.item, 2, job.bar)
+        self.jobs.append(job)
+        self._start(job)
+        return job
+
+    def _start(self, job):
+        job.status = "Queued"
+        job.started = job.ended = None
+        job.cancel_requested = False
+        job.item.setText(1, "Queued")
+        job.item.setText(4, "")
+        job.bar.setValue(0)
+        # fresh signal connections of this run only
+        job.signals = _JobSignals()
+        job.signals.call.connect(lambda call: call())
+        job.signals.progress.connect(lambda percent, message: self._on_progress(job, percent, message))
+        job.signals.finished.connect(lambda status, message: self._on_finished(job, status, message))
+        job.runnable = _JobRunnable(job)
+        QUEUE_DEPTH.inc(queue="gui")
+        self.pool.start(job.runnable)
+        self.update_summary()
+
+    def _on_progress(self, job, percent, message):
+        if job.status == "Queued":
+            job.status = "Running"
+            job.item.setText(1, "Running")
+            self.update_summary()
+        job.bar.setValue(percent)
+        if message:
+            job.item.setText(4, message)
+
+    def _on_finished(self, job, status, message):
+        QUEUE_DEPTH.dec(queue="gui")
+        job.status = status
+        job.ended = time.monotonic() if job.started is not None else None
+        job.item.setText(1, status)
+        job.item.setText(4, message)
+        if status == "Done":
+            job.bar.setValue(100)
+        self.refresh_elapsed()
+        self.update_summary()
+
+    def selected_jobs(self):
+        """Jobs of the selected rows."""
+
+        selected = set(id(item) for item in self.tree.selectedItems())
+        return [job for job in self.jobs if id(job.item) in selected]
+
+    def retry_selected(self):
+        """Queue failed or cancelled selected jobs again."""
+
+        for job in self.selected_jobs():
+            if job.status in ("Failed", "Cancelled"):
+                self._start(job)
+
+    def cancel_selected(self):
+        """Cancel selected jobs, running ones stop at their next check."""
+
+        for job in self.selected_jobs():
+            if job.status == "Queued" and self.pool.tryTake(job.runnable):
+                self._on_finished(job, "Cancelled", "")
+            elif job.status in ("Queued", "Running"):
+                job.cancel_requested = True
+                job.item.setText(1, "Cancelling")
+
+    def clear_finished(self):
+        """Remove done, failed and cancelled jobs from the list."""
+
+        for job in [job for job in self.jobs if job.status in ("Done", "Failed", "Cancelled")]:
+            self.tree.takeTopLevelItem(self.tree.indexOfTopLevelItem(job.item))
+            self.jobs.remove(job)
+        self.update_summary()
+
+    def refresh_elapsed(self):
+        """Update elapsed time of started jobs."""
+
+        for job in self.jobs:
+            elapsed = job.elapsed()
+            if elapsed is not None:
+                job.item.setText(3, f"{elapsed:.1f} s")
+
+    def update_summary(self):
+        """Show job counts by status."""
+
+        counts = {}
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        self.summary.setText(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+
+    def wait(self, msecs=-1):
+        """Block until all jobs finished, for scripts and shutdown."""
+
+        return self.pool.waitForDone(msecs)
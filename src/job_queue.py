@@ -0,0 +1,269 @@
+"""@package docstring
+Shared job queue for signing batches on several worker nodes.
+
+A coordinator enqueues signing jobs, any number of worker processes on
+one or more machines lease them. A lease is only valid until its
+visibility timeout; workers renew it with heartbeats while signing, so
+jobs of crashed or stalled workers become visible again and are retried
+by others, up to max_attempts. The SQLite broker works on one machine
+and on a shared filesystem with working POSIX locks (rollback journal,
+no WAL). Other brokers implement JobBroker.
+
+Run `python cli.py queue enqueue --queue jobs.db *.pdf` and
+`python cli.py queue work --queue jobs.db --key signer.key --cert signer.pem`
+on every node.
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import contextlib
+from collections import namedtuple
+
+from metrics import QUEUE_DEPTH, record_failure
+from tracing import span
+
+## Seconds a lease stays valid without heartbeat.
+DEFAULT_VISIBILITY_TIMEOUT = 60
+DEFAULT_MAX_ATTEMPTS = 3
+JOB_STATES = ("pending", "leased", "done", "failed")
+
+Job = namedtuple("Job", ["id", "pdf_file", "output_file", "options", "attempts", "lease_token"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pdf_file TEXT NOT NULL,
+    output_file TEXT NOT NULL,
+    options TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    error TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, lease_expires);
+"""
+
+
+def default_worker_id():
+    """Worker name unique across hosts and processes."""
+
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobBroker:
+    """Interface of a job queue with leases."""
+
+    def enqueue(self, jobs, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Add (pdf_file, output_file, options dict) jobs, return their ids."""
+
+        raise NotImplementedError
+
+    def lease(self, worker, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Lease the oldest visible job, return Job or None if there is none."""
+
+        raise NotImplementedError
+
+    def heartbeat(self, job, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Extend lease of job, return False if it was lost to another worker."""
+
+        raise NotImplementedError
+
+    def complete(self, job):
+        """Mark leased job done, return False if the lease was lost."""
+
+        raise NotImplementedError
+
+    def fail(self, job, error):
+        """Release leased job for retry, or fail it after its last attempt."""
+
+        raise NotImplementedError
+
+    def counts(self):
+        """Number of jobs by state."""
+
+        raise NotImplementedError
+
+
+class SQLiteJobBroker(JobBroker):
+    """JobBroker in an SQLite database shared by all nodes."""
+
+    def __init__(self, path, timeout=30.0):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = DELETE")
+        self._conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            # takes the write lock up front, so concurrent leases cannot pick the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, jobs, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        now = time.time()
+        with self._transaction() as conn:
+            ids = [
+                conn.execute(
+                    "INSERT INTO jobs (pdf_file, output_file, options, max_attempts, updated) VALUES (?, ?, ?, ?, ?)",
+                    (pdf_file, output_file, json.dumps(options or {}), max_attempts, now)
+                ).lastrowid
+                for pdf_file, output_file, options in jobs
+            ]
+        return ids
+
+    def lease(self, worker, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._transaction() as conn:
+            # expired leases of jobs without attempts left are given up
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', error = 'lease expired', lease_token = NULL, updated = ? "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= max_attempts", (now, now)
+            )
+            row = conn.execute(
+                "SELECT id, pdf_file, output_file, options, attempts FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, pdf_file, output_file, options, attempts = row
+            token = os.urandom(8).hex()
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', attempts = ?, worker = ?, lease_token = ?, lease_expires = ?, "
+                "updated = ? WHERE id = ?",
+                (attempts + 1, worker, token, now + visibility_timeout, now, job_id)
+            )
+        return Job(job_id, pdf_file, output_file, json.loads(options), attempts + 1, token)
+
+    def heartbeat(self, job, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                (now + visibility_timeout, now, job.id, job.lease_token)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'done', error = NULL, lease_token = NULL, updated = ? "
+                "WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                (time.time(), job.id, job.lease_token)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job, error):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_token = NULL, updated = ? WHERE id = ? AND state = 'leased' AND lease_token = ?",
+                (str(error), time.time(), job.id, job.lease_token)
+            )
+        return cursor.rowcount == 1
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def failed_jobs(self):
+        """(id, pdf_file, attempts, error) of failed jobs."""
+
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, pdf_file, attempts, error FROM jobs WHERE state = 'failed' ORDER BY id"
+            ).fetchall()
+
+    def close(self):
+        """Close database connection."""
+
+        self._conn.close()
+
+
+class _Heartbeat:
+    """Renews a lease in the background while the with block runs."""
+
+    def __init__(self, broker, job, visibility_timeout):
+        self.broker = broker
+        self.job = job
+        self.visibility_timeout = visibility_timeout
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        # renew three times per timeout, so one missed beat does not lose the lease
+        while not self._stop.wait(self.visibility_timeout / 3):
+            try:
+                if not self.broker.heartbeat(self.job, self.visibility_timeout):
+                    self.lost = True
+                    return
+            except sqlite3.Error:
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(broker, process_job, worker=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+               poll_interval=1.0, exit_when_idle=False, stop_event=None, log=None):
+    """Lease and process jobs until stopped, return (done, failed) counts.
+
+    process_job(job) signs one job and raises on failure. With
+    exit_when_idle the worker returns once no job is visible.
+    """
+
+    worker = worker or default_worker_id()
+    stop_event = stop_event or threading.Event()
+    log = log or (lambda message: None)
+    done = failed = 0
+    while not stop_event.is_set():
+        with span("lease_job", worker=worker):
+            job = broker.lease(worker, visibility_timeout)
+        if job is None:
+            QUEUE_DEPTH.set(0, queue="distributed")
+            if exit_when_idle:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        QUEUE_DEPTH.set(broker.counts()['pending'], queue="distributed")
+        with _Heartbeat(broker, job, visibility_timeout) as heartbeat:
+            try:
+                process_job(job)
+                error = None
+            except Exception as e:
+                record_failure("queue_job", e)
+                error = e
+        if heartbeat.lost:
+            log(f"Lease of job {job.id} ({job.pdf_file}) lost, result discarded")
+        elif error is None and broker.complete(job):
+            done += 1
+            log(f"Job {job.id} done: {job.pdf_file} -> {job.output_file}")
+        elif error is not None and broker.fail(job, error):
+            failed += 1
+            log(f"Job {job.id} attempt {job.attempts} failed: {job.pdf_file}: {error}")
+    return done, failed
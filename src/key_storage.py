@@ -0,0 +1,426 @@
+"""@package docstring
+Passphrase-protected private key files with a selectable KDF.
+
+Keys are written as standard PKCS#8 EncryptedPrivateKeyInfo (PBES2 with
+AES-256-CBC) in PEM, so OpenSSL, cryptography and pyhanko read them as
+before; only the key derivation and its cost are chosen here:
+
+- scrypt: cost is N (a power of two), memory-hard, the default;
+- pbkdf2: cost is the number of HMAC-SHA256 iterations.
+
+Every unlock pays the full KDF cost; that is the point, since a brute
+force attack pays it per guess (see `python bench.py unlock`). Batch
+jobs and pool threads therefore unlock a key once and share the result
+through UnlockedKeyCache. Its copy of the decrypted key is mlock()ed
+where allowed and zeroed by a timer once idle; signers are built from it
+per document, and the key objects they hold are ordinary Python objects
+that are freed, not zeroed, when signing ends.
+
+A PKCS#12 bundle (.p12/.pfx) holds key, certificate and chain in one
+file, so a signer is loaded with one read and one decryption instead of
+parsing key, certificate and every chain file separately.
+"""
+import os
+import time
+import ctypes
+import ctypes.util
+import hmac
+import hashlib
+import secrets
+import threading
+
+from asn1crypto import core, pem, keys as asn1_keys, x509 as asn1_x509
+from cryptography.hazmat.primitives import padding, serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.hazmat.primitives import hashes
+from pyhanko.sign import signers
+from pyhanko.keys import load_cert_from_pemder
+from pyhanko_certvalidator.registry import SimpleCertificateStore
+
+from metrics import record_failure
+from tracing import span
+
+KDFS = ("scrypt", "pbkdf2")
+DEFAULT_KDF = "scrypt"
+## Default cost per KDF: scrypt N, PBKDF2-HMAC-SHA256 iterations.
+DEFAULT_KDF_COST = {"scrypt": 2 ** 14, "pbkdf2": 600000}
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELIZATION = 1
+## OpenSSL refuses scrypt parameters needing more memory than this when reading keys.
+SCRYPT_MAX_MEMORY = 32 * 1024 ** 2
+## Generated passphrases, 5 bits per character without look-alikes (0/o, 1/l/i).
+PASSPHRASE_ALPHABET = "abcdefghjkmnpqrstuvwxyz23456789"
+DEFAULT_PASSPHRASE_LENGTH = 24
+## File extensions loaded as PKCS#12 bundles (key, certificate and chain).
+PKCS12_EXTENSIONS = (".p12", ".pfx")
+## Seconds an unused unlocked key stays in the cache.
+DEFAULT_CACHE_TTL = 15 * 60
+
+_PBES2 = "1.2.840.113549.1.5.13"
+_PBKDF2 = "1.2.840.113549.1.5.12"
+_SCRYPT = "1.3.6.1.4.1.11591.4.11"
+_HMAC_SHA256 = "1.2.840.113549.2.9"
+_AES256_CBC = "2.16.840.1.101.3.4.1.42"
+
+
+class _AlgorithmIdentifier(core.Sequence):
+    _fields = [('algorithm', core.ObjectIdentifier), ('parameters', core.Any, {'optional': True})]
+
+
+class _Pbkdf2Params(core.Sequence):
+    _fields = [
+        ('salt', core.OctetString), ('iteration_count', core.Integer),
+        ('key_length', core.Integer, {'optional': True}), ('prf', _AlgorithmIdentifier),
+    ]
+
+
+class _ScryptParams(core.Sequence):
+    # RFC 7914 section 7
+    _fields = [
+        ('salt', core.OctetString), ('cost_parameter', core.Integer), ('block_size', core.Integer),
+        ('parallelization_parameter', core.Integer), ('key_length', core.Integer, {'optional': True}),
+    ]
+
+
+class _Pbes2Params(core.Sequence):
+    _fields = [('key_derivation_func', _AlgorithmIdentifier), ('encryption_scheme', _AlgorithmIdentifier)]
+
+
+class _EncryptedPrivateKeyInfo(core.Sequence):
+    _fields = [('encryption_algorithm', _AlgorithmIdentifier), ('encrypted_data', core.OctetString)]
+
+
+def validate_kdf_cost(kdf, cost):
+    """Raise ValueError for costs readers would reject or that are trivially weak."""
+
+    if kdf not in KDFS:
+        raise ValueError(f"Unknown KDF: {kdf}")
+    if kdf == "scrypt":
+        if cost < 2 ** 10 or cost & (cost - 1):
+            raise ValueError(f"scrypt cost must be a power of two from 1024 on, got {cost}.")
+        if 128 * SCRYPT_BLOCK_SIZE * (cost + SCRYPT_PARALLELIZATION + 1) > SCRYPT_MAX_MEMORY:
+            raise ValueError(f"scrypt cost {cost} needs more than {SCRYPT_MAX_MEMORY // 1024 ** 2} MiB, "
+                             f"which OpenSSL refuses to read; use pbkdf2 for a higher cost.")
+    elif cost < 10000:
+        raise ValueError(f"PBKDF2 needs at least 10000 iterations, got {cost}.")
+
+
+def _derive(kdf, cost, salt, passphrase):
+    if kdf == "scrypt":
+        return Scrypt(salt=salt, length=32, n=cost, r=SCRYPT_BLOCK_SIZE, p=SCRYPT_PARALLELIZATION).derive(passphrase)
+    return PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=cost).derive(passphrase)
+
+
+def encrypt_private_key(private_key, passphrase, kdf=DEFAULT_KDF, cost=None):
+    """PEM of a cryptography private key encrypted with the passphrase."""
+
+    cost = cost or DEFAULT_KDF_COST[kdf]
+    validate_kdf_cost(kdf, cost)
+    passphrase = passphrase.encode() if isinstance(passphrase, str) else passphrase
+    salt = os.urandom(16)
+    iv = os.urandom(16)
+    if kdf == "scrypt":
+        kdf_params = _ScryptParams({
+            'salt': salt, 'cost_parameter': cost, 'block_size': SCRYPT_BLOCK_SIZE,
+            'parallelization_parameter': SCRYPT_PARALLELIZATION, 'key_length': 32,
+        })
+        kdf_oid = _SCRYPT
+    else:
+        kdf_params = _Pbkdf2Params({
+            'salt': salt, 'iteration_count': cost, 'key_length': 32,
+            'prf': {'algorithm': _HMAC_SHA256, 'parameters': core.Null()},
+        })
+        kdf_oid = _PBKDF2
+
+    with span("derive_key", kdf=kdf, cost=cost):
+        key = _derive(kdf, cost, salt, passphrase)
+    der = private_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    encrypted = encryptor.update(padder.update(der) + padder.finalize()) + encryptor.finalize()
+
+    info = _EncryptedPrivateKeyInfo({
+        'encryption_algorithm': {
+            'algorithm': _PBES2,
+            'parameters': _Pbes2Params({
+                'key_derivation_func': {'algorithm': kdf_oid, 'parameters': kdf_params},
+                'encryption_scheme': {'algorithm': _AES256_CBC, 'parameters': core.OctetString(iv)},
+            }),
+        },
+        'encrypted_data': encrypted,
+    })
+    return pem.armor("ENCRYPTED PRIVATE KEY", info.dump())
+
+
+def write_private_key(private_key, path, passphrase=None, kdf=DEFAULT_KDF, cost=None):
+    """Write a private key as PEM, encrypted when a passphrase is given."""
+
+    if passphrase:
+        data = encrypt_private_key(private_key, passphrase, kdf, cost)
+    else:
+        data = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def is_pkcs12(path):
+    """Whether path names a PKCS#12 bundle, by extension."""
+
+    return os.path.splitext(path)[1].lower() in PKCS12_EXTENSIONS
+
+
+def write_pkcs12(private_key, cert, ca_certs, path, passphrase=None, kdf=DEFAULT_KDF, cost=None):
+    """Write key, leaf certificate and chain as one PKCS#12 bundle.
+
+    PKCS#12 only knows PBKDF2, so a scrypt choice falls back to the
+    default PBKDF2 cost.
+    """
+
+    if passphrase:
+        iterations = cost if kdf == "pbkdf2" and cost else DEFAULT_KDF_COST["pbkdf2"]
+        validate_kdf_cost("pbkdf2", iterations)
+        encryption = (serialization.PrivateFormat.PKCS12.encryption_builder()
+                      .kdf_rounds(iterations)
+                      .key_cert_algorithm(pkcs12.PBES.PBESv2SHA256AndAES256CBC)
+                      .hmac_hash(hashes.SHA256())
+                      .build(passphrase.encode() if isinstance(passphrase, str) else passphrase))
+    else:
+        encryption = serialization.NoEncryption()
+    data = pkcs12.serialize_key_and_certificates(None, private_key, cert, list(ca_certs) or None, encryption)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_passphrase(length=DEFAULT_PASSPHRASE_LENGTH):
+    """Random passphrase in groups of four, 5 bits per character."""
+
+    characters = "".join(secrets.choice(PASSPHRASE_ALPHABET) for _ in range(length))
+    return "-".join(characters[i:i + 4] for i in range(0, length, 4))
+
+
+def _mlock(buffer):
+    # keeps the unlocked key out of swap where supported, best effort
+    libc_name = ctypes.util.find_library("c")
+    if not libc_name:
+        return False
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        address = ctypes.addressof(ctypes.c_char.from_buffer(buffer))
+        return libc.mlock(ctypes.c_void_p(address), ctypes.c_size_t(len(buffer))) == 0
+    except (OSError, AttributeError, TypeError):
+        return False
+
+
+class _UnlockedKey:
+    def __init__(self, der, certs=()):
+        self.der = bytearray(der)
+        # certificates of a PKCS#12 bundle, public and kept as is
+        self.certs = tuple(certs)
+        self.locked = _mlock(self.der)
+        self.last_used = time.monotonic()
+
+    def wipe(self):
+        for i in range(len(self.der)):
+            self.der[i] = 0
+
+
+def _identity(der, certs):
+    return (asn1_keys.PrivateKeyInfo.load(bytes(der)),
+            [asn1_x509.Certificate.load(cert) for cert in certs])
+
+
+class UnlockedKeyCache:
+    """Decrypted keys shared by the threads of a batch.
+
+    Entries are keyed by file, its modification time and an HMAC of the
+    passphrase under a per-process secret, so a wrong passphrase never
+    gets a cached key and the passphrase itself is not kept. Key bytes
+    are held in mlock()ed memory where allowed and overwritten when the
+    cache is cleared or, by a background timer, ttl idle seconds after
+    last use, also in a process that stays idle. Callers get fresh
+    asn1crypto objects that are not wiped; keep them only as long as needed.
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL):
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._unlocking = {}
+        self._sweeper = None
+
+    def _cache_key(self, key_file, passphrase):
+        stat = os.stat(key_file)
+        tag = hmac.new(self._secret, passphrase or b"", hashlib.sha256).digest()
+        return os.path.abspath(key_file), stat.st_mtime_ns, tag
+
+    def _expire(self, now):
+        for cache_key in [k for k, entry in self._entries.items() if now - entry.last_used >= self.ttl]:
+            self._entries.pop(cache_key).wipe()
+            self._unlocking.pop(cache_key, None)
+
+    def _schedule_sweep(self):
+        # called with the lock held; one timer, due when the oldest entry expires
+        if self._sweeper is not None or not self._entries:
+            return
+        oldest = min(entry.last_used for entry in self._entries.values())
+        self._sweeper = threading.Timer(max(0.0, oldest + self.ttl - time.monotonic()), self._sweep)
+        self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def _sweep(self):
+        with self._lock:
+            self._sweeper = None
+            self._expire(time.monotonic())
+            self._schedule_sweep()
+
+    def _cached(self, cache_key):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            entry.last_used = now
+            # fresh asn1crypto objects per caller, they are not thread-safe
+            return _identity(entry.der, entry.certs)
+
+    def private_key_info(self, key_file, passphrase=None):
+        """asn1crypto PrivateKeyInfo of a key file, unlocked at most once per ttl."""
+
+        return self.identity(key_file, passphrase)[0]
+
+    def identity(self, key_file, passphrase=None):
+        """(PrivateKeyInfo, certificates) of a key file or PKCS#12 bundle.
+
+        Certificates are those of the bundle, leaf first, and empty for
+        plain key files.
+        """
+
+        # an empty passphrase means none, as for SimpleSigner.load
+        passphrase = passphrase or None
+        passphrase = passphrase.encode() if isinstance(passphrase, str) else passphrase
+        cache_key = self._cache_key(key_file, passphrase)
+        identity = self._cached(cache_key)
+        if identity is not None:
+            return identity
+        with self._lock:
+            unlocking = self._unlocking.setdefault(cache_key, threading.Lock())
+        # threads starting together wait for one KDF run instead of running their own
+        with unlocking:
+            identity = self._cached(cache_key)
+            if identity is not None:
+                return identity
+            certs = []
+            with span("unlock_key", file=key_file):
+                with open(key_file, "rb") as f:
+                    data = f.read()
+                if is_pkcs12(key_file):
+                    private_key, cert, additional_certs = pkcs12.load_key_and_certificates(data, passphrase)
+                    if private_key is None or cert is None:
+                        raise ValueError(f"{key_file} holds no private key and certificate.")
+                    certs = [c.public_bytes(serialization.Encoding.DER) for c in [cert] + additional_certs]
+                else:
+                    private_key = (serialization.load_pem_private_key if pem.detect(data)
+                                   else serialization.load_der_private_key)(data, passphrase)
+                der = private_key.private_bytes(
+                    encoding=serialization.Encoding.DER,
+                    format=serialization.PrivateFormat.PKCS8,
+                    encryption_algorithm=serialization.NoEncryption()
+                )
+                entry = _UnlockedKey(der, certs)
+                # immutable bytes and the key object cannot be zeroed, drop them right away
+                del der, private_key
+            with self._lock:
+                self._entries[cache_key] = entry
+                self._schedule_sweep()
+                return _identity(entry.der, entry.certs)
+
+    def clear(self):
+        """Wipe and drop all unlocked keys."""
+
+        with self._lock:
+            if self._sweeper is not None:
+                self._sweeper.cancel()
+                self._sweeper = None
+            for entry in self._entries.values():
+                entry.wipe()
+            self._entries.clear()
+            self._unlocking.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _reset_after_fork(self):
+        # the sweeper thread is not copied and may have held the lock at fork time
+        self._lock = threading.Lock()
+        self._unlocking = {}
+        self._sweeper = None
+        with self._lock:
+            for entry in self._entries.values():
+                # memory locks are not inherited
+                entry.locked = _mlock(entry.der)
+            self._schedule_sweep()
+
+
+_key_cache = None
+_key_cache_lock = threading.Lock()
+
+
+def _reset_key_cache_after_fork():
+    global _key_cache_lock
+    _key_cache_lock = threading.Lock()
+    if _key_cache is not None:
+        _key_cache._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_key_cache_after_fork)
+
+
+def get_key_cache():
+    """Process-wide UnlockedKeyCache, created on first use."""
+
+    global _key_cache
+    with _key_cache_lock:
+        if _key_cache is None:
+            _key_cache = UnlockedKeyCache()
+        return _key_cache
+
+
+def load_signer(key_file, cert_file=None, ca_chain_files=(), passphrase=None, key_cache=None):
+    """SimpleSigner like SimpleSigner.load, with the key unlocked through the cache.
+
+    key_file may be a PKCS#12 bundle; its certificate and chain are used
+    unless cert_file is given, ca_chain_files are added to its chain.
+    Raises ValueError naming the cause when key or certificate cannot be
+    loaded, e.g. on a wrong passphrase.
+    """
+
+    key_cache = key_cache if key_cache is not None else get_key_cache()
+    try:
+        signing_key, bundle_certs = key_cache.identity(key_file, passphrase)
+        if cert_file:
+            signing_cert = load_cert_from_pemder(cert_file)
+        elif bundle_certs:
+            signing_cert = bundle_certs[0]
+        else:
+            raise ValueError(f"No certificate for {key_file}.")
+        ca_chain = bundle_certs[1:] + [load_cert_from_pemder(path) for path in ca_chain_files]
+    except (OSError, ValueError, TypeError) as e:
+        record_failure("key_load", e)
+        raise ValueError(f"Could not load signer key {key_file}: {e}") from e
+    cert_registry = SimpleCertificateStore()
+    cert_registry.register_multiple(ca_chain)
+    return signers.SimpleSigner(signing_cert=signing_cert, signing_key=signing_key, cert_registry=cert_registry)
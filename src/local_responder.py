@@ -0,0 +1,257 @@
+"""@package docstring
+Local stand-in CRL distribution point and OCSP responder.
+
+Meant for offline tests of revocation checking. Every certificate is
+reported good unless its serial number was revoked. Run
+`python local_responder.py --cert CA.pem --key CA.key --revoke 1234 --port 8082`.
+
+Endpoints:
+  GET  /crl/<issuer key id>.crl  -> DER CRL of that issuer
+  POST /ocsp                     application/ocsp-request -> application/ocsp-response
+"""
+import time
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+from asn1crypto import x509 as asn1_x509
+from cryptography import x509
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import AuthorityInformationAccessOID
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+DEFAULT_VALIDITY = datetime.timedelta(days=1)
+
+
+def issuer_key_id(public_key):
+    """Hex key identifier of an issuer public key, used in CRL URLs."""
+
+    return x509.SubjectKeyIdentifier.from_public_key(public_key).digest.hex()
+
+
+def crl_url(base_url, issuer_public_key):
+    """URL of the CRL issued by the key, published under base_url."""
+
+    return f"{base_url.rstrip('/')}/crl/{issuer_key_id(issuer_public_key)}.crl"
+
+
+def ocsp_url(base_url):
+    """URL of the OCSP responder under base_url."""
+
+    return f"{base_url.rstrip('/')}/ocsp"
+
+
+def revocation_extensions(base_url, issuer_public_key):
+    """CRL distribution point and AIA extensions pointing to base_url.
+
+    Returns list of (extension, critical) for a cryptography CertificateBuilder.
+    """
+
+    return [
+        (x509.CRLDistributionPoints([x509.DistributionPoint(
+            full_name=[x509.UniformResourceIdentifier(crl_url(base_url, issuer_public_key))],
+            relative_name=None, reasons=None, crl_issuer=None
+        )]), False),
+        (x509.AuthorityInformationAccess([x509.AccessDescription(
+            AuthorityInformationAccessOID.OCSP, x509.UniformResourceIdentifier(ocsp_url(base_url))
+        )]), False),
+    ]
+
+
+class RevocationResponder:
+    """Threaded HTTP server publishing CRLs and answering OCSP requests."""
+
+    def __init__(self, issuers, revoked=(), host="127.0.0.1", port=0,
+                 validity=DEFAULT_VALIDITY, delay=0.0):
+        # issuers: list of (cryptography certificate, private key)
+        self.issuers = list(issuers)
+        self.revoked = {int(serial): datetime.datetime.now(datetime.UTC) for serial in revoked}
+        self.validity = validity
+        self.delay = delay
+        self.crl_requests = 0
+        self.ocsp_requests = 0
+        self._crls = {}
+        self._lock = threading.Lock()
+
+        self._by_key_id = {}
+        self._by_key_hash = {}
+        for cert, key in self.issuers:
+            self._by_key_id[issuer_key_id(cert.public_key())] = (cert, key)
+            public_key_info = asn1_x509.Certificate.load(cert.public_bytes(serialization.Encoding.DER)).public_key
+            self._by_key_hash[public_key_info.sha1] = (cert, key)
+            self._by_key_hash[public_key_info.sha256] = (cert, key)
+        responder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body, content_type):
+                if responder.delay:
+                    time.sleep(responder.delay)
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                name = self.path.rstrip('/').rsplit('/', 1)[-1]
+                if not (self.path.startswith('/crl/') and name.endswith('.crl')):
+                    self.send_error(404)
+                    return
+                body = responder.crl_bytes(name[:-len('.crl')])
+                if body is None:
+                    self.send_error(404)
+                    return
+                responder.crl_requests += 1
+                self._reply(body, 'application/pkix-crl')
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/ocsp':
+                    self.send_error(404)
+                    return
+                try:
+                    request = ocsp.load_der_ocsp_request(
+                        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    )
+                    body = responder.ocsp_response_for(request)
+                except Exception:
+                    body = ocsp.OCSPResponseBuilder.build_unsuccessful(
+                        ocsp.OCSPResponseStatus.MALFORMED_REQUEST
+                    ).public_bytes(serialization.Encoding.DER)
+                responder.ocsp_requests += 1
+                self._reply(body, 'application/ocsp-response')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    def revoke(self, serial_number):
+        """Revoke certificate by serial number."""
+
+        with self._lock:
+            self.revoked[int(serial_number)] = datetime.datetime.now(datetime.UTC)
+            self._crls.clear()
+
+    def crl_bytes(self, key_id):
+        """DER CRL of the issuer with the key identifier, or None."""
+
+        issuer = self._by_key_id.get(key_id)
+        return self.crl_for(*issuer) if issuer else None
+
+    def crl_for(self, issuer_cert, issuer_key):
+        """DER CRL of issuer, rebuilt only after a revocation."""
+
+        key_id = issuer_key_id(issuer_cert.public_key())
+        with self._lock:
+            if key_id not in self._crls:
+                now = datetime.datetime.now(datetime.UTC)
+                builder = (x509.CertificateRevocationListBuilder()
+                    .issuer_name(issuer_cert.subject)
+                    .last_update(now)
+                    .next_update(now + self.validity))
+                for serial_number, revocation_date in self.revoked.items():
+                    builder = builder.add_revoked_certificate(x509.RevokedCertificateBuilder()
+                        .serial_number(serial_number)
+                        .revocation_date(revocation_date)
+                        .build())
+                self._crls[key_id] = builder.sign(issuer_key, hashes.SHA256()).public_bytes(
+                    serialization.Encoding.DER
+                )
+            return self._crls[key_id]
+
+    def ocsp_response_for(self, request):
+        """Signed DER OCSP response for a parsed cryptography OCSP request."""
+
+        issuer = self._by_key_hash.get(request.issuer_key_hash)
+        if issuer is None:
+            return ocsp.OCSPResponseBuilder.build_unsuccessful(
+                ocsp.OCSPResponseStatus.UNAUTHORIZED
+            ).public_bytes(serialization.Encoding.DER)
+        issuer_cert, issuer_key = issuer
+
+        now = datetime.datetime.now(datetime.UTC)
+        revocation_time = self.revoked.get(request.serial_number)
+        builder = (ocsp.OCSPResponseBuilder()
+            .add_response_by_hash(
+                issuer_name_hash=request.issuer_name_hash,
+                issuer_key_hash=request.issuer_key_hash,
+                serial_number=request.serial_number,
+                algorithm=request.hash_algorithm,
+                cert_status=ocsp.OCSPCertStatus.GOOD if revocation_time is None else ocsp.OCSPCertStatus.REVOKED,
+                this_update=now,
+                next_update=now + self.validity,
+                revocation_time=revocation_time,
+                revocation_reason=None)
+            .responder_id(ocsp.OCSPResponderEncoding.HASH, issuer_cert))
+        return builder.sign(issuer_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+
+    @property
+    def url(self):
+        """Base URL of the running responder."""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def load_issuer(cert, key, passphrase=None):
+    """Load (certificate, private key) of a CA from PEM files."""
+
+    with open(cert, 'rb') as f:
+        issuer_cert = x509.load_pem_x509_certificate(f.read())
+    with open(key, 'rb') as f:
+        issuer_key = load_pem_private_key(f.read(), passphrase.encode() if passphrase else None)
+    return issuer_cert, issuer_key
+
+
+@click.command()
+@click.option("--cert", "certs", multiple=True, required=True, type=click.Path(exists=True),
+              help="CA certificate, once per CA.")
+@click.option("--key", "keys", multiple=True, required=True, type=click.Path(exists=True),
+              help="CA private key, in the same order as --cert.")
+@click.option("--passphrase", default=None, help="CA private key passphrase.")
+@click.option("--revoke", multiple=True, type=int, help="Serial number to report as revoked.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8082, show_default=True)
+@click.option("--validity-hours", default=24, show_default=True, help="Time until nextUpdate.")
+@click.option("--delay", default=0.0, show_default=True, help="Artificial latency per request in seconds.")
+def main(certs, keys, passphrase, revoke, host, port, validity_hours, delay):
+    """Run local stand-in CRL/OCSP responder."""
+
+    if len(certs) != len(keys):
+        raise click.UsageError("Every --cert needs a matching --key.")
+    responder = RevocationResponder(
+        [load_issuer(cert, key, passphrase) for cert, key in zip(certs, keys)],
+        revoked=revoke, host=host, port=port,
+        validity=datetime.timedelta(hours=validity_hours), delay=delay
+    )
+    click.echo(f"Revocation responder listening on {responder.url}")
+    try:
+        responder.server.serve_forever()
+    except KeyboardInterrupt:
+        responder.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""@package docstring
+Local stand-in RFC 3161 timestamp authority.
+
+Meant for offline tests and latency benchmarks only, it grants every
+request. Run `python local_tsa.py --port 8080` and use
+http://127.0.0.1:8080/ as TSA URL.
+"""
+import time
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+from asn1crypto import keys as asn1_keys, x509 as asn1_x509, tsp
+from cryptography import x509
+from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from pyhanko.keys import load_cert_from_pemder, load_private_key_from_pemder
+from pyhanko.sign.timestamps.dummy_client import DummyTimeStamper
+
+
+def generate_tsa_identity(common_name="Local Test TSA"):
+    """Generate self-signed TSA certificate and key as asn1crypto objects."""
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.UTC)
+    cert = (x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.TIME_STAMPING]), critical=True)
+        .add_extension(x509.KeyUsage(
+            digital_signature=True,
+            content_commitment=False,
+            key_encipherment=False,
+            data_encipherment=False,
+            key_agreement=False,
+            key_cert_sign=False,
+            crl_sign=False,
+            encipher_only=False,
+            decipher_only=False),
+            critical=True)
+        .sign(key, hashes.SHA256()))
+
+    asn1_cert = asn1_x509.Certificate.load(cert.public_bytes(serialization.Encoding.DER))
+    asn1_key = asn1_keys.PrivateKeyInfo.load(key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    ))
+    return asn1_cert, asn1_key
+
+
+class LocalTSA:
+    """Threaded HTTP server answering timestamp requests."""
+
+    def __init__(self, host="127.0.0.1", port=0, tsa_cert=None, tsa_key=None, delay=0.0):
+        if tsa_cert is None or tsa_key is None:
+            tsa_cert, tsa_key = generate_tsa_identity()
+        self.tsa_cert = tsa_cert
+        self.delay = delay
+        self.request_count = 0
+        # handlers run on threads of their own
+        self._count_lock = threading.Lock()
+        timestamper = DummyTimeStamper(tsa_cert=tsa_cert, tsa_key=tsa_key)
+        tsa = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    req = tsp.TimeStampReq.load(self.rfile.read(length))
+                    body = timestamper.request_tsa_response(req).dump()
+                except Exception as e:
+                    self.send_error(400, f"Invalid timestamp request: {e}")
+                    return
+                if tsa.delay:
+                    time.sleep(tsa.delay)
+                with tsa._count_lock:
+                    tsa.request_count += 1
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/timestamp-reply')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL of the running TSA."""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """Serve requests in a background thread."""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8080, show_default=True)
+@click.option("--cert", type=click.Path(exists=True), help="TSA certificate (generated if omitted).")
+@click.option("--key", type=click.Path(exists=True), help="TSA private key.")
+@click.option("--passphrase", default=None, help="TSA private key passphrase.")
+@click.option("--delay", default=0.0, show_default=True, help="Artificial latency per request in seconds.")
+def main(host, port, cert, key, passphrase, delay):
+    """Run local stand-in timestamp authority."""
+
+    tsa_cert = tsa_key = None
+    if cert and key:
+        tsa_cert = load_cert_from_pemder(cert)
+        tsa_key = load_private_key_from_pemder(key, passphrase.encode() if passphrase else None)
+    tsa = LocalTSA(host, port, tsa_cert, tsa_key, delay)
+    click.echo(f"Local TSA listening on {tsa.url}")
+    try:
+        tsa.server.serve_forever()
+    except KeyboardInterrupt:
+        tsa.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""@package docstring
+PAdES-B-LT/LTA signing and batch LTV enrichment of signed documents.
+
+A batch shares one validation context and one set of revocation
+fetchers. Certificates, CRLs and OCSP responses common to many documents
+(e.g. everything above the signer certificate of one CA) are fetched and
+parsed once and the same objects, with their cached DER encoding, are
+written into every document's DSS.
+"""
+import os
+import asyncio
+
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.signers import PdfTimeStamper
+from pyhanko.sign.validation.dss import DocumentSecurityStore, collect_validation_info
+from pyhanko_certvalidator import ValidationContext
+
+from revocation import DEFAULT_CACHE_DIR, CachedFetcherBackend, get_revocation_cache
+
+PADES_LEVELS = ("B-B", "B-T", "B-LT", "B-LTA")
+## Levels requiring a signature timestamp.
+TIMESTAMPED_LEVELS = ("B-T", "B-LT", "B-LTA")
+## Levels embedding validation information.
+LTV_LEVELS = ("B-LT", "B-LTA")
+
+
+def split_trust_roots(certs):
+    """Split CA certificates into (self-signed roots, other certificates)."""
+
+    roots, others = [], []
+    for cert in certs:
+        # generated chains reuse names, so look at key identifiers too
+        is_root = cert.subject == cert.issuer and cert.authority_key_identifier in (None, cert.key_identifier)
+        (roots if is_root else others).append(cert)
+    return roots, others
+
+
+def build_ltv_context(trust_roots, other_certs=(), revocation_mode="hard-fail", cache_dir=DEFAULT_CACHE_DIR,
+                      fetchers=None):
+    """Validation context fetching revocation info through the shared cache."""
+
+    if fetchers is None:
+        fetchers = CachedFetcherBackend(get_revocation_cache(cache_dir)).get_fetchers()
+    return ValidationContext(
+        trust_roots=list(trust_roots),
+        other_certs=list(other_certs),
+        allow_fetching=True,
+        revocation_mode=revocation_mode,
+        fetchers=fetchers,
+    )
+
+
+def pades_meta_options(level, validation_context=None):
+    """PdfSignatureMetadata options of a PAdES baseline level."""
+
+    if level not in PADES_LEVELS:
+        raise ValueError(f"Unknown PAdES level: {level}")
+    if level not in LTV_LEVELS:
+        return {}
+    if validation_context is None:
+        raise ValueError(f"PAdES {level} requires a validation context.")
+    return {
+        'embed_validation_info': True,
+        'validation_context': validation_context,
+        'use_pades_lta': level == "B-LTA",
+    }
+
+
+class LTVResult:
+    """Outcome of adding validation info to one document."""
+
+    def __init__(self, pdf_file, output_file):
+        self.pdf_file = pdf_file
+        self.output_file = output_file
+        self.signatures = 0
+        self.error = None
+
+
+class LTVBatch:
+    """Add DSS validation info (and optionally an archive timestamp) to signed PDFs."""
+
+    def __init__(self, trust_roots, other_certs=(), revocation_mode="hard-fail",
+                 cache_dir=DEFAULT_CACHE_DIR, timestamper=None):
+        self.fetchers = CachedFetcherBackend(get_revocation_cache(cache_dir)).get_fetchers()
+        self.validation_context = build_ltv_context(
+            trust_roots, other_certs, revocation_mode, fetchers=self.fetchers
+        )
+        self.timestamper = timestamper
+
+    def _revinfo_for(self, paths):
+        certs, crls, ocsps = {}, {}, {}
+        for path in paths:
+            for cert in path:
+                certs[cert.issuer_serial] = cert
+                try:
+                    for crl_list in self.fetchers.crl_fetcher.fetched_crls_for_cert(cert):
+                        crls[id(crl_list)] = crl_list
+                except KeyError:
+                    pass
+                for response in self.fetchers.ocsp_fetcher.fetched_responses_for_cert(cert):
+                    ocsps[id(response)] = response
+        return list(certs.values()), list(crls.values()), list(ocsps.values())
+
+    async def _add_ltv(self, pdf_file, output_file, result):
+        with open(pdf_file, 'rb') as doc:
+            reader = PdfFileReader(doc)
+            embedded_sigs = reader.embedded_regular_signatures
+            if not embedded_sigs:
+                raise ValueError("No signatures found.")
+            pdf_out = IncrementalPdfFileWriter.from_reader(reader)
+            for embedded_sig in embedded_sigs:
+                paths = await collect_validation_info(embedded_sig, self.validation_context)
+                certs, crls, ocsps = self._revinfo_for(paths)
+                DocumentSecurityStore.supply_dss_in_writer(
+                    pdf_out, embedded_sig.pkcs7_content.hex().encode('ascii'),
+                    certs=certs, crls=crls, ocsps=ocsps
+                )
+                result.signatures += 1
+
+            # output_file may be pdf_file itself
+            tmp_file = f"{output_file}.tmp"
+            with open(tmp_file, 'w+b') as out:
+                pdf_out.write(out)
+                if self.timestamper is not None:
+                    # archive timestamp over the new DSS makes this PAdES-B-LTA
+                    await PdfTimeStamper(self.timestamper).async_timestamp_pdf(
+                        IncrementalPdfFileWriter(out), 'sha256',
+                        validation_context=self.validation_context, in_place=True
+                    )
+        os.replace(tmp_file, output_file)
+
+    async def _run(self, jobs, log):
+        results = []
+        for pdf_file, output_file in jobs:
+            result = LTVResult(pdf_file, output_file)
+            try:
+                await self._add_ltv(pdf_file, output_file, result)
+            except Exception as e:
+                result.error = e
+                log(f"Error adding LTV to {pdf_file}: {e}")
+            results.append(result)
+        return results
+
+    def add_ltv(self, jobs, log=None):
+        """Add validation info to (pdf_file, output_file) jobs.
+
+        Returns list of LTVResult, whose error is None on success.
+        """
+
+        return asyncio.run(self._run(list(jobs), log or (lambda message: None)))
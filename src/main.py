@@ -5,10 +5,13 @@ More details.
 """
 import sys
 import os
+import threading
+import contextlib
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog, 
                             QCheckBox, QTextEdit, QGroupBox, QFormLayout, QSpinBox,
-                            QListWidget, QListWidgetItem, QMessageBox, QRadioButton, QButtonGroup)
+                            QListWidget, QListWidgetItem, QMessageBox, QRadioButton, QButtonGroup,
+                            QComboBox, QTreeWidget, QTreeWidgetItem, QInputDialog, QSplitter)
 from PyQt5.QtCore import Qt, QTimer
 
 import click
@@ -16,17 +19,37 @@ import os
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.primitives.serialization import PrivateFormat, pkcs12, load_pem_private_key
+from cryptography.hazmat.primitives.serialization import PrivateFormat, load_pem_private_key
 from cryptography import x509
 from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
 import datetime
-from pyhanko.sign import signers, fields
-from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
-from pyhanko.sign.validation import validate_pdf_signature, KeyUsageConstraints
-from pyhanko_certvalidator import ValidationContext
+from pyhanko.sign.validation import KeyUsageConstraints
 from pyhanko.pdf_utils.reader import PdfFileReader
 from pyhanko.keys import load_cert_from_pemder
 
+from signing import (DEFAULT_FIELD_BOX, parse_field_box, build_signature_meta,
+                     signed_output_path, sign_document)
+from appearance import ImageStampStyle
+from timestamping import DEFAULT_TSA_URL, get_timestamper
+from revocation import REVOCATION_MODES, build_validation_context, prefetch_revocation_info
+from local_responder import revocation_extensions
+from cert_report import get_certificate_report
+from signature_index import SignatureCatalog
+from profiles import ProfileError, get_config
+from archive_batch import archive_output_path, is_archive, sign_archive
+from pdf_encryption import DocumentKeyCache, PdfCredentials, load_password_file
+from key_storage import (KDFS, DEFAULT_KDF, DEFAULT_KDF_COST, generate_passphrase, is_pkcs12, load_signer,
+                         validate_kdf_cost, write_pkcs12, write_private_key)
+from job_panel import JobCancelled, JobQueuePanel, run_job
+from metrics import (CERTIFICATES_GENERATED, DOCUMENTS_VERIFIED, BYTES_PROCESSED, KEY_LOAD_SECONDS,
+                     VERIFY_SECONDS, MetricsServer, record_failure)
+from tracing import enable_tracing, write_trace, span, traced
+from modification_analysis import ANALYSIS_LEVELS, CachingDiffPolicy, validate_signature, signature_verdict
+from verification_report import JsonlWriter, signature_record, unsigned_record
+from ltv import PADES_LEVELS, TIMESTAMPED_LEVELS, LTV_LEVELS, build_ltv_context, split_trust_roots
+from issuance import (IssuanceDatabase, publish_revocation_info, DEFAULT_DB_NAME as ISSUANCE_DB_NAME,
+                      DEFAULT_PUBLISH_DIR_NAME as PUBLISH_DIR_NAME)
+
 selected_directory = ""
 
 
@@ -78,6 +101,15 @@ class FileSelectionWidget(QWidget):
                 self.file_paths = [file_path]
                 self.path_edit.setText(file_path)
     
+    def set_paths(self, file_paths):
+        """Select files without the dialog."""
+
+        self.file_paths = list(file_paths)
+        if len(self.file_paths) > 1:
+            self.path_edit.setText(f"{len(self.file_paths)} files selected")
+        else:
+            self.path_edit.setText(self.file_paths[0] if self.file_paths else "")
+
     def get_paths(self):
         """Get multiple paths."""
 
@@ -122,8 +154,7 @@ class DirectorySelectionWidget(QWidget):
             self.path_edit.setText(directory)
 
             selected_directory = directory
-            with open("last-key-path.txt", "w") as file:
-                file.write(f"{directory}\n")
+            get_config().set_key_directory(directory)
     
     def get_path(self):
         """Get path."""
@@ -180,8 +211,19 @@ class CertificateGenerationTab(QWidget):
         self.toggle_passphrase_visibility_btn.setCheckable(True)
         self.toggle_passphrase_visibility_btn.clicked.connect(self.toggle_passphrase_visibility)
 
-        with open("last-key-path.txt", "r") as file:
-            selected_directory = file.readline().strip()
+        self.kdf_label = QLabel("Key derivation (cost):")
+        self.kdf = QComboBox()
+        self.kdf.addItems(KDFS)
+        self.kdf.setCurrentText(DEFAULT_KDF)
+        self.kdf_cost = QSpinBox()
+        self.kdf_cost.setRange(1, 10 ** 8)
+        self.kdf_cost.setValue(DEFAULT_KDF_COST[DEFAULT_KDF])
+        self.kdf.currentTextChanged.connect(lambda kdf: self.kdf_cost.setValue(DEFAULT_KDF_COST[kdf]))
+        kdf_layout = QHBoxLayout()
+        kdf_layout.addWidget(self.kdf, 1)
+        kdf_layout.addWidget(self.kdf_cost)
+
+        selected_directory = get_config().key_directory
                 
         self.output_dir = DirectorySelectionWidget("Output Directory:", selected_directory)
         
@@ -197,6 +239,11 @@ class CertificateGenerationTab(QWidget):
         self.country_name = QLineEdit("US")
         self.country_name.setPlaceholderText("Country name")
 
+        self.revocation_url = QLineEdit()
+        self.revocation_url.setPlaceholderText("CRL/OCSP base URL, e.g. http://127.0.0.1:8082 (optional)")
+
+        self.pkcs12_checkbox = QCheckBox("Also export key, certificate and chain as PKCS#12 bundle (.p12)")
+
         self.generate_passphrase_btn = QPushButton("Auto-generate passphrase")
         self.generate_passphrase_btn.clicked.connect(self.generate_random_passphrase)
 
@@ -217,6 +264,7 @@ class CertificateGenerationTab(QWidget):
         chain_form.addRow(self.generate_passphrase_btn)
         chain_form.addRow(self.toggle_passphrase_visibility_btn)
         chain_form.addRow(self.copy_passphrase_btn)
+        chain_form.addRow(self.kdf_label, kdf_layout)
         
         chain_form.addRow(self.certificate_type_label)
         chain_form.addWidget(self.self_signed_certificate_radio_btn)
@@ -226,6 +274,8 @@ class CertificateGenerationTab(QWidget):
         chain_form.addRow("Organization Name:", self.org_name)
         chain_form.addRow("Email address:", self.email_address)
         chain_form.addRow("Coutry name:", self.country_name)
+        chain_form.addRow("Revocation URL:", self.revocation_url)
+        chain_form.addRow(self.pkcs12_checkbox)
 
         chain_form.addRow(self.generate_chain_button)
         chain_group.setLayout(chain_form)
@@ -253,7 +303,10 @@ class CertificateGenerationTab(QWidget):
             self.generate_passphrase_radio_btn,
             self.generate_passphrase_btn, 
             self.passphrase_label,
-            self.passphrase_input
+            self.passphrase_input,
+            self.kdf_label,
+            self.kdf,
+            self.kdf_cost
         ]
         self.passphrase_checkbox.toggled.connect(
             lambda checked: self.toggle_elements_visibility(passphrase_components)
@@ -275,14 +328,9 @@ class CertificateGenerationTab(QWidget):
         QApplication.processEvents()
 
     def generate_random_passphrase(self):
-        """Generate pseudorandom 4-digit passphrase."""
-
-        import secrets
-        passphrase = 0
-        while (passphrase < 1000):
-            passphrase = secrets.randbelow(10000)
+        """Generate a random passphrase of about 120 bits."""
 
-        self.passphrase_input.setText(str(passphrase))
+        self.passphrase_input.setText(generate_passphrase())
         self.copy_passphrase_btn.setEnabled(True)
 
     def copy_passphrase_to_clipboard(self):
@@ -331,6 +379,7 @@ class CertificateGenerationTab(QWidget):
             else:
                 self.passphrase_input.setEchoMode(QLineEdit.Password)
         
+    @traced("generate_root_cert")
     def generate_root_cert(self):
         """Generates Root CA certificate."""
 
@@ -371,6 +420,7 @@ class CertificateGenerationTab(QWidget):
 
         self.log("Root CA certificate generated.")
     
+    @traced("generate_intermediate_cert")
     def generate_interpediate_cert(self):
         """Generates intermediate CA certificate."""
 
@@ -407,11 +457,15 @@ class CertificateGenerationTab(QWidget):
                 encipher_only=False,
                 decipher_only=False
             ), critical=True)
-            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(self.root_key.public_key()), critical=False)
-            .sign(self.root_key, hashes.SHA256(), default_backend()))
+            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(self.root_key.public_key()), critical=False))
+        if self.revocation_url_txt:
+            for extension, critical in revocation_extensions(self.revocation_url_txt, self.root_key.public_key()):
+                self.intermediate_cert = self.intermediate_cert.add_extension(extension, critical=critical)
+        self.intermediate_cert = self.intermediate_cert.sign(self.root_key, hashes.SHA256(), default_backend())
 
         self.log("Intermediate CA certificate generated.")
                 
+    @traced("generate_signer_cert")
     def generate_signer_cert(self, self_signed=False):
         """Generates signer certificate."""
         self.signer_key = rsa.generate_private_key(
@@ -455,11 +509,15 @@ class CertificateGenerationTab(QWidget):
                 critical=True)
             .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.EMAIL_PROTECTION]), critical=False)
             .add_extension(x509.SubjectKeyIdentifier.from_public_key(self.signer_key.public_key()), critical=True)
-            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key((self.intermediate_key.public_key(), self.signer_key.public_key())[bool(self_signed)]), critical=True)
-            .sign((self.intermediate_key, self.signer_key)[bool(self_signed)], hashes.SHA256(), default_backend()))
+            .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key((self.intermediate_key.public_key(), self.signer_key.public_key())[bool(self_signed)]), critical=True))
+        if self.revocation_url_txt and not self_signed:
+            for extension, critical in revocation_extensions(self.revocation_url_txt, self.intermediate_key.public_key()):
+                self.signer_cert = self.signer_cert.add_extension(extension, critical=critical)
+        self.signer_cert = self.signer_cert.sign((self.intermediate_key, self.signer_key)[bool(self_signed)], hashes.SHA256(), default_backend())
 
         self.log("Signer certificate generated.")
 
+    @traced("generate_cert")
     def generate_cert(self, self_signed=True):
         """Generates all private keys, certificates."""
 
@@ -477,20 +535,20 @@ class CertificateGenerationTab(QWidget):
             self.common_name_txt = self.common_name.text()
             self.email_address_txt = self.email_address.text()
             self.country_name_txt = self.country_name.text()
+            self.revocation_url_txt = self.revocation_url.text().strip()
             
             self.console.clear()
 
-            encryption = (
-                # uses aes-256-cbc"
-                # https://github.com/pyca/cryptography/blob/aece5b3d47282beed31f7119e273b65816a0cf93/src/cryptography/hazmat/backends/openssl/backend.py#L1781
-                serialization.BestAvailableEncryption(
-                    self.passphrase_input.text().encode()
-                ) if self.passphrase_checkbox.isChecked() else serialization.NoEncryption()
-            )
+            passphrase = self.passphrase_input.text() if self.passphrase_checkbox.isChecked() else None
+            kdf, kdf_cost = self.kdf.currentText(), self.kdf_cost.value()
+            # fails before any key is generated
+            validate_kdf_cost(kdf, kdf_cost)
             
             if not self_signed:
                 self.generate_root_cert()
+                CERTIFICATES_GENERATED.inc(kind="root")
                 self.generate_interpediate_cert()
+                CERTIFICATES_GENERATED.inc(kind="intermediate")
                 
                 os.makedirs(output_path, exist_ok=True)
                 
@@ -524,6 +582,7 @@ class CertificateGenerationTab(QWidget):
                     self.log(f"Intermediate CA private key: {intermediate_key_path}")
 
             self.generate_signer_cert(self_signed)
+            CERTIFICATES_GENERATED.inc(kind="self-signed" if self_signed else "signer")
             signer_cert_path = os.path.join(output_path, f"{self.org_name_txt}.pem")
             signer_key_path = os.path.join(output_path, f"{self.org_name_txt}.key")
                 
@@ -531,24 +590,54 @@ class CertificateGenerationTab(QWidget):
                 f.write(self.signer_cert.public_bytes(serialization.Encoding.PEM))
                 self.log(f"Signer certificate: {signer_cert_path}")
             
-            with open(signer_key_path, "wb") as f:
-                f.write(self.signer_key.private_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.PKCS8,
-                    encryption_algorithm=encryption
-                ))
-                self.log(f"Signer certificate: {signer_key_path}")
+            write_private_key(self.signer_key, signer_key_path, passphrase, kdf, kdf_cost)
+            if passphrase:
+                self.log(f"Signer private key ({kdf}, cost {kdf_cost}): {signer_key_path}")
+            else:
+                self.log(f"Signer private key: {signer_key_path}")
+
+            if self.pkcs12_checkbox.isChecked():
+                bundle_path = os.path.join(output_path, f"{self.org_name_txt}.p12")
+                ca_certs = [] if self_signed else [self.intermediate_cert, self.root_cert]
+                write_pkcs12(self.signer_key, self.signer_cert, ca_certs, bundle_path, passphrase, kdf, kdf_cost)
+                self.log(f"PKCS#12 bundle: {bundle_path}")
+
+            if not self_signed:
+                self.record_issued_certs(output_path)
 
         except Exception as e:
+            record_failure("generate_cert", e)
             self.log(f"Error generating keys: {str(e)}")
+
+    def record_issued_certs(self, output_path):
+        """Record issued certificates and publish their revocation info."""
+
+        db = IssuanceDatabase(os.path.join(output_path, ISSUANCE_DB_NAME))
+        try:
+            db.record(self.intermediate_cert, self.root_key.public_key())
+            db.record(self.signer_cert, self.intermediate_key.public_key())
+            self.log(f"Issued certificates recorded: {db.path}")
+
+            if self.revocation_url_txt:
+                publish_dir = os.path.join(output_path, PUBLISH_DIR_NAME)
+                for issuer_cert, issuer_key in ((self.root_cert, self.root_key),
+                                                (self.intermediate_cert, self.intermediate_key)):
+                    publish_revocation_info(db, issuer_cert, issuer_key, publish_dir)
+                self.log(f"CRLs and OCSP responses published: {publish_dir}")
+        finally:
+            db.close()
     
 class PDFSigningTab(QWidget):
     """PDF signing tab."""
 
-    def __init__(self):
-        """"""
+    def __init__(self, jobs=None):
+        """Initialize PDF signing tab, signing runs as jobs of the jobs panel if given."""
 
         super().__init__()
+        self.jobs = jobs
+        self.thread_state = threading.local()
+        # keys of encrypted documents, reused when the same documents are signed again
+        self.key_cache = DocumentKeyCache()
         self.initUI()
     
     def initUI(self):
@@ -559,19 +648,61 @@ class PDFSigningTab(QWidget):
         file_group = QGroupBox("File Selection")
         file_form = QFormLayout()
         
-        self.pdf_file = FileSelectionWidget("PDF File:", "PDF Files (*.pdf)")
+        self.pdf_file = FileSelectionWidget(
+            "PDF File(s):", "PDF Files and Archives (*.pdf *.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz)",
+            allow_multiple=True
+        )
         self.output_file = QLineEdit()
+        self.output_file.setPlaceholderText("Only used when one file is selected")
+        self.pdf_password = QLineEdit()
+        self.pdf_password.setPlaceholderText("User or owner password (if PDF is encrypted)")
+        self.pdf_password.setEchoMode(QLineEdit.Password)
         
         file_form.addRow(self.pdf_file)
         file_form.addRow("Output File:", self.output_file)
+        file_form.addRow("PDF Password:", self.pdf_password)
         file_group.setLayout(file_form)
         
         cert_group = QGroupBox("Certificate Selection")
         cert_form = QFormLayout()
-        
-        self.key_file = FileSelectionWidget("Private Key:", "Key Files (*.pem *.key)")
+
+        self.profile = QComboBox()
+        self.profile.addItem("(none)")
+        self.profile.addItems(get_config().profile_names())
+        self.save_profile_button = QPushButton("Save as Profile...")
+        self.save_profile_button.clicked.connect(self.save_profile)
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(self.profile, 1)
+        profile_layout.addWidget(self.save_profile_button)
+        cert_form.addRow("Signing Profile:", profile_layout)
+        
+        self.key_source_radio_btn_group = QButtonGroup(self)
+        self.key_file_radio_btn = QRadioButton("Private key file")
+        self.pkcs11_radio_btn = QRadioButton("PKCS#11 token")
+        self.key_source_radio_btn_group.addButton(self.key_file_radio_btn, 1)
+        self.key_source_radio_btn_group.addButton(self.pkcs11_radio_btn, 2)
+        key_source_layout = QHBoxLayout()
+        key_source_layout.addWidget(self.key_file_radio_btn)
+        key_source_layout.addWidget(self.pkcs11_radio_btn)
+        key_source_layout.addStretch()
+        cert_form.addRow("Key Source:", key_source_layout)
+
+        self.key_file = FileSelectionWidget("Private Key:", "Key Files (*.pem *.key *.p12 *.pfx)")
         self.cert_file = FileSelectionWidget("Certificate:", "Certificate Files (*.pem *.crt *.cer)")
 
+        self.pkcs11_module = FileSelectionWidget("PKCS#11 Module:", "PKCS#11 Modules (*.so *.dll *.dylib)")
+        self.pkcs11_token_label = QLineEdit()
+        self.pkcs11_token_label.setPlaceholderText("Token label (first token if empty)")
+        self.pkcs11_key_label = QLineEdit()
+        self.pkcs11_key_label.setPlaceholderText("Label of the private key on the token")
+        self.pkcs11_pin = QLineEdit()
+        self.pkcs11_pin.setPlaceholderText("User PIN")
+        self.pkcs11_pin.setEchoMode(QLineEdit.Password)
+        cert_form.addRow(self.pkcs11_module)
+        cert_form.addRow("Token Label:", self.pkcs11_token_label)
+        cert_form.addRow("Key Label:", self.pkcs11_key_label)
+        cert_form.addRow("PIN:", self.pkcs11_pin)
+
         self.passphrase_input = QLineEdit()
         self.passphrase_input.setPlaceholderText("Enter passphrase (if key is encrypted)")
         self.passphrase_input.setEchoMode(QLineEdit.Password)
@@ -600,17 +731,34 @@ class PDFSigningTab(QWidget):
         cert_form.addRow(self.cert_file)
         cert_form.addRow(ca_chain_layout)
         cert_group.setLayout(cert_form)
+
+        self.key_file_components = [self.key_file, self.passphrase_input]
+        self.pkcs11_components = [
+            self.pkcs11_module,
+            self.pkcs11_token_label,
+            self.pkcs11_key_label,
+            self.pkcs11_pin
+        ]
+        self.pkcs11_radio_btn.toggled.connect(self.update_key_source)
+        self.key_file_radio_btn.setChecked(True)
+        self.update_key_source()
         
         sig_group = QGroupBox("Signature Options")
         sig_form = QFormLayout()
         
         self.field_name = QLineEdit("Signature1")
         self.create_field = QCheckBox("Create signature field if it does not exist")
+        self.field_box = QLineEdit(", ".join(str(c) for c in DEFAULT_FIELD_BOX))
+        self.field_box.setPlaceholderText("x1, y1, x2, y2")
+        self.field_page = QSpinBox()
+        self.field_page.setMinimum(0)
         self.location = QLineEdit()
         self.contact_info = QLineEdit()
         
         sig_form.addRow("Field Name:", self.field_name)
         sig_form.addRow(self.create_field)
+        sig_form.addRow("Field Box:", self.field_box)
+        sig_form.addRow("Field Page:", self.field_page)
         sig_form.addRow("Location:", self.location)
         sig_form.addRow("Contact Info:", self.contact_info)
         sig_group.setLayout(sig_form)
@@ -619,7 +767,14 @@ class PDFSigningTab(QWidget):
         sig_form.addRow(self.signature_image_path)
 
         self.timestamp_checkbox = QCheckBox("Add timestamp")
+        self.tsa_url = QLineEdit(DEFAULT_TSA_URL)
+        self.tsa_url.setPlaceholderText("RFC 3161 timestamp server URL")
         sig_form.addRow(self.timestamp_checkbox)
+        sig_form.addRow("TSA URL:", self.tsa_url)
+
+        self.pades_level = QComboBox()
+        self.pades_level.addItems(PADES_LEVELS)
+        sig_form.addRow("PAdES Level:", self.pades_level)
         
         self.sign_button = QPushButton("Sign PDF")
         self.sign_button.clicked.connect(self.sign_pdf)
@@ -638,6 +793,89 @@ class PDFSigningTab(QWidget):
         layout.addWidget(console_group)
         
         self.setLayout(layout)
+
+        self.profile.currentTextChanged.connect(self.apply_profile)
+        if get_config().default_profile in get_config().profile_names():
+            self.profile.setCurrentText(get_config().default_profile)
+
+    def selected_profile(self):
+        """Name of the selected signing profile, or None."""
+
+        return self.profile.currentText() if self.profile.currentIndex() > 0 else None
+
+    def apply_profile(self):
+        """Fill the form from the selected signing profile."""
+
+        name = self.selected_profile()
+        if name is None:
+            return
+        try:
+            profile = get_config().profile(name)
+        except ProfileError as e:
+            self.log(f"Error: {str(e)}")
+            return
+        if profile.pkcs11_module:
+            self.pkcs11_radio_btn.setChecked(True)
+            self.pkcs11_module.set_paths([profile.pkcs11_module])
+            self.pkcs11_token_label.setText(profile.pkcs11_token or "")
+            self.pkcs11_key_label.setText(profile.pkcs11_key_label or "")
+        else:
+            self.key_file_radio_btn.setChecked(True)
+            self.key_file.set_paths([profile.key])
+        self.cert_file.set_paths([profile.cert] if profile.cert else [])
+        self.ca_chain_list.clear()
+        for path in profile.chain:
+            self.ca_chain_list.addItem(QListWidgetItem(path))
+        self.field_name.setText(profile.field_name)
+        self.create_field.setChecked(profile.create_field)
+        self.field_box.setText(", ".join(str(c) for c in profile.field_box))
+        self.field_page.setValue(profile.field_page)
+        self.location.setText(profile.location or "")
+        self.contact_info.setText(profile.contact_info or "")
+        self.signature_image_path.set_paths([profile.image] if profile.image else [])
+        self.timestamp_checkbox.setChecked(profile.timestamp)
+        self.tsa_url.setText(profile.tsa_url)
+        self.pades_level.setCurrentText(profile.pades_level)
+
+    def save_profile(self):
+        """Save the form as a named signing profile."""
+
+        name, ok = QInputDialog.getText(self, "Save Signing Profile", "Profile name:",
+                                        text=self.selected_profile() or "")
+        name = name.strip()
+        if not ok or not name:
+            return
+        use_pkcs11 = self.pkcs11_radio_btn.isChecked()
+        try:
+            get_config().set_profile(
+                name,
+                key=None if use_pkcs11 else self.key_file.get_path(),
+                cert=self.cert_file.get_path(),
+                chain=[self.ca_chain_list.item(i).text() for i in range(self.ca_chain_list.count())],
+                pkcs11_module=self.pkcs11_module.get_path() if use_pkcs11 else None,
+                pkcs11_token=self.pkcs11_token_label.text() or None if use_pkcs11 else None,
+                pkcs11_key_label=self.pkcs11_key_label.text() or None if use_pkcs11 else None,
+                field_name=self.field_name.text(),
+                create_field=self.create_field.isChecked(),
+                field_box=list(parse_field_box(self.field_box.text())),
+                field_page=self.field_page.value(),
+                location=self.location.text() or None,
+                contact_info=self.contact_info.text() or None,
+                image=self.signature_image_path.get_path(),
+                timestamp=self.timestamp_checkbox.isChecked(),
+                tsa_url=self.tsa_url.text().strip() or None,
+                pades_level=self.pades_level.currentText(),
+                # the PDF Password field is never saved, only a password file set with cli.py
+                pdf_password_file=get_config().data['profiles'].get(name, {}).get('pdf_password_file')
+            )
+            get_config().profile(name)
+        except (ValueError, OSError) as e:
+            self.log(f"Error saving profile {name}: {str(e)}")
+            return
+        if self.profile.findText(name) == -1:
+            self.profile.addItem(name)
+        self.profile.setCurrentText(name)
+        self.log(f"Saved signing profile {name} to {get_config().path}")
     
     def add_ca_cert(self):
         """Add ca certificate."""
@@ -649,6 +887,15 @@ class PDFSigningTab(QWidget):
             item = QListWidgetItem(file_path)
             self.ca_chain_list.addItem(item)
     
+    def update_key_source(self):
+        """Enable inputs of the selected private key source."""
+
+        use_pkcs11 = self.pkcs11_radio_btn.isChecked()
+        for element in self.key_file_components:
+            element.setEnabled(not use_pkcs11)
+        for element in self.pkcs11_components:
+            element.setEnabled(use_pkcs11)
+
     def remove_ca_cert(self):
         """Remove ca certificate."""
 
@@ -667,35 +914,46 @@ class PDFSigningTab(QWidget):
         try:
             self.console.clear()
             
-            if self.timestamp_checkbox.isChecked():
-                signature_meta.timestamp_url = "http://timestamp.digicert.com"
-                self.log("Adding timestamp to the signature.")
+            pades_level = self.pades_level.currentText()
+            timestamper = None
+            if self.timestamp_checkbox.isChecked() or pades_level in TIMESTAMPED_LEVELS:
+                tsa_url = self.tsa_url.text().strip()
+                if not tsa_url:
+                    self.log("Error: Please enter a timestamp server URL.")
+                    return
+                timestamper = get_timestamper(tsa_url)
+                self.log(f"Adding timestamp from {tsa_url} to the signature.")
 
             pdf_paths = self.pdf_file.get_paths()
             if not pdf_paths:
                 self.log("Error: Please select a PDF file to sign.")
                 return
             
-            pdf_file = pdf_paths[0]
-            
             output_file = self.output_file.text()
-            if not output_file:
-                output_file = pdf_file.replace(".pdf", "_signed.pdf")
+            if len(pdf_paths) == 1 and not output_file:
+                output_file = self.default_output_path(pdf_paths[0])
                 self.output_file.setText(output_file)
             
-            key_paths = self.key_file.get_paths()
-            if not key_paths:
-                self.log("Error: Please select a private key file.")
+            use_pkcs11 = self.pkcs11_radio_btn.isChecked()
+            key_file = None
+            if not use_pkcs11:
+                key_paths = self.key_file.get_paths()
+                if not key_paths:
+                    self.log("Error: Please select a private key file.")
+                    return
+                
+                key_file = key_paths[0]
+            elif not self.pkcs11_module.get_path():
+                self.log("Error: Please select a PKCS#11 module.")
                 return
             
-            key_file = key_paths[0]
-            
             cert_paths = self.cert_file.get_paths()
-            if not cert_paths:
+            # a PKCS#12 bundle brings its own certificate and chain
+            if not cert_paths and not use_pkcs11 and not is_pkcs12(key_file):
                 self.log("Error: Please select a certificate file.")
                 return
             
-            cert_file = cert_paths[0]
+            cert_file = cert_paths[0] if cert_paths else None
             
             ca_chain = []
             for i in range(self.ca_chain_list.count()):
@@ -706,71 +964,165 @@ class PDFSigningTab(QWidget):
             location = self.location.text()
             contact_info = self.contact_info.text()
             
-            self.log(f"Signing PDF: {pdf_file}")
-            self.log(f"Output file: {output_file}")
-            self.log(f"Using key: {key_file}")
-            self.log(f"Using certificate: {cert_file}")
+            self.log(f"Signing {len(pdf_paths)} PDF file(s)")
+            if use_pkcs11:
+                self.log(f"Using PKCS#11 module: {self.pkcs11_module.get_path()}")
+            else:
+                self.log(f"Using key: {key_file}")
+            self.log(f"Using certificate: {cert_file or 'from token'}")
             if ca_chain:
                 self.log(f"Using CA chain: {', '.join(ca_chain)}")
             
-            key_passphrase = self.passphrase_input.text().encode() if self.passphrase_input.text() else None
             self.log("Loading certificates and keys...")
-            
-            cms_signer = signers.SimpleSigner.load(
-                key_file, cert_file,
-                ca_chain_files=ca_chain,
-                key_passphrase=key_passphrase
-            )
-
-            if key_passphrase:
-                self.log("Using encrypted private key with passphrase.")
-
-            self.log("Preparing PDF for signing...")
-            with open(pdf_file, 'rb') as doc:
-                w = IncrementalPdfFileWriter(doc)
-                
-                if create_field:
-                    self.log("Creating signature field...")
-                    fields.append_signature_field(
-                        w, sig_field_spec=fields.SigFieldSpec(
-                            sig_field_name=field_name, 
-                            box=(100, 100, 300, 200)
-                        )
+            profile_name = self.selected_profile()
+            profile = get_config().profile(profile_name) if profile_name else None
+            if use_pkcs11:
+                from pkcs11_backend import get_session_pool
+                with KEY_LOAD_SECONDS.time(backend="pkcs11"), span("load_key", backend="pkcs11"):
+                    pool = get_session_pool(
+                        self.pkcs11_module.get_path(),
+                        token_label=self.pkcs11_token_label.text() or None,
+                        user_pin=self.pkcs11_pin.text() or None,
+                        key_label=self.pkcs11_key_label.text() or None,
+                        cert_file=cert_file,
+                        ca_chain_files=ca_chain
                     )
-                
-                signature_meta = signers.PdfSignatureMetadata(
-                    field_name=field_name,
-                    signer_key_usage=["digital_signature", "non_repudiation"],
-                    subfilter=fields.SigSeedSubFilter.PADES,
+                borrow_signer = pool.signer
+            else:
+                passphrase = self.passphrase_input.text() or None
+                if profile and (profile.key, profile.cert, profile.chain) == (key_file, cert_file, tuple(ca_chain)):
+                    def new_signer():
+                        return get_config().signer(profile_name, passphrase)
+                else:
+                    def new_signer():
+                        return self.file_signer(key_file, cert_file, ca_chain, passphrase)
+                # fails here, before any job is queued, on a wrong passphrase;
+                # the unlocked key stays in the key cache, each document gets its own signer
+                first_signer = new_signer()
+                borrow_signer = lambda: contextlib.nullcontext(new_signer())
+
+                if passphrase:
+                    self.log("Using encrypted private key with passphrase.")
+
+            validation_context = lambda: None
+            if pades_level in LTV_LEVELS:
+                if key_file and is_pkcs12(key_file):
+                    chain_certs = list(first_signer.cert_registry)
+                else:
+                    chain_certs = [load_cert_from_pemder(path) for path in ca_chain]
+                trust_roots, other_certs = split_trust_roots(chain_certs)
+                if not trust_roots:
+                    self.log(f"Error: PAdES {pades_level} requires the root certificate in the CA chain.")
+                    return
+                self.log(f"Embedding validation info for PAdES {pades_level}.")
+                # validation contexts are not thread-safe, shared validation data is fetched once
+                # through the revocation cache
+                validation_context = lambda: self.thread_cached(
+                    ('ltv', tuple(ca_chain)), lambda: build_ltv_context(trust_roots, other_certs)
                 )
-                
-                if location:
-                    signature_meta.location = location
-                if contact_info:
-                    signature_meta.contact_info = contact_info
-                
-                self.log("Signing PDF...")
-                with open(output_file, 'wb') as out:
-                    signers.sign_pdf(
-                        w,
-                        signature_meta=signature_meta,
-                        signer=cms_signer,
-                        output=out
-                    )
-                
-            self.log(f"PDF signed successfully. Output saved to: {output_file}")
+
+            field_box = parse_field_box(self.field_box.text()) if create_field else DEFAULT_FIELD_BOX
+            field_page = self.field_page.value()
+            per_file = load_password_file(profile.pdf_password_file) if profile and profile.pdf_password_file else None
+            credentials = PdfCredentials([self.pdf_password.text()], per_file, key_cache=self.key_cache)
+
+            stamp_style = None
+            image_path = self.signature_image_path.get_path()
+            if image_path:
+                self.log(f"Using signature image: {image_path}")
+                if profile and profile.image == image_path:
+                    stamp_style = get_config().stamp_style(profile.name)
+                else:
+                    stamp_style = ImageStampStyle(image_path=image_path, border_width=0)
+
+            def sign_job(pdf_file, output_file):
+                def job_func(job):
+                    log = lambda message: job.post(self.log, message)
+                    job.check_cancelled()
+                    try:
+                        with borrow_signer() as cms_signer:
+                            job.progress(20, "Signer loaded")
+                            job.check_cancelled()
+
+                            def sign_stream(doc, output):
+                                sign_document(
+                                    doc, output, cms_signer,
+                                    build_signature_meta(field_name, location, contact_info,
+                                                         pades_level, validation_context()),
+                                    create_field=create_field,
+                                    field_box=field_box,
+                                    field_page=field_page,
+                                    stamp_style=stamp_style,
+                                    timestamper=timestamper,
+                                    log=log,
+                                    credentials=credentials
+                                )
+
+                            if is_archive(pdf_file):
+                                # PDF members are signed in memory, other members copied
+                                results = sign_archive(pdf_file, output_file, sign_stream, log=log)
+                                failed = [result.name for result in results if result.action == "failed"]
+                                if failed:
+                                    raise ValueError(f"{len(failed)} member(s) failed and were copied unchanged: "
+                                                     f"{', '.join(failed)}")
+                            else:
+                                sign_stream(pdf_file, output_file)
+                    except JobCancelled:
+                        raise
+                    except Exception as e:
+                        log(f"Error signing PDF {pdf_file}: {str(e)}")
+                        raise
+                    log(f"PDF signed successfully. Output saved to: {output_file}")
+                    return output_file
+                return job_func
+
+            for pdf_file in pdf_paths:
+                if len(pdf_paths) > 1:
+                    output_file = self.default_output_path(pdf_file)
+                self.log(f"Queued signing of {pdf_file}")
+                run_job(self.jobs, "sign", f"Sign {os.path.basename(pdf_file)}", sign_job(pdf_file, output_file))
             
         except Exception as e:
+            record_failure("sign", e)
             self.log(f"Error signing PDF: {str(e)}")
+
+    def default_output_path(self, pdf_file):
+        """Output path of a PDF file or archive next to it."""
+
+        return archive_output_path(pdf_file) if is_archive(pdf_file) else signed_output_path(pdf_file)
+
+    def thread_cached(self, key, create):
+        """Object made by create(), cached per calling thread under key."""
+
+        cache = getattr(self.thread_state, 'cache', None)
+        if cache is None:
+            cache = self.thread_state.cache = {}
+        if key not in cache:
+            cache[key] = create()
+        return cache[key]
+
+    def file_signer(self, key_file, cert_file, ca_chain, passphrase):
+        """New SimpleSigner of a key file, for one document.
+
+        asn1crypto objects parse lazily and are not thread-safe, and an
+        unlocked key should not outlive the key cache, so every document
+        is signed with its own signer.
+        """
+
+        with KEY_LOAD_SECONDS.time(backend="file"), span("load_key", backend="file"):
+            return load_signer(key_file, cert_file, ca_chain, passphrase)
             
 
 class PDFVerificationTab(QWidget):
     """PDF verification tab."""
 
-    def __init__(self):
-        """Initialize PDF verification tab."""
+    def __init__(self, jobs=None):
+        """Initialize PDF verification tab, verification runs as jobs of the jobs panel if given."""
 
         super().__init__()
+        self.jobs = jobs
+        self.catalog = None
+        self.key_cache = DocumentKeyCache()
         self.initUI()
     
     def initUI(self):
@@ -782,7 +1134,12 @@ class PDFVerificationTab(QWidget):
         file_form = QFormLayout()
         
         self.pdf_file = FileSelectionWidget("PDF File:", "PDF Files (*.pdf)")
+        self.pdf_file.path_edit.textChanged.connect(self.show_signature_index)
+        self.pdf_password = QLineEdit()
+        self.pdf_password.setPlaceholderText("User or owner password (if PDF is encrypted)")
+        self.pdf_password.setEchoMode(QLineEdit.Password)
         file_form.addRow(self.pdf_file)
+        file_form.addRow("PDF Password:", self.pdf_password)
         file_group.setLayout(file_form)
         
         cert_group = QGroupBox("Certificate Selection")
@@ -830,6 +1187,22 @@ class PDFVerificationTab(QWidget):
         self.sig_index.setSpecialValueText("All signatures")
         
         verify_form.addRow("Signature Index:", self.sig_index)
+
+        self.revocation_mode = QComboBox()
+        self.revocation_mode.addItems(REVOCATION_MODES)
+        self.revocation_mode.setCurrentText("soft-fail")
+        verify_form.addRow("Revocation Check:", self.revocation_mode)
+
+        self.analysis_level = QComboBox()
+        self.analysis_level.addItems(ANALYSIS_LEVELS)
+        self.analysis_level.setCurrentText("always")
+        self.analysis_level.setToolTip("Check revisions added after signing: never (such signatures are "
+                                       "reported unchecked), only where they can fail a signature, or always")
+        verify_form.addRow("Modification Analysis:", self.analysis_level)
+
+        self.jsonl_report = QLineEdit()
+        self.jsonl_report.setPlaceholderText("Append results as JSON Lines to this file (optional)")
+        verify_form.addRow("JSONL Report:", self.jsonl_report)
         verify_group.setLayout(verify_form)
         
         self.verify_button = QPushButton("Verify PDF Signatures")
@@ -837,8 +1210,12 @@ class PDFVerificationTab(QWidget):
         
         console_group = QGroupBox("Verification Results")
         console_layout = QVBoxLayout()
+        self.results = QTreeWidget()
+        self.results.setHeaderLabels(["Signature", "Result"])
+        self.results.itemExpanded.connect(self.render_result_details)
         self.console = QTextEdit()
         self.console.setReadOnly(True)
+        console_layout.addWidget(self.results)
         console_layout.addWidget(self.console)
         console_group.setLayout(console_layout)
         
@@ -859,6 +1236,12 @@ class PDFVerificationTab(QWidget):
         if file_path:
             item = QListWidgetItem(file_path)
             self.intermediate_list.addItem(item)
+            if self.revocation_mode.currentText() != "off":
+                # warm revocation cache while the user selects the rest
+                try:
+                    prefetch_revocation_info([load_cert_from_pemder(file_path)])
+                except Exception as e:
+                    self.log(f"Warning: Failed to prefetch revocation info for {file_path}: {str(e)}")
     
     def remove_intermediate_cert(self):
         """Remove intermediate certificate."""
@@ -874,47 +1257,50 @@ class PDFVerificationTab(QWidget):
         self.console.append(message)
         QApplication.processEvents()
 
-    def format_hex(self, byte_string):
-        """Format hexadecimal to decimal."""
+    def show_signature_index(self):
+        """List signatures of the selected PDF from the catalog, without validating them."""
 
-        if byte_string is None:
-            return "Not Present"
-        if isinstance(byte_string, bytes):
-            return byte_string.hex(':')
-        return str(byte_string) 
-
-    def format_general_names(self, general_names_obj):
-        """Format general names."""
-
-        if not general_names_obj:
-            return "Not Present"
-        
-        names_list = []
-        items_to_format = general_names_obj
-        if not isinstance(general_names_obj, (list, tuple)):
-            items_to_format = [general_names_obj]
+        pdf_file = self.pdf_file.get_path()
+        if not pdf_file:
+            return
+        try:
+            if self.catalog is None:
+                self.catalog = SignatureCatalog()
+            entries = self.catalog.entries(pdf_file)
+        except Exception as e:
+            self.log(f"Warning: Failed to index signatures of {pdf_file}: {str(e)}")
+            return
+        self.sig_index.setMaximum(max(len(entries) - 1, 0))
+        self.log(f"{pdf_file}: {len(entries)} signature(s)")
+        for entry in entries:
+            self.log(f"  {entry.index}: {entry.field_name} ({entry.sig_type[1:]}), "
+                     f"signed {entry.signing_time or 'at unknown time'} by {entry.signer_subject or 'unknown signer'}")
+
+    def add_result(self, idx, field_name, verdict, report):
+        """Add expandable signature result backed by a certificate report."""
+
+        label = {"VALID": "✓ valid", "UNCHECKED": "⚠ later revisions unchecked"}.get(verdict, "✗ invalid")
+        item = QTreeWidgetItem([f"{idx}: {field_name}", label])
+        item.setData(0, Qt.UserRole, report)
+        item.setChildIndicatorPolicy(QTreeWidgetItem.ShowIndicator)
+        self.results.addTopLevelItem(item)
+
+    def render_result_details(self, item):
+        """Render certificate report of a result on first expansion."""
+
+        report = item.data(0, Qt.UserRole)
+        if report is None or item.childCount():
+            return
+        for line in report.lines:
+            item.addChild(QTreeWidgetItem([line]))
+        self.results.resizeColumnToContents(0)
 
-        for gn in items_to_format:
-            if hasattr(gn, 'name') and hasattr(gn, 'chosen_value'): 
-                name_type = gn.name
-                value = gn.chosen_value
-                if hasattr(value, 'native'): 
-                    value_str = str(value.native)
-                else:
-                    value_str = str(value)
-                names_list.append(f"{name_type}: {value_str}")
-            elif hasattr(gn, 'native'): 
-                names_list.append(str(gn.native))
-            else:
-                names_list.append(str(gn))
-                
-        return "; ".join(names_list) if names_list else "Not Present"
-    
     def verify_pdf(self):
         """Verify PDF if signature is valid."""
 
         try:
             self.console.clear()
+            self.results.clear()
             
             pdf_paths = self.pdf_file.get_paths()
             if not pdf_paths:
@@ -955,137 +1341,123 @@ class PDFVerificationTab(QWidget):
                 except Exception as e:
                     self.log(f"Warning: Failed to load certificate {cert_path}: {str(e)}")
             
-            self.log("Creating validation context...")
-            vc = ValidationContext(
-                trust_roots=[root_cert],
-                other_certs=other_cert_objs
-            )
+            revocation_mode = self.revocation_mode.currentText()
+            analysis_level = self.analysis_level.currentText()
+            credentials = PdfCredentials([self.pdf_password.text()], key_cache=self.key_cache)
+            jsonl_report = self.jsonl_report.text().strip()
+
+            def verify_document(job, log):
+                if jsonl_report:
+                    with JsonlWriter(jsonl_report, append=True) as report_writer:
+                        return verify_signatures(job, log, report_writer.write)
+                return verify_signatures(job, log, lambda record: None)
+
+            def verify_signatures(job, log, write_record):
+                log(f"Creating validation context (revocation check: {revocation_mode})...")
+                with span("build_validation_context", revocation_mode=revocation_mode):
+                    if revocation_mode != "off":
+                        prefetch_revocation_info([root_cert] + other_cert_objs)
+                    vc = build_validation_context(
+                        trust_roots=[root_cert],
+                        other_certs=other_cert_objs,
+                        revocation_mode=revocation_mode
+                    )
             
-            key_usage_settings = KeyUsageConstraints(
-                key_usage={'digital_signature', 'nonRepudiation'},
-                match_all_key_usages=False
-            )
+                key_usage_settings = KeyUsageConstraints(
+                    key_usage={'digital_signature', 'nonRepudiation'},
+                    match_all_key_usages=False
+                )
             
-            self.log("Opening PDF and validating signatures...")
-            with open(pdf_file, 'rb') as doc:
-                r = PdfFileReader(doc)
-                sigs = r.embedded_signatures
+                log("Opening PDF and validating signatures...")
+                with open(pdf_file, 'rb') as doc:
+                    with span("open_pdf", file=pdf_file):
+                        r = PdfFileReader(doc)
+                        credentials.unlock(r, pdf_file)
+                        sigs = r.embedded_signatures
                 
-                if not sigs:
-                    self.log("No signatures found in the PDF.")
-                    return
+                    if not sigs:
+                        log("No signatures found in the PDF.")
+                        write_record(unsigned_record(pdf_file))
+                        return
                     
-                self.log(f"Found {len(sigs)} signatures in the PDF.")
+                    log(f"Found {len(sigs)} signatures in the PDF.")
+                    BYTES_PROCESSED.inc(os.path.getsize(pdf_file), operation="verify")
+
+                    # shared by all signatures of the document
+                    diff_policy = None if analysis_level == "off" else CachingDiffPolicy(r)
                 
-                if signature_index is not None:
-                    if signature_index < 0 or signature_index >= len(sigs):
-                        self.log(f"Error: Signature index {signature_index} is out of range.")
-                        return
-                    sig_indices = [signature_index]
-                else:
-                    sig_indices = range(len(sigs))
+                    if signature_index is not None:
+                        if signature_index < 0 or signature_index >= len(sigs):
+                            log(f"Error: Signature index {signature_index} is out of range.")
+                            return
+                        sig_indices = [signature_index]
+                    else:
+                        sig_indices = range(len(sigs))
                 
-                for idx in sig_indices:
-                    sig = sigs[idx]
+                    for done, idx in enumerate(sig_indices):
+                        job.check_cancelled()
+                        job.progress(100 * done / len(sig_indices), f"Signature {idx}")
+                        sig = sigs[idx]
+                        status = None
                     
-                    try:
-                        status = validate_pdf_signature(
-                            embedded_sig=sig,
-                            signer_validation_context=vc,
-                            key_usage_settings=key_usage_settings
-                        )
-
-                        self.log(f"Verifying signature {idx}:")
-
-                        aia_value_obj = sig.signer_cert.authority_information_access_value
-                        if aia_value_obj:
-                            self.log(f"  Authority Information Access (AIA):")
-                            for access_description in aia_value_obj:
-                                method_oid = access_description['access_method'].native
-                                location = access_description['access_location']
-                                location_type = location.name
-                                location_value = location.chosen_value.native if hasattr(location.chosen_value, 'native') else location.chosen_value
-                                self.log(f"    - Method: {method_oid}")
-                                self.log(f"      Location ({location_type}): {location_value}")
-                        else:
-                            self.log(f"  Authority Information Access (AIA): Not Present")
-
-                        ski_bytes = sig.signer_cert.key_identifier
-                        self.log(f"  Subject Key Identifier (SKI): {self.format_hex(ski_bytes)}")
-
-                        akid_value_obj = sig.signer_cert.authority_key_identifier_value
-                        if akid_value_obj:
-                            self.log(f"  Authority Key Identifier (AKI):")
-                            native_akid = akid_value_obj.native
-                            akid_key_id = native_akid.get('key_identifier')
-                            self.log(f"    Key Identifier: {self.format_hex(akid_key_id)}")
-
-                            akid_issuer = native_akid.get('authority_cert_issuer')
-                            if akid_issuer:
-                                issuers_str_list = []
-                                for gn_dict in akid_issuer:
-                                    if 'directory_name' in gn_dict:
-                                        issuers_str_list.append(f"Directory Name (details omitted for brevity, see below)")
-                                    else:
-                                        issuers_str_list.append(f"{gn_dict.get('type', 'Unknown')}: {gn_dict.get('value', 'N/A')}")
-                                self.log(f"    Authority Cert Issuer: {'; '.join(issuers_str_list) if issuers_str_list else 'Not Present'}")
-                            else:
-                                self.log(f"    Authority Cert Issuer: Not Present")
-
-                            self.log(f"    Authority Cert Issuer & Serial (from cert direct attr): {sig.signer_cert.authority_issuer_serial or 'Not Present'}")
-
-                            akid_serial = native_akid.get('authority_cert_serial_number')
-                            self.log(f"    Authority Cert Serial Number: {akid_serial if akid_serial is not None else 'Not Present'}")
-                        else:
-                            self.log(f"  Authority Key Identifier (AKI): Not Present")
-
-                        basic_constraints_obj = sig.signer_cert.basic_constraints_value
-                        ca_status_direct = sig.signer_cert.ca
-                        self.log(f"  Basic Constraints:")
-                        self.log(f"    Is CA (direct attribute): {ca_status_direct}")
-                        if basic_constraints_obj:
-                            native_bc = basic_constraints_obj.native
-                            is_ca_from_ext = native_bc.get('ca', False)
-                            path_len = native_bc.get('path_len_constraint')
-                            self.log(f"    Is CA (from extension): {is_ca_from_ext}")
-                            self.log(f"    Path Length Constraint: {path_len if path_len is not None else 'Not Specified'}")
-                        else:
-                            self.log(f"    (Extension not present or could not be parsed)")
-
-
-                        cert_policies_obj = sig.signer_cert.certificate_policies_value
-                        if cert_policies_obj:
-                            self.log(f"  Certificate Policies:")
-                            if not cert_policies_obj.native: 
-                                self.log(f"    No policies defined in extension.")
-                            else:
-                                for policy_info in cert_policies_obj.native: 
-                                    oid = policy_info.get('policy_identifier', 'Unknown OID')
-                                    qualifiers_text = ""
-                                    if policy_info.get('policy_qualifiers'):
-                                        qualifiers_text = f" (has {len(policy_info['policy_qualifiers'])} qualifier(s))"
-                                    self.log(f"    - Policy OID: {oid}{qualifiers_text}")
-                        else:
-                            self.log(f"  Certificate Policies: Not Present (extension not present)")
-
-                        if hasattr(status, 'signing_time') and status.signing_time:
-                            self.log(f"  Signing time: {status.signing_time}")
+                        try:
+                            with VERIFY_SECONDS.time(), span("validate_signature", index=idx, level=analysis_level):
+                                status = validate_signature(
+                                    sig, vc, key_usage_settings, analysis_level, diff_policy
+                                )
+                            verdict = signature_verdict(status)
+                            DOCUMENTS_VERIFIED.inc(result=verdict.lower())
+                            write_record(signature_record(pdf_file, idx, sig, status))
+
+                            log(f"Verifying signature {idx}:")
+                            # details are rendered only when the result is expanded
+                            report = get_certificate_report(sig.signer_cert)
+                            job.post(self.add_result, idx, sig.field_name, verdict, report)
+                            log(f"  Signer: {report.subject}")
+
+                            if status.revocation_details is not None:
+                                log(f"  ✗ Certificate revoked on {status.revocation_details.revocation_date}"
+                                    f" ({status.revocation_details.revocation_reason.human_friendly})")
+                            elif revocation_mode != "off" and status.trusted:
+                                log("  Revocation check: not revoked")
+
+                            if hasattr(status, 'signing_time') and status.signing_time:
+                                log(f"  Signing time: {status.signing_time}")
                         
-                        if status.bottom_line == 1:
-                            self.log("  ✓ Signature verification successful")
-                        else:
-                            self.log(f"  ✗ Signature verification failed")
+                            if verdict == "VALID":
+                                log("  ✓ Signature verification successful")
+                            elif verdict == "UNCHECKED":
+                                log("  ⚠ Signature intact, but later revisions were not checked")
+                            else:
+                                log(f"  ✗ Signature verification failed")
                             
-                        if hasattr(status, 'modification_analysis'):
-                            coverage = status.modification_analysis()
-                            if coverage:
-                                self.log(f"  Document coverage: {coverage.coverage_level}")
-                                if not coverage.docmdp_ok:
-                                    self.log("  ⚠ Document was modified in a way that violates the permissions set by the signer")
+                            log(f"  Document coverage: {status.coverage.name}")
+                            if status.modification_level is not None:
+                                log(f"  Modification level: {status.modification_level.name}")
+                            elif status.diff_result is None:
+                                log("  Modification analysis skipped, later revisions not checked")
+                            if status.docmdp_ok is False:
+                                log("  ⚠ Document was modified in a way that violates the permissions set by the signer")
                         
-                    except Exception as e:
-                        self.log(f"  ✗ Signature validation failed: {str(e)}")
-            
+                        except Exception as e:
+                            record_failure("verify", e)
+                            if status is None:
+                                write_record(signature_record(pdf_file, idx, sig, error=e))
+                            log(f"  ✗ Signature validation failed: {str(e)}")
+                return f"{len(sigs)} signature(s)"
+
+            def job_func(job):
+                log = lambda message: job.post(self.log, message)
+                try:
+                    return verify_document(job, log)
+                except JobCancelled:
+                    raise
+                except Exception as e:
+                    log(f"Error verifying PDF: {str(e)}")
+                    raise
+
+            run_job(self.jobs, "verify", f"Verify {os.path.basename(pdf_file)}", job_func)
+
         except Exception as e:
             self.log(f"Error verifying PDF: {str(e)}")
 
@@ -1107,12 +1479,20 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(800, 600)
         
         tabs = QTabWidget()
+        # sign and verify requests run in the background, listed below the tabs
+        self.jobs = JobQueuePanel()
         
         tabs.addTab(CertificateGenerationTab(), "Generate Certificates")
-        tabs.addTab(PDFSigningTab(), "Sign PDF")
-        tabs.addTab(PDFVerificationTab(), "Verify PDF")
+        tabs.addTab(PDFSigningTab(self.jobs), "Sign PDF")
+        tabs.addTab(PDFVerificationTab(self.jobs), "Verify PDF")
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(tabs)
+        splitter.addWidget(self.jobs)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
         
-        self.setCentralWidget(tabs)
+        self.setCentralWidget(splitter)
 
     def startDirectoryChecker(self):
         """Start timer for directory checker."""
@@ -1129,9 +1509,19 @@ class MainWindow(QMainWindow):
                 "Please plug apropriate storage device or change private key directory.")
 
 if __name__ == '__main__':
-    with open("last-key-path.txt", "r") as file:
-        selected_directory = file.readline().strip()
+    selected_directory = get_config().key_directory
+    trace_file = os.environ.get("PDF_SIGNER_TRACE")
+    if trace_file:
+        enable_tracing()
+    metrics_port = os.environ.get("PDF_SIGNER_METRICS_PORT")
+    if metrics_port:
+        MetricsServer(port=int(metrics_port)).start()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    # let started jobs finish writing their documents
+    window.jobs.wait()
+    if trace_file:
+        write_trace(trace_file)
+    sys.exit(exit_code)
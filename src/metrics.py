@@ -0,0 +1,330 @@
+"""@package docstring
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms of the sign, verify and certificate
+generation code paths are collected in REGISTRY. Batch runs write them
+to a node_exporter textfile (`cli.py sign --metrics-file ...`), long
+running processes serve them on a local `/metrics` endpoint.
+
+A forked worker process starts with empty values; its batch scheduler
+drains them after every job and the parent merges them, gauges as deltas.
+"""
+import os
+import time
+import bisect
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+## Histogram bucket upper bounds in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of labelled metrics, one value per label combination."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def _drain(self):
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def _merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self):
+        """Metric in Prometheus text format."""
+
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """Increase counter of the label values."""
+
+        if amount < 0:
+            raise ValueError("Counters can only increase.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Current value of the label values."""
+
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. queue depth."""
+
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """Decrease gauge of the label values."""
+
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        """Set gauge of the label values."""
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record one observation."""
+
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with block, also when it raises."""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """Number of observations of the label values."""
+
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def _merge(self, values):
+        with self._lock:
+            for key, (counts, total) in values.items():
+                own_counts, own_total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+                self._values[key] = ([own + count for own, count in zip(own_counts, counts)], own_total + total)
+
+    def _samples(self):
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._values.items())]
+        samples = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels + (("le", _format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class Registry:
+    """Named metrics of one process."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type or labels.")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Get or create counter."""
+
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Get or create gauge."""
+
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Get or create histogram."""
+
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def drain(self):
+        """Values recorded since the last drain, by metric name, and reset them."""
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: values for metric in metrics for values in [metric._drain()] if values}
+
+    def merge(self, drained):
+        """Add values drained in a worker process."""
+
+        with self._lock:
+            metrics = dict(self._metrics)
+        for name, values in drained.items():
+            if name in metrics:
+                metrics[name]._merge(values)
+
+    def _reset_after_fork(self):
+        # another thread may have held a lock at fork time
+        self._lock = threading.Lock()
+        for metric in self._metrics.values():
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+    def render(self):
+        """All metrics in Prometheus text format."""
+
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "".join(metric.render() + "\n" for metric in metrics)
+
+    def write_textfile(self, path):
+        """Atomically write all metrics for the node_exporter textfile collector."""
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=REGISTRY._reset_after_fork)
+
+DOCUMENTS_SIGNED = REGISTRY.counter("pdf_signer_documents_signed_total", "Documents signed.")
+DOCUMENTS_VERIFIED = REGISTRY.counter(
+    "pdf_signer_signatures_verified_total", "Signatures verified, by result.", ["result"]
+)
+CERTIFICATES_GENERATED = REGISTRY.counter(
+    "pdf_signer_certificates_generated_total", "Certificates generated, by kind.", ["kind"]
+)
+FAILURES = REGISTRY.counter(
+    "pdf_signer_failures_total", "Failed operations, by operation and exception type.", ["operation", "cause"]
+)
+BYTES_PROCESSED = REGISTRY.counter(
+    "pdf_signer_bytes_processed_total", "Input bytes of processed documents.", ["operation"]
+)
+KEY_LOAD_SECONDS = REGISTRY.histogram(
+    "pdf_signer_key_load_seconds", "Time to load signing keys, by backend.", ["backend"]
+)
+SIGN_SECONDS = REGISTRY.histogram("pdf_signer_sign_seconds", "Time to sign one document.")
+VERIFY_SECONDS = REGISTRY.histogram("pdf_signer_verify_seconds", "Time to validate one signature.")
+TSA_SECONDS = REGISTRY.histogram("pdf_signer_tsa_request_seconds", "Latency of timestamp server requests.")
+QUEUE_DEPTH = REGISTRY.gauge("pdf_signer_queue_depth", "Documents waiting to be processed.", ["queue"])
+
+
+def record_failure(operation, error):
+    """Count failed operation by the type of its exception."""
+
+    FAILURES.inc(operation=operation, cause=type(error).__name__)
+
+
+class MetricsServer:
+    """Threaded HTTP server exposing a registry on /metrics."""
+
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=0):
+        self.registry = registry
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0].rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = server.registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL of the metrics endpoint."""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        """Serve requests in a background thread."""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,169 @@
+"""@package docstring
+Selectable, cached difference analysis of revisions added after signing.
+
+Every signature that does not cover the whole file requires pyHanko to
+diff its signed revision against each later revision, which dominates
+validation time on heavily revised forms. Results of a diff between two
+revisions are cached under a digest of the file up to the end of the
+newer revision, so re-validating a document, or a copy of it with
+further revisions appended, only diffs revisions not analysed before.
+
+Levels:
+  off        - never diff, later revisions are not checked at all
+  on-failure - diff only where it can fail a signature: one that passes
+               without it but does not cover the whole file
+  always     - diff every signature (pyHanko default)
+
+A passing signature whose later revisions were not checked is neither
+valid nor invalid, see signature_verdict().
+"""
+import hashlib
+import dataclasses
+import threading
+from collections import OrderedDict
+
+from pyhanko.sign.diff_analysis import DEFAULT_DIFF_POLICY, StandardDiffPolicy, SuspiciousModification
+from pyhanko.sign.validation import validate_pdf_signature
+from pyhanko.sign.validation.status import SignatureCoverageLevel
+
+ANALYSIS_LEVELS = ("off", "on-failure", "always")
+## Verdicts of signature_verdict().
+VERDICTS = ("VALID", "INVALID", "UNCHECKED")
+## Maximum number of revision pair results kept in memory.
+DIFF_CACHE_SIZE = 4096
+
+_EOF_MARKER = b"%%EOF"
+_CHUNK_SIZE = 4096
+
+_diffs = OrderedDict()
+_diffs_lock = threading.Lock()
+
+
+def _revision_end(stream, meta_info):
+    # a revision ends with the first %%EOF after its xref data
+    position = meta_info.end_location
+    stream.seek(position)
+    window = b""
+    while True:
+        chunk = stream.read(_CHUNK_SIZE)
+        if not chunk:
+            return position + len(window)
+        window += chunk
+        found = window.find(_EOF_MARKER)
+        if found != -1:
+            return position + found + len(_EOF_MARKER)
+        # keep a partial marker split across chunks
+        drop = max(len(window) - len(_EOF_MARKER) + 1, 0)
+        position += drop
+        window = window[drop:]
+
+
+def revision_digests(reader):
+    """SHA-256 of the file up to the end of each revision, None if not strictly incremental."""
+
+    stream = reader.stream
+    saved_position = stream.tell()
+    try:
+        digests = []
+        digest = hashlib.sha256()
+        offset = 0
+        for revision in range(reader.xrefs.total_revisions):
+            end = _revision_end(stream, reader.xrefs.get_xref_container_info(revision))
+            if end <= offset:
+                return None
+            stream.seek(offset)
+            digest.update(stream.read(end - offset))
+            offset = end
+            digests.append(digest.digest())
+        return digests
+    finally:
+        stream.seek(saved_position)
+
+
+class CachingDiffPolicy(StandardDiffPolicy):
+    """StandardDiffPolicy memoizing results per (signed revision, later revision) pair.
+
+    One instance serves one document reader.
+    """
+
+    def __init__(self, reader, base_policy=DEFAULT_DIFF_POLICY):
+        super().__init__(
+            global_rules=base_policy.global_rules,
+            form_rule=base_policy.form_rule,
+            reject_object_freeing=base_policy.reject_object_freeing,
+            ignore_orphaned_objects=base_policy.ignore_orphaned_objects,
+            ignore_identical_objects=base_policy.ignore_identical_objects,
+        )
+        self.digests = revision_digests(reader)
+        self.hits = 0
+        self.misses = 0
+
+    def apply(self, old, new, field_mdp_spec=None, doc_mdp=None):
+        if self.digests is None:
+            return super().apply(old, new, field_mdp_spec, doc_mdp)
+        key = (self.digests[new.revision], old.revision, new.revision, repr(field_mdp_spec), doc_mdp)
+        with _diffs_lock:
+            result = _diffs.get(key)
+            if result is not None:
+                _diffs.move_to_end(key)
+        if result is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                result = super().apply(old, new, field_mdp_spec, doc_mdp)
+            except SuspiciousModification as e:
+                result = e
+            with _diffs_lock:
+                _diffs[key] = result
+                while len(_diffs) > DIFF_CACHE_SIZE:
+                    _diffs.popitem(last=False)
+        if isinstance(result, SuspiciousModification):
+            raise result.with_traceback(None)
+        return result
+
+
+def validate_signature(embedded_sig, validation_context, key_usage_settings=None, level="always",
+                       diff_policy=None):
+    """validate_pdf_signature with difference analysis at the given level.
+
+    With "on-failure" the analysis is skipped where it cannot change the
+    verdict: for signatures already failing and for those covering the
+    whole file.
+    """
+
+    if level not in ANALYSIS_LEVELS:
+        raise ValueError(f"Unknown modification analysis level: {level}")
+    if diff_policy is None and level != "off":
+        diff_policy = CachingDiffPolicy(embedded_sig.reader)
+
+    status = validate_pdf_signature(
+        embedded_sig, validation_context, key_usage_settings=key_usage_settings,
+        diff_policy=diff_policy, skip_diff=level != "always"
+    )
+    if level == "on-failure" and status.bottom_line and status.coverage != SignatureCoverageLevel.ENTIRE_FILE:
+        # crypto and trust results stand, only the integrity summary is redone
+        embedded_sig.diff_result = embedded_sig.evaluate_modifications(diff_policy)
+        status = dataclasses.replace(status, **embedded_sig.summarise_integrity_info())
+    return status
+
+
+def later_revisions_unchecked(status):
+    """True if revisions added after signing were neither covered nor diffed."""
+
+    return status.coverage != SignatureCoverageLevel.ENTIRE_FILE and status.docmdp_ok is None
+
+
+def signature_verdict(status):
+    """VALID, INVALID, or UNCHECKED for a passing signature whose later revisions were not checked."""
+
+    if not status.bottom_line:
+        return "INVALID"
+    return "UNCHECKED" if later_revisions_unchecked(status) else "VALID"
+
+
+def clear_diff_cache():
+    """Drop all cached diff results."""
+
+    with _diffs_lock:
+        _diffs.clear()
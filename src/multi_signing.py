@@ -0,0 +1,96 @@
+"""@package docstring
+Several signatures (e.g. author, reviewer, approver) on one document in one pass.
+
+The signers are applied in order as successive incremental revisions.
+The input is read once into a memory buffer and every revision is
+appended to that buffer in place, so there is no file round-trip and no
+copy of the document between signers; only the final document is
+written. Revision n+1 hashes the output of revision n, so hashing cannot
+run ahead, but the network work that does not depend on the document is
+started up front: revocation info of every signer's chain, needed for
+PAdES-B-LT/LTA, is fetched into the shared cache in the background
+while the first revisions are signed.
+"""
+import io
+from collections import namedtuple
+
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+from signing import DEFAULT_FIELD_BOX, sign_revision, unlock_document, open_document, document_name, document_size
+from revocation import prefetch_revocation_info
+from metrics import DOCUMENTS_SIGNED, BYTES_PROCESSED, SIGN_SECONDS, record_failure
+from tracing import span
+
+SignerStep = namedtuple("SignerStep", [
+    "cms_signer", "signature_meta", "create_field", "field_box", "field_page", "stamp_style", "timestamper",
+])
+SignerStep.__new__.__defaults__ = (False, DEFAULT_FIELD_BOX, 0, None, None)
+
+
+def _chain_certs(cms_signer):
+    certs = [cms_signer.signing_cert]
+    registry = getattr(cms_signer, 'cert_registry', None)
+    if registry is not None:
+        certs.extend(cert for cert in registry if cert != cms_signer.signing_cert)
+    return certs
+
+
+def prefetch_signer_revocation_info(steps):
+    """Start fetching revocation info of signers embedding validation info.
+
+    Returns the prefetcher, or None when no step needs revocation info.
+    """
+
+    certs = {}
+    for step in steps:
+        if step.signature_meta.embed_validation_info:
+            for cert in _chain_certs(step.cms_signer):
+                certs[cert.sha256] = cert
+    if not certs:
+        return None
+    return prefetch_revocation_info(certs.values())
+
+
+def sign_successively(pdf_file, output_file, steps, log=None, prefetch=True, credentials=None):
+    """Apply the signatures of steps, in order, to one document.
+
+    Every SignerStep becomes its own incremental revision, so later
+    signatures cover the earlier ones. pdf_file and output_file are paths
+    or seekable binary streams. Nothing is written when any step fails.
+    Encrypted documents are unlocked with credentials; every revision
+    after the first reuses the cached document key.
+    """
+
+    log = log or (lambda message: None)
+    steps = list(steps)
+    if not steps:
+        raise ValueError("No signers given.")
+    if prefetch:
+        prefetch_signer_revocation_info(steps)
+    try:
+        with SIGN_SECONDS.time(), span("sign_successively", file=document_name(pdf_file), signers=len(steps)):
+            with open_document(pdf_file, 'rb') as doc:
+                buffer = io.BytesIO(doc.read())
+            for number, step in enumerate(steps, 1):
+                with span("sign_step", step=number, field=step.signature_meta.field_name):
+                    with span("parse_pdf"):
+                        w = IncrementalPdfFileWriter(buffer)
+                    unlock_document(w.prev, document_name(pdf_file), credentials)
+                    sign_revision(
+                        w, step.cms_signer, step.signature_meta,
+                        create_field=step.create_field,
+                        field_box=step.field_box,
+                        field_page=step.field_page,
+                        stamp_style=step.stamp_style,
+                        timestamper=step.timestamper,
+                        log=log,
+                        in_place=True
+                    )
+                log(f"Signed field {step.signature_meta.field_name} ({number}/{len(steps)})")
+            with open_document(output_file, 'wb') as out:
+                out.write(buffer.getbuffer())
+    except Exception as e:
+        record_failure("sign", e)
+        raise
+    DOCUMENTS_SIGNED.inc()
+    BYTES_PROCESSED.inc(document_size(pdf_file), operation="sign")
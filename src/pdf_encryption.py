@@ -0,0 +1,130 @@
+"""@package docstring
+Opening encrypted PDF documents with cached document keys.
+
+Passwords come from the command line, PDF_SIGNER_PDF_PASSWORD or the
+GUI, or per file from a JSON file (--pdf-password-file, or the
+pdf_password_file of the signing profile) mapping file name patterns to
+passwords:
+
+{"invoices/*.pdf": "s3cret", "contract.pdf": "other"}
+
+Deriving the file key from a password is deliberately slow, and every
+wrong candidate password costs a full derivation. A DocumentKeyCache
+lives for one batch and remembers the password that opened every
+encryption dictionary, so documents of the same source (same /O, /U
+and, for legacy encryption, the same document ID) and further revisions
+of the same document try that password first and derive the key once.
+"""
+import os
+import json
+import fnmatch
+import hashlib
+import threading
+
+from pyhanko.pdf_utils.crypt import StandardSecurityHandler, AuthStatus
+
+from metrics import record_failure
+from tracing import span
+
+
+class PasswordError(ValueError):
+    """Encrypted document and no working password."""
+
+
+def load_password_file(path):
+    """Read a JSON file mapping file name patterns to passwords."""
+
+    with open(path, 'r', encoding='utf-8') as f:
+        passwords = json.load(f)
+    if not isinstance(passwords, dict) or not all(isinstance(value, str) for value in passwords.values()):
+        raise PasswordError(f"{path} must map file name patterns to passwords.")
+    return passwords
+
+
+class DocumentKeyCache:
+    """Passwords known to open encryption dictionaries, shared by the threads of a batch."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _cache_key(handler, id1, password):
+        digest = hashlib.sha256()
+        for value in (handler.revision.value, handler.keylen, handler.perms, handler.encrypt_metadata,
+                      handler.odata, handler.udata, handler.oeseed, handler.ueseed, handler.encrypted_perms,
+                      # legacy file keys depend on the document ID, AES-256 keys do not
+                      id1 if handler.revision.value < 6 else None, password):
+            digest.update(repr(value).encode() if not isinstance(value, bytes) else value)
+            digest.update(b"\0")
+        return digest.digest()
+
+    def lookup(self, handler, id1, passwords):
+        """First of passwords known to open the encryption dictionary, or None."""
+
+        cache_keys = [(self._cache_key(handler, id1, password), password) for password in passwords]
+        with self._lock:
+            for cache_key, password in cache_keys:
+                if cache_key in self._keys:
+                    self.hits += 1
+                    return password
+            self.misses += 1
+            return None
+
+    def put(self, handler, id1, password):
+        with self._lock:
+            self._keys.add(self._cache_key(handler, id1, password))
+
+
+class PdfCredentials:
+    """Candidate passwords of a batch and its document key cache."""
+
+    def __init__(self, passwords=(), per_file=None, key_cache=None):
+        self.passwords = [password for password in passwords if password]
+        self.per_file = dict(per_file or {})
+        self.key_cache = key_cache or DocumentKeyCache()
+
+    def candidates(self, name):
+        """Passwords to try for a document, most specific first."""
+
+        candidates = []
+        if name:
+            for pattern, password in self.per_file.items():
+                if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(os.path.basename(name), pattern):
+                    candidates.append(password)
+        # an empty user password opens documents that only restrict permissions
+        for password in self.passwords + [""]:
+            if password not in candidates:
+                candidates.append(password)
+        return candidates
+
+    def unlock(self, reader, name=None):
+        """Authenticate an encrypted PdfFileReader, no-op for plain documents.
+
+        Returns the AuthResult, raises PasswordError when no candidate
+        password works.
+        """
+
+        if not reader.encrypted:
+            return None
+        handler = reader.security_handler
+        if not isinstance(handler, StandardSecurityHandler):
+            raise PasswordError(f"{name or 'Document'} uses unsupported {type(handler).__name__} encryption.")
+        id1 = reader.document_id[0] if handler.revision.value < 6 else None
+        candidates = self.candidates(name)
+        with span("unlock_pdf"):
+            known = self.key_cache.lookup(handler, id1, candidates)
+            if known is not None:
+                # skip the derivations of wrong candidates
+                candidates = [known] + [password for password in candidates if password != known]
+            for password in candidates:
+                result = reader.decrypt(password)
+                if result.status != AuthStatus.FAILED:
+                    self.key_cache.put(handler, id1, password)
+                    return result
+        error = PasswordError(f"{name or 'Document'} is encrypted and none of "
+                              f"{len(candidates)} password(s) opens it.")
+        record_failure("decrypt", error)
+        raise error
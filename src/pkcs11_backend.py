@@ -0,0 +1,163 @@
+"""@package docstring
+PKCS#11 signing backend with a pool of logged-in sessions.
+
+Opening a session, logging in and looking up key and certificate objects
+is expensive on most tokens, so each pooled session keeps a ready
+PKCS11Signer. Batch workers borrow a signer for one document and give it
+back, instead of paying the setup cost per document.
+
+Requires python-pkcs11 (`pip install 'pyHanko[pkcs11]'`).
+"""
+import hmac
+import queue
+import hashlib
+import secrets
+import threading
+import contextlib
+
+import pkcs11
+from pkcs11.exceptions import UserAlreadyLoggedIn
+from pyhanko.config.pkcs11 import TokenCriteria
+from pyhanko.keys import load_cert_from_pemder
+from pyhanko.sign.pkcs11 import PKCS11Signer, find_token
+
+DEFAULT_POOL_SIZE = 4
+
+_pools = {}
+_pools_lock = threading.Lock()
+# pools are keyed on a keyed hash of the PIN, so the PIN itself is not kept as a key
+_pin_secret = secrets.token_bytes(32)
+
+
+class PKCS11SessionPool:
+    """Bounded pool of logged-in PKCS#11 sessions with loaded signers."""
+
+    def __init__(self, module_path, token_label=None, slot_no=None, user_pin=None,
+                 key_label=None, cert_label=None, signing_cert=None, ca_chain=(),
+                 size=DEFAULT_POOL_SIZE):
+        if not (key_label or cert_label):
+            raise ValueError("PKCS#11 key label or certificate label is required.")
+        self.module_path = module_path
+        self.user_pin = user_pin
+        self.key_label = key_label
+        self.cert_label = cert_label
+        self.signing_cert = signing_cert
+        self.ca_chain = list(ca_chain)
+        self.size = size
+
+        token_criteria = TokenCriteria(label=token_label) if token_label else None
+        self.token = find_token(
+            pkcs11.lib(module_path).get_slots(), slot_no=slot_no, token_criteria=token_criteria
+        )
+        if self.token is None:
+            raise ValueError(f"No PKCS#11 token matching label={token_label!r} slot={slot_no!r} found.")
+
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _open_session(self):
+        """Open session, logging in only if the token is not logged in yet."""
+
+        if self.user_pin is None:
+            return self.token.open()
+        try:
+            return self.token.open(user_pin=self.user_pin)
+        except UserAlreadyLoggedIn:
+            # login state is shared by all sessions of this process
+            return self.token.open()
+
+    def _new_signer(self):
+        session = self._open_session()
+        try:
+            # asn1crypto objects parse lazily and are not thread-safe,
+            # so every pooled signer gets its own copies
+            signer = PKCS11Signer(
+                session,
+                cert_label=self.cert_label,
+                key_label=self.key_label,
+                signing_cert=self.signing_cert.copy() if self.signing_cert else None,
+                ca_chain=[cert.copy() for cert in self.ca_chain],
+            )
+            # force key and certificate lookup now, not on first signature
+            signer.signing_cert
+        except BaseException:
+            # a failed lookup must not keep a pool slot
+            try:
+                session.close()
+            except pkcs11.PKCS11Error:
+                pass
+            raise
+        self._sessions.append(session)
+        return signer
+
+    def _acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._sessions) < self.size:
+                return self._new_signer()
+        return self._idle.get(timeout=timeout)
+
+    @contextlib.contextmanager
+    def signer(self, timeout=None):
+        """Borrow a PKCS11Signer for the duration of the with block."""
+
+        signer = self._acquire(timeout)
+        try:
+            yield signer
+        finally:
+            self._idle.put(signer)
+
+    def close(self):
+        """Close all pooled sessions."""
+
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait()
+                except queue.Empty:
+                    break
+            for session in self._sessions:
+                try:
+                    session.close()
+                except pkcs11.PKCS11Error:
+                    pass
+            self._sessions.clear()
+
+
+def get_session_pool(module_path, token_label=None, slot_no=None, user_pin=None,
+                     key_label=None, cert_label=None, cert_file=None, ca_chain_files=(),
+                     size=DEFAULT_POOL_SIZE):
+    """Return shared session pool for the given token, key, PIN and size."""
+
+    # a corrected PIN or another pool size gets its own pool
+    pin_tag = hmac.new(_pin_secret, user_pin.encode(), hashlib.sha256).digest() if user_pin is not None else None
+    key = (module_path, token_label, slot_no, key_label, cert_label, cert_file, tuple(ca_chain_files), pin_tag,
+           size)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = PKCS11SessionPool(
+                module_path,
+                token_label=token_label,
+                slot_no=slot_no,
+                user_pin=user_pin,
+                key_label=key_label,
+                cert_label=cert_label,
+                signing_cert=load_cert_from_pemder(cert_file) if cert_file else None,
+                ca_chain=[load_cert_from_pemder(path) for path in ca_chain_files],
+                size=size,
+            )
+        return pool
+
+
+def close_session_pools():
+    """Close every shared session pool."""
+
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -0,0 +1,253 @@
+"""@package docstring
+Named signing profiles kept in one JSON config file.
+
+A profile bundles key source, certificate, CA chain, field and signer
+details, signature image and PAdES options, so the GUI, `cli.py sign
+--signing-profile NAME` and queue workers sign the same way. The
+config also remembers the private key directory, formerly kept in
+last-key-path.txt. It is read once per process; resolved profiles, their
+chains and appearances are cached, unlocked keys live in the key cache.
+
+{
+  "key_directory": "/media/usb/keys",
+  "cert_directories": ["/etc/pdf-signer/certs"],
+  "default_profile": "contoso",
+  "profiles": {
+    "contoso": {"key": "signer.key", "cert": "signer.pem", "chain": ["ca.pem"],
+                "location": "Redmond", "image": "sig.png", "pades_level": "B-T"}
+  }
+}
+
+Relative paths are resolved against the directory of the config file.
+Passwords of encrypted PDF documents are not kept in the config, a
+profile may name a pdf_password_file instead.
+"""
+import os
+import json
+import threading
+from collections import namedtuple
+
+from pyhanko.keys import load_cert_from_pemder
+
+from signing import DEFAULT_FIELD_BOX, parse_field_box
+from appearance import ImageStampStyle
+from timestamping import DEFAULT_TSA_URL
+from ltv import PADES_LEVELS
+from key_storage import is_pkcs12, load_signer
+from metrics import KEY_LOAD_SECONDS
+from tracing import span
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".config", "pdf-signer", "config.json")
+## Key directory file of earlier versions, read when the config has none.
+LEGACY_KEY_PATH_FILE = "last-key-path.txt"
+
+SigningProfile = namedtuple("SigningProfile", [
+    "name", "key", "cert", "chain", "pkcs11_module", "pkcs11_token", "pkcs11_key_label", "pkcs11_cert_label",
+    "field_name", "create_field", "field_box", "field_page", "location", "contact_info", "image",
+    "timestamp", "tsa_url", "pades_level", "pdf_password_file",
+])
+
+_PATH_SETTINGS = ("key", "cert", "pkcs11_module", "image", "pdf_password_file")
+_DEFAULTS = {
+    'key': None, 'cert': None, 'chain': (), 'pkcs11_module': None, 'pkcs11_token': None,
+    'pkcs11_key_label': None, 'pkcs11_cert_label': None, 'field_name': "Signature1", 'create_field': False,
+    'field_box': DEFAULT_FIELD_BOX, 'field_page': 0, 'location': None, 'contact_info': None, 'image': None,
+    'timestamp': False, 'tsa_url': DEFAULT_TSA_URL, 'pades_level': "B-B", 'pdf_password_file': None,
+}
+
+
+class ProfileError(ValueError):
+    """Invalid or unknown signing profile."""
+
+
+class ProfileConfig:
+    """Parsed config file with cached profile resolution."""
+
+    def __init__(self, path=DEFAULT_CONFIG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._chains = {}
+        self._stamp_styles = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        self.data.setdefault('profiles', {})
+
+    @property
+    def key_directory(self):
+        """Directory of private keys, "." if never chosen."""
+
+        directory = self.data.get('key_directory')
+        if directory is None:
+            try:
+                with open(LEGACY_KEY_PATH_FILE, 'r') as file:
+                    directory = file.readline().strip() or None
+            except OSError:
+                pass
+        return directory or "."
+
+    def set_key_directory(self, directory):
+        """Remember directory of private keys."""
+
+        self.data['key_directory'] = directory
+        self.save()
+
+    def certificate_directories(self):
+        """Directories scanned for certificates.
+
+        The key directory, "cert_directories" of the config and the
+        directories of the certificates, chains and PKCS#12 keys of all
+        valid profiles.
+        """
+
+        directories = [self.key_directory]
+        for directory in self.data.get('cert_directories', []):
+            directories.append(os.path.join(os.path.dirname(os.path.abspath(self.path)), os.path.expanduser(directory)))
+        for name in self.profile_names():
+            try:
+                profile = self.profile(name)
+            except ProfileError:
+                continue
+            for path in (profile.cert,) + profile.chain:
+                if path:
+                    directories.append(os.path.dirname(path))
+        unique = []
+        for directory in directories:
+            directory = os.path.abspath(directory)
+            if directory not in unique:
+                unique.append(directory)
+        return unique
+
+    @property
+    def default_profile(self):
+        """Name of the profile preselected in the GUI, or None."""
+
+        return self.data.get('default_profile')
+
+    def profile_names(self):
+        """Sorted profile names."""
+
+        return sorted(self.data['profiles'])
+
+    def _resolve_path(self, value):
+        if not value:
+            return None
+        path = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(self.path)), os.path.expanduser(value)))
+        if not os.path.exists(path):
+            raise ProfileError(f"File {path} does not exist.")
+        return path
+
+    def profile(self, name):
+        """Validated SigningProfile with absolute paths."""
+
+        with self._lock:
+            profile = self._profiles.get(name)
+        if profile is not None:
+            return profile
+        settings = self.data['profiles'].get(name)
+        if settings is None:
+            raise ProfileError(f"Unknown signing profile: {name}")
+        if 'pdf_password' in settings:
+            raise ProfileError(f"Profile {name} keeps a PDF password in plain text, move it to a "
+                               f"pdf_password_file or PDF_SIGNER_PDF_PASSWORD.")
+        unknown = set(settings) - set(_DEFAULTS)
+        if unknown:
+            raise ProfileError(f"Unknown settings in profile {name}: {', '.join(sorted(unknown))}")
+        values = dict(_DEFAULTS, **settings)
+        try:
+            for setting in _PATH_SETTINGS:
+                values[setting] = self._resolve_path(values[setting])
+            values['chain'] = tuple(self._resolve_path(path) for path in values['chain'])
+        except ProfileError as e:
+            raise ProfileError(f"Profile {name}: {e}") from None
+        if not (values['key'] and (values['cert'] or is_pkcs12(values['key']))) and not values['pkcs11_module']:
+            raise ProfileError(f"Profile {name} needs key and cert, a PKCS#12 key or pkcs11_module.")
+        if values['pades_level'] not in PADES_LEVELS:
+            raise ProfileError(f"Profile {name}: unknown PAdES level {values['pades_level']}")
+        try:
+            values['field_box'] = parse_field_box(", ".join(str(c) for c in values['field_box']))
+        except (TypeError, ValueError) as e:
+            raise ProfileError(f"Profile {name}: {e}") from None
+        profile = SigningProfile(name=name, **values)
+        with self._lock:
+            self._profiles[name] = profile
+        return profile
+
+    def chain(self, name):
+        """Loaded CA chain certificates of a profile."""
+
+        profile = self.profile(name)
+        with self._lock:
+            chain = self._chains.get(name)
+        if chain is None:
+            chain = [load_cert_from_pemder(path) for path in profile.chain]
+            with self._lock:
+                self._chains[name] = chain
+        return chain
+
+    def stamp_style(self, name):
+        """ImageStampStyle of a profile, or None without image."""
+
+        profile = self.profile(name)
+        if not profile.image:
+            return None
+        with self._lock:
+            return self._stamp_styles.setdefault(name, ImageStampStyle(image_path=profile.image, border_width=0))
+
+    def signer(self, name, passphrase=None):
+        """New SimpleSigner of a key file profile, for one document or revision.
+
+        The key is unlocked once through the shared key cache, which
+        wipes it after the idle time; signers are not kept, so callers
+        should drop them after signing.
+        """
+
+        profile = self.profile(name)
+        if not profile.key:
+            raise ProfileError(f"Profile {name} has no key file.")
+        try:
+            with KEY_LOAD_SECONDS.time(backend="file"), span("load_key", backend="file", profile=name):
+                return load_signer(profile.key, profile.cert, profile.chain, passphrase)
+        except ValueError as e:
+            raise ProfileError(f"Profile {name}: {e}") from e
+
+    def set_profile(self, name, **settings):
+        """Add or replace a profile, paths are stored as given."""
+
+        unknown = set(settings) - set(_DEFAULTS)
+        if unknown:
+            raise ProfileError(f"Unknown profile settings: {', '.join(sorted(unknown))}")
+        self.data['profiles'][name] = {key: value for key, value in settings.items() if value not in (None, (), [])}
+        with self._lock:
+            self._profiles.pop(name, None)
+            self._chains.pop(name, None)
+            self._stamp_styles.pop(name, None)
+        self.save()
+
+    def save(self):
+        """Atomically write the config file, readable by its owner only."""
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, default=list)
+        os.replace(tmp_path, self.path)
+
+
+_configs = {}
+_configs_lock = threading.Lock()
+
+
+def get_config(path=None):
+    """ProfileConfig of path, default from PDF_SIGNER_CONFIG, read once per process."""
+
+    path = os.path.abspath(path or os.environ.get("PDF_SIGNER_CONFIG") or DEFAULT_CONFIG_PATH)
+    with _configs_lock:
+        config = _configs.get(path)
+        if config is None:
+            config = _configs[path] = ProfileConfig(path)
+        return config
@@ -0,0 +1,140 @@
+"""@package docstring
+Local stand-in for a remote (HSM-like) signing service.
+
+Holds the private key in its own process and signs batches of
+pre-computed digests over HTTP, for tests of two-phase signing.
+Run `python remote_signer.py --key signer.key --cert signer.pem --port 8081`.
+
+Endpoints:
+  GET  /certificates  -> {"signing_cert": b64 DER, "chain": [b64 DER, ...]}
+  POST /sign          {"md_algorithm": "sha256", "digests": [b64, ...]}
+                      -> {"signatures": [b64, ...]}
+"""
+import json
+import time
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from pyhanko.keys import load_cert_from_pemder
+
+from deferred_signing import LocalKeyBackend
+
+
+class RemoteSignerServer:
+    """Threaded HTTP server exposing a LocalKeyBackend."""
+
+    def __init__(self, backend, host="127.0.0.1", port=0, delay=0.0):
+        self.backend = backend
+        self.delay = delay
+        self.round_trips = 0
+        self.digests_signed = 0
+        server = self
+
+        signing_cert, ca_chain = backend.get_certificates()
+        certificates = json.dumps({
+            'signing_cert': base64.b64encode(signing_cert.dump()).decode('ascii'),
+            'chain': [base64.b64encode(c.dump()).decode('ascii') for c in ca_chain],
+        }).encode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip('/') != '/certificates':
+                    self.send_error(404)
+                    return
+                self._reply(certificates)
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/sign':
+                    self.send_error(404)
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    digests = [base64.b64decode(d) for d in request['digests']]
+                    signatures = backend.sign_digests(digests, request.get('md_algorithm', 'sha256'))
+                except Exception as e:
+                    self.send_error(400, f"Invalid signing request: {e}")
+                    return
+                if server.delay:
+                    time.sleep(server.delay)
+                server.round_trips += 1
+                server.digests_signed += len(digests)
+                self._reply(json.dumps({
+                    'signatures': [base64.b64encode(s).decode('ascii') for s in signatures]
+                }).encode())
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        """URL of the running signer."""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def load_backend(key, cert, chain=(), passphrase=None):
+    """Load LocalKeyBackend from PEM files."""
+
+    with open(key, 'rb') as f:
+        private_key = load_pem_private_key(f.read(), passphrase.encode() if passphrase else None)
+    return LocalKeyBackend(
+        private_key,
+        load_cert_from_pemder(cert),
+        [load_cert_from_pemder(path) for path in chain]
+    )
+
+
+@click.command()
+@click.option("--key", required=True, type=click.Path(exists=True), help="Signer private key.")
+@click.option("--cert", required=True, type=click.Path(exists=True), help="Signer certificate.")
+@click.option("--chain", multiple=True, type=click.Path(exists=True), help="CA chain certificate.")
+@click.option("--passphrase", default=None, help="Private key passphrase.")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8081, show_default=True)
+@click.option("--delay", default=0.0, show_default=True, help="Artificial latency per round-trip in seconds.")
+def main(key, cert, chain, passphrase, host, port, delay):
+    """Run local stand-in remote signer."""
+
+    signer = RemoteSignerServer(load_backend(key, cert, chain, passphrase), host, port, delay)
+    click.echo(f"Remote signer listening on {signer.url}")
+    try:
+        signer.server.serve_forever()
+    except KeyboardInterrupt:
+        signer.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
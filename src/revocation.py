@@ -0,0 +1,377 @@
+"""@package docstring
+Revocation checking backed by an on-disk CRL/OCSP cache.
+
+CRLs and OCSP responses are stored as DER files and reused until their
+nextUpdate, so verifying a batch of documents from the same CA fetches
+revocation data once instead of once per document. A background
+prefetcher warms the cache for the certificates of the trust store.
+"""
+import os
+import time
+import queue
+import asyncio
+import hashlib
+import logging
+import threading
+
+import requests
+from asn1crypto import crl, ocsp, pem
+from pyhanko_certvalidator import ValidationContext, errors
+from pyhanko_certvalidator.authority import AuthorityWithCert
+from pyhanko_certvalidator.fetchers.api import CRLFetcher, OCSPFetcher, FetcherBackend, Fetchers
+from pyhanko_certvalidator.fetchers.common_utils import (format_ocsp_request, process_ocsp_response_data,
+                                                         enumerate_delivery_point_urls)
+from pyhanko_certvalidator.fetchers.requests_fetchers.cert_fetch_client import RequestsCertificateFetcher
+from pyhanko_certvalidator.util import get_ocsp_urls, get_relevant_crl_dps, issuer_serial
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf-signer", "revocation")
+DEFAULT_TIMEOUT = 10
+## Lifetime of cached data without nextUpdate, in seconds.
+DEFAULT_MAX_AGE = 3600
+## Revocation check settings offered to users, "off" never fetches.
+REVOCATION_MODES = ("off", "soft-fail", "hard-fail", "require")
+
+
+def _next_update_of_crl(crl_list):
+    return crl_list['tbs_cert_list']['next_update'].native
+
+
+def _next_update_of_ocsp(ocsp_response):
+    basic = ocsp_response['response_bytes']['response'].parsed
+    return basic['tbs_response_data']['responses'][0]['next_update'].native
+
+
+class RevocationCache:
+    """Thread-safe CRL/OCSP store in memory and on disk, honoring nextUpdate."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, timeout=DEFAULT_TIMEOUT, max_age=DEFAULT_MAX_AGE,
+                 session=None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_age = max_age
+        self.session = session or requests.Session()
+        self.hits = 0
+        self.fetches = 0
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, kind, key):
+        return os.path.join(self.cache_dir, kind, f"{key}.der")
+
+    def _expiry(self, next_update, fetched_at):
+        if next_update is not None:
+            return next_update.timestamp()
+        return fetched_at + self.max_age
+
+    def _reset_after_fork(self):
+        # pooled connections must not be shared with the parent, locks may have been held by its threads
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _lookup(self, kind, key, load, next_update_of):
+        """Return fresh cached object or None."""
+
+        now = time.time()
+        entry = self._memory.get((kind, key))
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        path = self._path(kind, key)
+        try:
+            with open(path, 'rb') as f:
+                obj = load(f.read())
+            expiry = self._expiry(next_update_of(obj), os.path.getmtime(path))
+        except (OSError, ValueError, KeyError):
+            return None
+        if expiry <= now:
+            return None
+        self._memory[(kind, key)] = (expiry, obj)
+        return obj
+
+    def _store(self, kind, key, data, obj, next_update):
+        expiry = self._expiry(next_update, time.time())
+        self._memory[(kind, key)] = (expiry, obj)
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _cached(self, kind, key, load, next_update_of, download):
+        """Return cached object, downloading it at most once at a time."""
+
+        obj = self._lookup(kind, key, load, next_update_of)
+        if obj is None:
+            with self._key_lock((kind, key)):
+                obj = self._lookup(kind, key, load, next_update_of)
+                if obj is None:
+                    data, obj = download()
+                    self.fetches += 1
+                    self._store(kind, key, data, obj, next_update_of(obj))
+                    return obj.copy()
+        self.hits += 1
+        # asn1crypto objects parse lazily and are not thread-safe
+        return obj.copy()
+
+    def get_crl(self, url):
+        """Return CRL published at url."""
+
+        def download():
+            logger.info(f"Requesting CRL from {url}...")
+            try:
+                res = self.session.get(url, timeout=self.timeout)
+                res.raise_for_status()
+                data = res.content
+                if pem.detect(data):
+                    _, _, data = pem.unarmor(data)
+                crl_list = crl.CertificateList.load(data)
+                _next_update_of_crl(crl_list)
+            except (ValueError, requests.RequestException) as e:
+                raise errors.CRLFetchError(f"Failure to fetch CRL from URL {url}") from e
+            return data, crl_list
+
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self._cached('crl', key, crl.CertificateList.load, _next_update_of_crl, download)
+
+    def get_ocsp(self, cert, authority):
+        """Return OCSP response for cert issued by authority."""
+
+        # no nonce, otherwise a response could not be reused
+        ocsp_request = format_ocsp_request(cert, authority, certid_hash_algo='sha1', request_nonces=False)
+        ocsp_urls = get_ocsp_urls(cert)
+        if not ocsp_urls:
+            raise errors.OCSPFetchError("No URLs to fetch OCSP responses from")
+
+        def download():
+            last_error = None
+            for url in ocsp_urls:
+                logger.info(f"Requesting OCSP response from {url}...")
+                try:
+                    res = self.session.post(
+                        url, data=ocsp_request.dump(), timeout=self.timeout,
+                        headers={'Content-Type': 'application/ocsp-request'}
+                    )
+                    res.raise_for_status()
+                    response = process_ocsp_response_data(res.content, ocsp_request=ocsp_request, ocsp_url=url)
+                    _next_update_of_ocsp(response)
+                    return res.content, response
+                except (ValueError, KeyError, requests.RequestException, errors.OCSPFetchError,
+                        errors.OCSPValidationError) as e:
+                    last_error = e
+            raise errors.OCSPFetchError(f"Failed to fetch OCSP response from {';'.join(ocsp_urls)}") from last_error
+
+        cert_id = ocsp_request['tbs_request']['request_list'][0]['req_cert']
+        key = hashlib.sha256(cert_id.dump()).hexdigest()
+        return self._cached('ocsp', key, ocsp.OCSPResponse.load, _next_update_of_ocsp, download)
+
+    def clear(self):
+        """Forget all cached data, in memory and on disk."""
+
+        with self._lock:
+            self._memory.clear()
+            for kind in ('crl', 'ocsp'):
+                directory = os.path.join(self.cache_dir, kind)
+                if os.path.isdir(directory):
+                    for name in os.listdir(directory):
+                        os.remove(os.path.join(directory, name))
+
+
+class CachedCRLFetcher(CRLFetcher):
+    """CRL fetcher reading through a RevocationCache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._by_cert = {}
+
+    async def fetch(self, cert, *, use_deltas=True):
+        iss_serial = issuer_serial(cert)
+        if iss_serial in self._by_cert:
+            return self._by_cert[iss_serial]
+
+        results = []
+        last_error = None
+        for distribution_point in get_relevant_crl_dps(cert, use_deltas=use_deltas):
+            for url in enumerate_delivery_point_urls(distribution_point):
+                try:
+                    results.append(await asyncio.to_thread(self.cache.get_crl, url))
+                    break
+                except errors.CRLFetchError as e:
+                    last_error = e
+        if not results and last_error is not None:
+            raise last_error
+        self._by_cert[iss_serial] = results
+        return results
+
+    def fetched_crls(self):
+        return {crl_list for results in self._by_cert.values() for crl_list in results}
+
+    def fetched_crls_for_cert(self, cert):
+        # KeyError tells the validator to fetch
+        return self._by_cert[issuer_serial(cert)]
+
+
+class CachedOCSPFetcher(OCSPFetcher):
+    """OCSP fetcher reading through a RevocationCache."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._responses = {}
+
+    async def fetch(self, cert, authority):
+        tag = (issuer_serial(cert), authority.hashable)
+        if tag not in self._responses:
+            self._responses[tag] = await asyncio.to_thread(self.cache.get_ocsp, cert, authority)
+        return self._responses[tag]
+
+    def fetched_responses(self):
+        return set(self._responses.values())
+
+    def fetched_responses_for_cert(self, cert):
+        target = issuer_serial(cert)
+        return {resp for (subject, _), resp in self._responses.items() if subject == target}
+
+
+class CachedFetcherBackend(FetcherBackend):
+    """Fetcher backend sharing one RevocationCache."""
+
+    def __init__(self, cache, timeout=DEFAULT_TIMEOUT):
+        self.cache = cache
+        self.timeout = timeout
+
+    def get_fetchers(self):
+        return Fetchers(
+            ocsp_fetcher=CachedOCSPFetcher(self.cache),
+            crl_fetcher=CachedCRLFetcher(self.cache),
+            cert_fetcher=RequestsCertificateFetcher(per_request_timeout=self.timeout),
+        )
+
+    async def close(self):
+        return
+
+
+class RevocationPrefetcher:
+    """Background thread warming a RevocationCache for trust store certificates."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._known = {}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, certs):
+        """Queue certificates whose revocation data should be fetched."""
+
+        self._queue.put(list(certs))
+
+    def join(self):
+        """Wait until all submitted certificates are processed."""
+
+        self._queue.join()
+
+    def _issuer_of(self, cert):
+        by_name = None
+        for candidate in self._known.values():
+            if candidate.subject != cert.issuer or candidate.public_key == cert.public_key:
+                continue
+            # CA names are not unique in generated chains, prefer key identifier match
+            if cert.authority_key_identifier in (candidate.key_identifier, candidate.public_key.sha1):
+                return candidate
+            by_name = by_name or candidate
+        return by_name
+
+    def _warm(self, cert):
+        for distribution_point in get_relevant_crl_dps(cert, use_deltas=True):
+            for url in enumerate_delivery_point_urls(distribution_point):
+                try:
+                    self.cache.get_crl(url)
+                    break
+                except errors.CRLFetchError as e:
+                    logger.warning(f"Prefetching CRL failed: {e}")
+        issuer = self._issuer_of(cert)
+        if issuer is not None and get_ocsp_urls(cert):
+            try:
+                self.cache.get_ocsp(cert, AuthorityWithCert(issuer))
+            except errors.OCSPFetchError as e:
+                logger.warning(f"Prefetching OCSP response failed: {e}")
+
+    def _run(self):
+        while True:
+            certs = self._queue.get()
+            try:
+                for cert in certs:
+                    self._known[cert.sha256] = cert
+                for cert in certs:
+                    self._warm(cert)
+            except Exception as e:
+                logger.warning(f"Prefetching revocation data failed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+_cache = None
+_prefetcher = None
+_shared_lock = threading.Lock()
+
+
+def get_revocation_cache(cache_dir=DEFAULT_CACHE_DIR):
+    """Return shared revocation cache, creating it on first use."""
+
+    global _cache
+    with _shared_lock:
+        if _cache is None or _cache.cache_dir != cache_dir:
+            _cache = RevocationCache(cache_dir)
+        return _cache
+
+
+def prefetch_revocation_info(certs, cache_dir=DEFAULT_CACHE_DIR):
+    """Warm the shared revocation cache for certs in the background."""
+
+    global _prefetcher
+    cache = get_revocation_cache(cache_dir)
+    with _shared_lock:
+        if _prefetcher is None or _prefetcher.cache is not cache:
+            _prefetcher = RevocationPrefetcher(cache)
+        prefetcher = _prefetcher
+    prefetcher.submit(certs)
+    return prefetcher
+
+
+def _reset_after_fork():
+    global _prefetcher, _shared_lock
+    _shared_lock = threading.Lock()
+    # the prefetcher thread is not copied
+    _prefetcher = None
+    if _cache is not None:
+        _cache._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def build_validation_context(trust_roots, other_certs=(), revocation_mode="soft-fail",
+                             cache_dir=DEFAULT_CACHE_DIR):
+    """ValidationContext checking revocation through the shared cache."""
+
+    if revocation_mode == "off":
+        return ValidationContext(trust_roots=trust_roots, other_certs=list(other_certs))
+    if revocation_mode not in REVOCATION_MODES:
+        raise ValueError(f"Unknown revocation mode: {revocation_mode}")
+    return ValidationContext(
+        trust_roots=trust_roots,
+        other_certs=list(other_certs),
+        allow_fetching=True,
+        revocation_mode=revocation_mode,
+        fetcher_backend=CachedFetcherBackend(get_revocation_cache(cache_dir)),
+    )
+
@@ -0,0 +1,269 @@
+"""@package docstring
+Size-aware scheduling of batch sign and verify jobs.
+
+A batch may mix kilobyte receipts with scans of hundreds of megabytes.
+Jobs are started largest first (longest processing time first keeps the
+makespan short) as long as their estimated memory fits into the budget;
+when the largest waiting job does not fit, smaller ones fill the free
+workers. Files above large_file_size run with reduced parallelism. A job
+larger than the whole budget still runs, but alone.
+
+Pure Python PDF parsing, hashing and difference analysis hold the GIL,
+so threads only overlap the I/O of a batch. With processes=True jobs
+run in forked worker processes and use every core; admission stays in
+the parent, so the memory budget and largest-first order are the same.
+Workers are forked before the first job starts and inherit everything
+the batch set up, func may be a closure. Metrics and trace spans
+recorded by workers are merged into the parent after every job.
+"""
+import os
+import sys
+import time
+import pickle
+import resource
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from metrics import QUEUE_DEPTH, REGISTRY
+from tracing import drain_spans, add_spans
+
+## Default memory budget of jobs in flight, in bytes.
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+## Files from this size on count as large.
+DEFAULT_LARGE_FILE_SIZE = 100 * 1024 ** 2
+## Estimated memory use per input byte, input and output buffers plus parsed objects.
+DEFAULT_COST_FACTOR = 3.0
+## Fixed memory estimate per job.
+JOB_OVERHEAD = 8 * 1024 ** 2
+## Interval of RSS sampling in seconds.
+RSS_SAMPLE_INTERVAL = 0.05
+## Worker choices offered to users, auto picks processes where the work allows it.
+WORKER_TYPES = ("auto", "processes", "threads")
+## Worker processes need fork to run closures; macOS system frameworks are not fork-safe.
+PROCESSES_AVAILABLE = sys.platform.startswith("linux") and "fork" in multiprocessing.get_all_start_methods()
+
+BatchReport = namedtuple("BatchReport", [
+    "jobs", "wall_time", "peak_rss", "peak_bytes_in_flight", "peak_concurrency",
+])
+
+
+_worker_func = None
+
+
+def current_rss(pid="self"):
+    """Resident set size of a process, this one by default, in bytes, None where unavailable."""
+
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def format_report(report):
+    """One line summary of a BatchReport."""
+
+    peak_rss = f"{report.peak_rss / 1024 ** 2:.1f} MB" if report.peak_rss else "n/a"
+    return (f"{report.jobs} job(s) in {report.wall_time:.2f} s, peak RSS {peak_rss}, "
+            f"peak estimate in flight {report.peak_bytes_in_flight / 1024 ** 2:.1f} MB, "
+            f"peak concurrency {report.peak_concurrency}")
+
+
+def _call_in_worker(path):
+    """Run the batch function in a worker process, return its result with the metrics and spans it recorded."""
+
+    try:
+        result = _worker_func(path)
+    except Exception as e:
+        result = e
+    try:
+        pickle.dumps(result)
+    except Exception:
+        # e.g. an exception holding an open file
+        result = RuntimeError(f"{type(result).__name__}: {result}")
+    return result, REGISTRY.drain(), drain_spans()
+
+
+def _proportional_size(pid):
+    # PSS splits pages a worker shares with the parent among them, so the sum is not inflated
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return current_rss(pid) or 0
+
+
+def _total_rss(children):
+    if not children:
+        return current_rss() or 0
+    return _proportional_size("self") + sum(_proportional_size(child.pid)
+                                            for child in multiprocessing.active_children())
+
+
+class _RSSSampler:
+    def __init__(self, children=False):
+        self.children = children
+        self.peak = current_rss() or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, _total_rss(self.children))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss() or 0)
+        if not self.peak:
+            # ru_maxrss is the lifetime peak in KiB on Linux
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SizeAwareScheduler:
+    """Run a function over files under a memory budget, largest files first.
+
+    processes runs jobs in worker processes where PROCESSES_AVAILABLE,
+    otherwise in threads. Work that holds state a forked copy breaks,
+    e.g. PKCS#11 sessions or per-host TSA limits, must stay on threads.
+    """
+
+    def __init__(self, max_workers=None, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 large_file_size=DEFAULT_LARGE_FILE_SIZE, large_workers=1, cost_factor=DEFAULT_COST_FACTOR,
+                 processes=False):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.processes = processes and PROCESSES_AVAILABLE
+        self.memory_budget = memory_budget
+        self.large_file_size = large_file_size
+        self.large_workers = max(1, large_workers)
+        self.cost_factor = cost_factor
+
+    def estimate(self, size):
+        """Estimated memory of a job over a file of size bytes."""
+
+        return int(size * self.cost_factor) + JOB_OVERHEAD
+
+    def run(self, func, paths, queue="batch"):
+        """Call func(path) for every path.
+
+        Returns (results in input order, BatchReport); a result is the
+        return value of func or the exception it raised.
+        """
+
+        paths = list(paths)
+        jobs = sorted(((os.path.getsize(path), index, path) for index, path in enumerate(paths)), reverse=True)
+        results = [None] * len(paths)
+        state = {'bytes': 0, 'running': 0, 'large': 0, 'peak_bytes': 0, 'peak_running': 0}
+        condition = threading.Condition()
+
+        def call(index, path):
+            try:
+                results[index] = func(path)
+            except Exception as e:
+                results[index] = e
+
+        def next_job():
+            for position, (size, _, _) in enumerate(jobs):
+                large = size >= self.large_file_size
+                if large and state['large'] >= self.large_workers:
+                    continue
+                if state['running'] and state['bytes'] + self.estimate(size) > self.memory_budget:
+                    continue
+                return position
+            return None
+
+        def finish(size):
+            with condition:
+                state['bytes'] -= self.estimate(size)
+                state['running'] -= 1
+                state['large'] -= size >= self.large_file_size
+                condition.notify_all()
+            QUEUE_DEPTH.dec(queue=queue)
+
+        def start(position):
+            size, index, path = jobs.pop(position)
+            state['bytes'] += self.estimate(size)
+            state['running'] += 1
+            state['large'] += size >= self.large_file_size
+            state['peak_bytes'] = max(state['peak_bytes'], state['bytes'])
+            state['peak_running'] = max(state['peak_running'], state['running'])
+            return size, index, path
+
+        def admit(submit):
+            with condition:
+                while jobs:
+                    position = next_job() if state['running'] < self.max_workers else None
+                    if position is None:
+                        condition.wait()
+                        continue
+                    submit(*start(position))
+
+        QUEUE_DEPTH.inc(len(jobs), queue=queue)
+        wall_start = time.perf_counter()
+        in_processes = self.processes and self.max_workers > 1
+        with _RSSSampler(children=in_processes) as sampler:
+            if self.max_workers == 1:
+                # in the calling thread, so profilers and tracers see the work
+                while jobs:
+                    size, index, path = start(0)
+                    call(index, path)
+                    finish(size)
+            elif in_processes:
+                self._run_in_processes(func, admit, results, finish)
+            else:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    def run_job(size, index, path):
+                        try:
+                            call(index, path)
+                        finally:
+                            finish(size)
+
+                    admit(lambda size, index, path: executor.submit(run_job, size, index, path))
+        report = BatchReport(
+            len(paths), time.perf_counter() - wall_start, sampler.peak,
+            state['peak_bytes'], state['peak_running']
+        )
+        return results, report
+
+    def _run_in_processes(self, func, admit, results, finish):
+        global _worker_func
+
+        def collect(future, size, index):
+            try:
+                results[index], metric_values, spans = future.result()
+                REGISTRY.merge(metric_values)
+                add_spans(spans)
+            except Exception as e:
+                # e.g. BrokenProcessPool after a worker was killed
+                results[index] = e
+            finally:
+                finish(size)
+
+        def submit(size, index, path):
+            try:
+                future = executor.submit(_call_in_worker, path)
+            except Exception as e:
+                results[index] = e
+                finish(size)
+                return
+            future.add_done_callback(lambda done: collect(done, size, index))
+
+        # buffered output would be written again by every worker
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _worker_func = func
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers,
+                                     mp_context=multiprocessing.get_context("fork")) as executor:
+                admit(submit)
+        finally:
+            _worker_func = None
@@ -0,0 +1,221 @@
+"""@package docstring
+Index of the signatures embedded in PDF files, persisted in SQLite.
+
+Reading an index entry parses only the xref sections and trailer, the
+signature fields and their CMS blobs: no digests are computed and no
+certificate path is validated. Entries are kept in a catalog keyed by
+path, file size and modification time, so listing or filtering an
+archive only reads files that changed since they were last indexed.
+Run `python cli.py index --signer "Contoso" archive/*.pdf`.
+"""
+import os
+import sqlite3
+import datetime
+import threading
+from collections import namedtuple
+
+from asn1crypto import cms, tsp
+from pyhanko.pdf_utils.generic import parse_pdf_date
+from pyhanko.pdf_utils.reader import PdfFileReader
+from pyhanko.sign.fields import enumerate_sig_fields
+from pyhanko.sign.general import extract_certificate_info, extract_signer_info, find_unique_cms_attribute
+from pyhanko.sign.validation.pdf_embedded import extract_contents
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pdf-signer", "signatures.db")
+
+SignatureEntry = namedtuple("SignatureEntry", [
+    "index", "field_name", "sig_type", "sub_filter", "byte_range", "covers_whole_file",
+    "signer_subject", "signing_time",
+])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS signatures (
+    path TEXT NOT NULL REFERENCES documents(path) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    field_name TEXT NOT NULL,
+    sig_type TEXT NOT NULL,
+    sub_filter TEXT,
+    byte_range TEXT NOT NULL,
+    covers_whole_file INTEGER NOT NULL,
+    signer_subject TEXT,
+    signing_time TEXT,
+    PRIMARY KEY (path, idx)
+);
+CREATE INDEX IF NOT EXISTS signatures_signer ON signatures(signer_subject);
+CREATE INDEX IF NOT EXISTS signatures_time ON signatures(signing_time);
+"""
+
+
+def _signing_time(sig_object, signed_data, signer_info, sig_type):
+    if sig_type == '/DocTimeStamp':
+        tst_info = signed_data['encap_content_info']['content'].parsed
+        if isinstance(tst_info, tsp.TSTInfo):
+            return tst_info['gen_time'].native
+        return None
+    try:
+        return find_unique_cms_attribute(signer_info['signed_attrs'], 'signing_time').native
+    except Exception:
+        pass
+    # fall back to the self-reported /M of the signature dictionary
+    claimed = sig_object.get('/M')
+    if claimed is None:
+        return None
+    try:
+        return parse_pdf_date(claimed, strict=False)
+    except Exception:
+        return None
+
+
+def read_signature_index(pdf_file):
+    """SignatureEntry of every filled signature field, in signing order."""
+
+    file_size = os.path.getsize(pdf_file)
+    with open(pdf_file, 'rb') as doc:
+        reader = PdfFileReader(doc, strict=False)
+        entries = []
+        for field_name, sig_object, _ in enumerate_sig_fields(reader, filled_status=True):
+            sig_object = sig_object.get_object()
+            byte_range = [int(value) for value in sig_object.get('/ByteRange', ())]
+            if len(byte_range) != 4:
+                continue
+            sig_type = str(sig_object.get('/Type', '/Sig'))
+            sub_filter = sig_object.get('/SubFilter')
+            signer_subject = signing_time = None
+            try:
+                signed_data = cms.ContentInfo.load(extract_contents(sig_object))['content']
+                signer_info = extract_signer_info(signed_data)
+                signer_subject = extract_certificate_info(signed_data).signer_cert.subject.human_friendly
+                signing_time = _signing_time(sig_object, signed_data, signer_info, sig_type)
+            except Exception:
+                pass
+            entries.append([
+                field_name, sig_type, None if sub_filter is None else str(sub_filter), byte_range,
+                byte_range[2] + byte_range[3] == file_size, signer_subject,
+                _utc(signing_time).isoformat() if signing_time else None,
+            ])
+    # same order as PdfFileReader.embedded_signatures, so indices match sig_index
+    entries.sort(key=lambda entry: entry[3][2] + entry[3][3])
+    return [SignatureEntry(index, *entry) for index, entry in enumerate(entries)]
+
+
+class SignatureCatalog:
+    """SQLite catalog of signature index entries of many files."""
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self.reads = 0
+
+    def _stored(self, pdf_file, stat):
+        row = self._conn.execute(
+            "SELECT size, mtime_ns FROM documents WHERE path = ?", (pdf_file,)
+        ).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def update(self, pdf_file):
+        """Index pdf_file unless its catalog entry is current, return True if it was read."""
+
+        pdf_file = os.path.abspath(pdf_file)
+        stat = os.stat(pdf_file)
+        with self._lock:
+            if self._stored(pdf_file, stat):
+                return False
+        error = None
+        try:
+            entries = read_signature_index(pdf_file)
+        except Exception as e:
+            entries, error = [], str(e)
+        with self._lock, self._conn:
+            self.reads += 1
+            self._conn.execute("DELETE FROM documents WHERE path = ?", (pdf_file,))
+            self._conn.execute(
+                "INSERT INTO documents (path, size, mtime_ns, error) VALUES (?, ?, ?, ?)",
+                (pdf_file, stat.st_size, stat.st_mtime_ns, error)
+            )
+            self._conn.executemany(
+                "INSERT INTO signatures (path, idx, field_name, sig_type, sub_filter, byte_range, "
+                "covers_whole_file, signer_subject, signing_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(pdf_file, entry.index, entry.field_name, entry.sig_type, entry.sub_filter,
+                  " ".join(str(value) for value in entry.byte_range), int(entry.covers_whole_file),
+                  entry.signer_subject, entry.signing_time) for entry in entries]
+            )
+        return True
+
+    def entries(self, pdf_file):
+        """Current SignatureEntry list of pdf_file, indexing it if needed."""
+
+        pdf_file = os.path.abspath(pdf_file)
+        self.update(pdf_file)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, field_name, sig_type, sub_filter, byte_range, covers_whole_file, "
+                "signer_subject, signing_time FROM signatures WHERE path = ? ORDER BY idx", (pdf_file,)
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def error(self, pdf_file):
+        """Error message of the last failed indexing of pdf_file, or None."""
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT error FROM documents WHERE path = ?", (os.path.abspath(pdf_file),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find(self, signer=None, signed_after=None, signed_before=None, sig_type=None, paths=None):
+        """(path, SignatureEntry) of cataloged signatures matching all given filters.
+
+        signer matches a substring of the signer subject, signed_after and
+        signed_before are datetimes; paths restricts the search to those files.
+        """
+
+        query = ("SELECT path, idx, field_name, sig_type, sub_filter, byte_range, covers_whole_file, "
+                 "signer_subject, signing_time FROM signatures WHERE 1")
+        params = []
+        if signer:
+            query += " AND signer_subject LIKE ?"
+            params.append(f"%{signer}%")
+        if signed_after:
+            query += " AND signing_time >= ?"
+            params.append(_utc(signed_after).isoformat())
+        if signed_before:
+            query += " AND signing_time < ?"
+            params.append(_utc(signed_before).isoformat())
+        if sig_type:
+            query += " AND sig_type = ?"
+            params.append(sig_type)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY path, idx", params).fetchall()
+        if paths is not None:
+            paths = {os.path.abspath(path) for path in paths}
+            rows = [row for row in rows if row[0] in paths]
+        return [(row[0], _entry(row[1:])) for row in rows]
+
+    def close(self):
+        """Close database connection."""
+
+        self._conn.close()
+
+
+def _utc(moment):
+    return moment.replace(tzinfo=datetime.UTC) if moment.tzinfo is None else moment.astimezone(datetime.UTC)
+
+
+def _entry(row):
+    index, field_name, sig_type, sub_filter, byte_range, covers_whole_file, signer_subject, signing_time = row
+    return SignatureEntry(
+        index, field_name, sig_type, sub_filter, [int(value) for value in byte_range.split()],
+        bool(covers_whole_file), signer_subject, signing_time
+    )
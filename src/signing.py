@@ -0,0 +1,177 @@
+"""@package docstring
+Headless PDF signing helpers.
+
+Shared by the signing tab and batch jobs, so the signing logic does not
+depend on any Qt widget.
+"""
+import os
+import contextlib
+
+from pyhanko.sign import signers, fields
+from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+from ltv import pades_meta_options
+from metrics import DOCUMENTS_SIGNED, BYTES_PROCESSED, SIGN_SECONDS, record_failure
+from tracing import span
+
+DEFAULT_FIELD_BOX = (100, 100, 300, 200)
+
+
+def parse_field_box(text):
+    """Parse "x1, y1, x2, y2" into a signature field box tuple."""
+
+    parts = [part for part in text.replace(",", " ").split() if part]
+    if len(parts) != 4:
+        raise ValueError(f"Field box must have 4 coordinates, got: {text!r}")
+    x1, y1, x2, y2 = (int(float(part)) for part in parts)
+    if x1 >= x2 or y1 >= y2:
+        raise ValueError(f"Field box must be given as lower-left and upper-right corner: {text!r}")
+    return (x1, y1, x2, y2)
+
+
+def find_signature_field(reader, field_name):
+    """Look up signature field in the reader's form field index.
+
+    Returns (field_value, field_ref) of the named field, or None when
+    the document has no such field.
+    """
+
+    for _, value, ref in fields.enumerate_sig_fields(reader, with_name=field_name):
+        return value, ref
+    return None
+
+
+def build_signature_meta(field_name, location=None, contact_info=None, pades_level="B-B",
+                         validation_context=None):
+    """Build PAdES signature metadata used by this application."""
+
+    optional = pades_meta_options(pades_level, validation_context)
+    if location:
+        optional['location'] = location
+    if contact_info:
+        optional['contact_info'] = contact_info
+    signature_meta = signers.PdfSignatureMetadata(
+        field_name=field_name,
+        signer_key_usage={"digital_signature", "non_repudiation"},
+        subfilter=fields.SigSeedSubFilter.PADES,
+        **optional
+    )
+    return signature_meta
+
+
+def signed_output_path(pdf_file):
+    """Default output path of a signed document."""
+
+    root, ext = os.path.splitext(pdf_file)
+    return f"{root}_signed{ext or '.pdf'}"
+
+
+def open_document(file, mode):
+    """Context manager opening a path, binary streams are used as they are and left open."""
+
+    if hasattr(file, 'read') or hasattr(file, 'write'):
+        return contextlib.nullcontext(file)
+    return open(file, mode)
+
+
+def document_name(file):
+    """Path of a document, or name of its stream."""
+
+    return file if isinstance(file, (str, os.PathLike)) else getattr(file, 'name', '<stream>')
+
+
+def document_size(file):
+    """Size in bytes of a path or seekable stream."""
+
+    if isinstance(file, (str, os.PathLike)):
+        return os.path.getsize(file)
+    position = file.tell()
+    size = file.seek(0, os.SEEK_END)
+    file.seek(position)
+    return size
+
+
+def unlock_document(reader, name, credentials=None):
+    """Authenticate an encrypted reader with credentials, no-op for plain documents."""
+
+    if not reader.encrypted:
+        return
+    if credentials is None:
+        raise ValueError(f"{name} is encrypted, a PDF password is required.")
+    credentials.unlock(reader, name)
+
+
+def sign_document(pdf_file, output_file, cms_signer, signature_meta,
+                  create_field=False, field_box=DEFAULT_FIELD_BOX, field_page=0,
+                  stamp_style=None, timestamper=None, log=None, credentials=None):
+    """Sign one PDF file in a single incremental update.
+
+    When create_field is set and the field is missing, the field spec is
+    handed to the PDF signer, so the field, its widget and the signature
+    value are written in the same revision instead of a separate
+    append_signature_field pass.
+
+    stamp_style is used for the appearance of visible signatures; reuse
+    one style instance across a batch to share its cached appearance.
+    The same holds for timestamper and its pooled TSA connections.
+    pdf_file and output_file are paths or seekable binary streams, e.g.
+    io.BytesIO of archive members. Encrypted documents are opened with
+    the passwords of credentials (a pdf_encryption.PdfCredentials) and
+    stay encrypted with the same settings.
+    """
+
+    log = log or (lambda message: None)
+    try:
+        with SIGN_SECONDS.time(), span("sign_document", file=document_name(pdf_file)):
+            _sign_document(pdf_file, output_file, cms_signer, signature_meta, create_field,
+                           field_box, field_page, stamp_style, timestamper, log, credentials)
+    except Exception as e:
+        record_failure("sign", e)
+        raise
+    DOCUMENTS_SIGNED.inc()
+    BYTES_PROCESSED.inc(document_size(pdf_file), operation="sign")
+
+
+def _sign_document(pdf_file, output_file, cms_signer, signature_meta, create_field, field_box,
+                   field_page, stamp_style, timestamper, log, credentials):
+    with open_document(pdf_file, 'rb') as doc:
+        with span("parse_pdf"):
+            w = IncrementalPdfFileWriter(doc)
+        unlock_document(w.prev, document_name(pdf_file), credentials)
+        with open_document(output_file, 'wb') as out:
+            sign_revision(w, cms_signer, signature_meta, create_field, field_box, field_page,
+                          stamp_style, timestamper, log, output=out)
+
+
+def sign_revision(w, cms_signer, signature_meta, create_field=False, field_box=DEFAULT_FIELD_BOX, field_page=0,
+                  stamp_style=None, timestamper=None, log=None, output=None, in_place=False):
+    """Add one signature revision to an IncrementalPdfFileWriter.
+
+    Written to output, or with in_place appended to the writer's own
+    input stream, which must then be writable.
+    """
+
+    log = log or (lambda message: None)
+    new_field_spec = None
+    field_name = signature_meta.field_name
+    if create_field:
+        with span("find_signature_field"):
+            existing_field = find_signature_field(w.prev, field_name)
+        if existing_field is None:
+            log(f"Signature field {field_name} not found, it will be created.")
+            new_field_spec = fields.SigFieldSpec(
+                sig_field_name=field_name,
+                on_page=field_page,
+                box=field_box
+            )
+        else:
+            log(f"Signature field {field_name} already exists, reusing it.")
+
+    pdf_signer = signers.PdfSigner(
+        signature_meta, signer=cms_signer,
+        stamp_style=stamp_style,
+        timestamper=timestamper,
+        new_field_spec=new_field_spec
+    )
+    with span("sign_pdf"):
+        return pdf_signer.sign_pdf(w, output=output, in_place=in_place)
@@ -0,0 +1,131 @@
+"""@package docstring
+RFC 3161 timestamping client.
+
+One timestamper (and with it one pooled HTTP session) is shared per TSA
+configuration, so a batch reuses TCP/TLS connections instead of opening
+a new connection for every document.
+"""
+import time
+import threading
+import functools
+from asyncio import to_thread
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from asn1crypto import tsp
+from pyhanko.sign.timestamps import TimeStamper
+from pyhanko.sign.timestamps.common_utils import (TimestampRequestError, set_tsp_headers,
+                                                  handle_tsp_response)
+
+from metrics import TSA_SECONDS, record_failure
+from tracing import span
+
+DEFAULT_TSA_URL = "http://timestamp.digicert.com"
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+## Maximum number of requests in flight to one TSA host.
+DEFAULT_MAX_CONCURRENCY = 4
+
+_tsa_limits = {}
+_tsa_limits_lock = threading.Lock()
+
+
+def tsa_limit(url, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Return semaphore limiting concurrent requests to the TSA host of url.
+
+    The semaphore is shared by all timestampers talking to the same host,
+    the first caller decides the limit.
+    """
+
+    host = urlsplit(url).netloc
+    with _tsa_limits_lock:
+        limit = _tsa_limits.get(host)
+        if limit is None:
+            limit = _tsa_limits[host] = threading.BoundedSemaphore(max_concurrency)
+        return limit
+
+
+class PooledHTTPTimeStamper(TimeStamper):
+    """HTTP timestamp client using a pooled requests session with retries."""
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, auth=None, headers=None):
+        super().__init__()
+        self.url = url
+        self.timeout = timeout
+        self.auth = auth
+        self.headers = headers
+        self.limit = tsa_limit(url, max_concurrency)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+        )
+        adapter = HTTPAdapter(pool_maxsize=max_concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.request_count = 0
+        self.total_latency = 0.0
+        self._stats_lock = threading.Lock()
+
+    def request_tsa_response(self, req):
+        """Send timestamp request to the TSA, return parsed response."""
+
+        with self.limit, span("tsa_request", url=self.url):
+            start = time.perf_counter()
+            try:
+                raw_res = self.session.post(
+                    self.url,
+                    req.dump(),
+                    headers=set_tsp_headers(dict(self.headers or {})),
+                    auth=self.auth,
+                    timeout=self.timeout,
+                )
+            except (OSError, requests.RequestException) as e:
+                record_failure("tsa", e)
+                raise TimestampRequestError(
+                    f"Error in communication with timestamp server {self.url}"
+                ) from e
+            latency = time.perf_counter() - start
+
+        TSA_SECONDS.observe(latency)
+        with self._stats_lock:
+            self.request_count += 1
+            self.total_latency += latency
+
+        if raw_res.headers.get('Content-Type') != 'application/timestamp-reply':
+            raise TimestampRequestError(
+                f"Timestamp server response is malformed (HTTP {raw_res.status_code}).", raw_res
+            )
+        return tsp.TimeStampResp.load(raw_res.content)
+
+    async def async_request_tsa_response(self, req):
+        return await to_thread(self.request_tsa_response, req)
+
+    def timestamp(self, message_digest, md_algorithm):
+        """Synchronously request a timestamp token for message_digest."""
+
+        nonce, req = self.request_cms(message_digest, md_algorithm)
+        return handle_tsp_response(self.request_tsa_response(req), nonce)
+
+    def mean_latency(self):
+        """Mean latency of TSA requests in seconds."""
+
+        with self._stats_lock:
+            return self.total_latency / self.request_count if self.request_count else 0.0
+
+
+@functools.lru_cache(maxsize=None)
+def get_timestamper(url=DEFAULT_TSA_URL, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                    max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """Return shared timestamper for the given TSA configuration."""
+
+    return PooledHTTPTimeStamper(
+        url, timeout=timeout, retries=retries, max_concurrency=max_concurrency
+    )
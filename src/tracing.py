@@ -0,0 +1,227 @@
+"""@package docstring
+Opt-in phase tracing of sign, verify and certificate generation.
+
+Spans are recorded only after enable_tracing(); until then span() is a
+no-op. Enabling also wraps the pyHanko phases our code cannot see into
+(pre-sign validation, appearance and field setup, writing and hashing,
+the private key operation, post-sign processing, signature integrity,
+path validation and difference analysis). Traces are written as Chrome
+trace JSON (chrome://tracing, Perfetto) or OTLP/JSON for OpenTelemetry
+tooling, e.g. `python cli.py --trace trace.json sign ...`.
+"""
+import os
+import json
+import time
+import inspect
+import functools
+import threading
+import contextlib
+import contextvars
+
+TRACE_FORMATS = ("chrome", "otlp")
+SERVICE_NAME = "pdf-signer"
+
+_enabled = False
+_spans = []
+_spans_lock = threading.Lock()
+_current_span = contextvars.ContextVar("current_span", default=None)
+_ids = iter(range(1, 1 << 62))
+_trace_id = None
+_epoch_ns = 0
+_perf_origin_ns = 0
+_instrumented = False
+_main_thread_id = None
+
+
+def tracing_enabled():
+    """True while spans are recorded."""
+
+    return _enabled
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Record the with block as a span of the current thread."""
+
+    if not _enabled:
+        yield
+        return
+    span_id = next(_ids)
+    # context variables follow asyncio tasks as well as threads
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter_ns()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        end = time.perf_counter_ns()
+        _current_span.reset(token)
+        if error:
+            attributes['error'] = error
+        with _spans_lock:
+            _spans.append((name, span_id, parent_id, threading.get_ident(), start, end, attributes))
+
+
+def traced(name):
+    """Decorator recording every call of a function or coroutine function as a span."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _instrument_pyhanko():
+    global _instrumented
+    if _instrumented:
+        return
+    from pyhanko.sign import signers
+    from pyhanko.sign.signers.pdf_signer import PdfSigningSession, PdfTBSDocument, PdfPostSignatureDocument
+    from pyhanko.sign.validation import generic_cms
+    from pyhanko.sign.validation.pdf_embedded import EmbeddedPdfSignature
+
+    targets = [
+        (PdfSigningSession, 'perform_presign_validation', "presign_validation"),
+        (PdfSigningSession, 'estimate_signature_container_size', "estimate_signature_size"),
+        (PdfSigningSession, 'prepare_tbs_document', "prepare_document"),
+        (PdfTBSDocument, 'digest_tbs_document', "write_and_hash"),
+        (PdfTBSDocument, 'perform_signature', "cms_signature"),
+        (signers.SimpleSigner, 'async_sign_raw', "private_key_operation"),
+        (PdfPostSignatureDocument, 'post_signature_processing', "post_sign_processing"),
+        (EmbeddedPdfSignature, 'compute_digest', "hash_document"),
+        (EmbeddedPdfSignature, 'evaluate_modifications', "diff_analysis"),
+        (generic_cms, 'collect_timing_info', "timestamp_validation"),
+        (generic_cms, 'cms_basic_validation', "cms_validation"),
+        (generic_cms, 'validate_cert_usage', "path_validation"),
+    ]
+    try:
+        from pyhanko.sign.pkcs11 import PKCS11Signer
+        targets.append((PKCS11Signer, 'async_sign_raw', "private_key_operation"))
+    except ImportError:
+        pass
+    for owner, attribute, name in targets:
+        setattr(owner, attribute, traced(name)(getattr(owner, attribute)))
+    _instrumented = True
+
+
+def enable_tracing():
+    """Start recording spans, dropping earlier ones."""
+
+    global _enabled, _trace_id, _epoch_ns, _perf_origin_ns
+    _instrument_pyhanko()
+    with _spans_lock:
+        _spans.clear()
+    _trace_id = os.urandom(16).hex()
+    _epoch_ns = time.time_ns()
+    _perf_origin_ns = time.perf_counter_ns()
+    _enabled = True
+
+
+def disable_tracing():
+    """Stop recording spans, recorded spans are kept for export."""
+
+    global _enabled
+    _enabled = False
+
+
+def drain_spans():
+    """Remove and return the spans recorded so far.
+
+    In a forked worker process, spans of its main thread get the process
+    id as thread id, so every worker shows up as a track of its own.
+    """
+
+    with _spans_lock:
+        spans = _spans[:]
+        _spans.clear()
+    if _main_thread_id is None:
+        return spans
+    pid = os.getpid()
+    return [(name, span_id, parent_id, pid if tid == _main_thread_id else tid, start, end, attributes)
+            for name, span_id, parent_id, tid, start, end, attributes in spans]
+
+
+def add_spans(spans):
+    """Record spans drained in a worker process."""
+
+    with _spans_lock:
+        _spans.extend(spans)
+
+
+def _reset_after_fork():
+    global _spans_lock, _ids, _main_thread_id
+    # another thread may have held the lock at fork time
+    _spans_lock = threading.Lock()
+    _spans.clear()
+    # span ids of workers must not collide with those of the parent or each other
+    _ids = iter(range(os.getpid() << 32, (os.getpid() + 1) << 32))
+    _main_thread_id = threading.get_ident()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _chrome_trace(spans):
+    pid = os.getpid()
+    return {
+        "traceEvents": [
+            {
+                "name": name, "cat": SERVICE_NAME, "ph": "X", "pid": pid, "tid": tid,
+                "ts": (start - _perf_origin_ns) / 1000, "dur": (end - start) / 1000,
+                "args": {key: str(value) for key, value in attributes.items()},
+            }
+            for name, _, _, tid, start, end, attributes in spans
+        ],
+        "displayTimeUnit": "ms",
+    }
+
+
+def _otlp_trace(spans):
+    def unix_nano(perf_ns):
+        return str(_epoch_ns + perf_ns - _perf_origin_ns)
+
+    otlp_spans = []
+    for name, span_id, parent_id, tid, start, end, attributes in spans:
+        otlp_span = {
+            "traceId": _trace_id, "spanId": f"{span_id:016x}", "name": name, "kind": 1,
+            "startTimeUnixNano": unix_nano(start), "endTimeUnixNano": unix_nano(end),
+            "attributes": [{"key": "thread.id", "value": {"intValue": str(tid)}}] + [
+                {"key": key, "value": {"stringValue": str(value)}} for key, value in attributes.items()
+            ],
+        }
+        if parent_id is not None:
+            otlp_span["parentSpanId"] = f"{parent_id:016x}"
+        if 'error' in attributes:
+            otlp_span["status"] = {"code": 2, "message": str(attributes['error'])}
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+    }]}
+
+
+def write_trace(path, trace_format="chrome"):
+    """Write recorded spans as Chrome trace or OTLP/JSON, return their number."""
+
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format: {trace_format}")
+    with _spans_lock:
+        spans = sorted(_spans, key=lambda recorded: recorded[4])
+    trace = _chrome_trace(spans) if trace_format == "chrome" else _otlp_trace(spans)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f)
+    return len(spans)
@@ -0,0 +1,137 @@
+"""@package docstring
+Machine-readable verification results, streamed as JSON Lines.
+
+Every verified signature becomes one JSON object on its own line:
+
+{"file": "a.pdf", "index": 0, "field": "Signature1", "status": "VALID", "valid": true,
+ "intact": true, "trusted": true, "revoked": false, "coverage": "ENTIRE_FILE",
+ "modification_level": "NONE", "docmdp_ok": true, "signing_time": "2026-01-02T10:00:00+00:00",
+ "timestamp": null, "signer": "Common Name: ...", "signer_fingerprint": "ab12...",
+ "chain_fingerprints": ["ab12...", "cd34..."], "error": null}
+
+status is VALID, INVALID, UNCHECKED (passing, but revisions added after
+signing were not checked, see --analysis-level) or ERROR, documents
+without signatures get one UNSIGNED record with index null, documents
+that fail to open one ERROR record. Fingerprints are SHA-256 of the DER certificates, hex encoded;
+the chain runs from the signer to the trust root when a path to one
+was built, otherwise it lists the certificates embedded in the signature.
+Lines are written and flushed as results come in, so consumers can
+process a bulk run while it is still going.
+"""
+import sys
+import json
+import threading
+
+from modification_analysis import signature_verdict
+
+## Record keys, in output order.
+RECORD_FIELDS = (
+    "file", "index", "field", "status", "valid", "intact", "trusted", "revoked", "coverage",
+    "modification_level", "docmdp_ok", "signing_time", "timestamp", "signer", "signer_fingerprint",
+    "chain_fingerprints", "error",
+)
+
+
+def _record(**values):
+    return {key: values.get(key) for key in RECORD_FIELDS}
+
+
+def _isoformat(moment):
+    return moment.isoformat() if moment is not None else None
+
+
+def _chain_fingerprints(sig, status):
+    path = getattr(status, 'validation_path', None)
+    if path is not None:
+        try:
+            return [cert.sha256.hex() for cert in path.iter_certs(include_root=True)][::-1]
+        except Exception:
+            pass
+    signer_cert = sig.signer_cert
+    return [signer_cert.sha256.hex()] + [cert.sha256.hex() for cert in sig.other_embedded_certs]
+
+
+def signature_record(name, index, sig, status=None, error=None):
+    """Record of signature index of document name, from its status or the error validating it."""
+
+    record = _record(file=name, index=index, field=sig.field_name)
+    try:
+        signer_cert = sig.signer_cert
+        record.update(signer=signer_cert.subject.human_friendly, signer_fingerprint=signer_cert.sha256.hex(),
+                      signing_time=_isoformat(sig.self_reported_timestamp))
+    except Exception:
+        # a signature broken enough to fail validation may lack a usable signer
+        pass
+    if status is None:
+        record.update(status="ERROR", valid=False, error=str(error) or type(error).__name__)
+        return record
+    timestamp_validity = status.timestamp_validity
+    record.update(
+        status=signature_verdict(status),
+        valid=signature_verdict(status) == "VALID",
+        intact=bool(status.intact),
+        trusted=bool(status.trusted),
+        revoked=status.revocation_details is not None,
+        coverage=status.coverage.name if status.coverage is not None else None,
+        modification_level=status.modification_level.name if status.modification_level is not None else None,
+        docmdp_ok=status.docmdp_ok,
+        signing_time=_isoformat(status.signer_reported_dt) or record['signing_time'],
+        timestamp=_isoformat(timestamp_validity.timestamp) if timestamp_validity is not None else None,
+        chain_fingerprints=_chain_fingerprints(sig, status),
+    )
+    return record
+
+
+def unsigned_record(name):
+    """Record of a document without signatures."""
+
+    return _record(file=name, status="UNSIGNED", valid=False)
+
+
+def document_error_record(name, error):
+    """Record of a document that could not be verified at all."""
+
+    return _record(file=name, status="ERROR", valid=False, error=str(error) or type(error).__name__)
+
+
+class JsonlWriter:
+    """Thread-safe JSON Lines output, one flushed line per record.
+
+    path "-" writes to stdout; append adds to an existing file instead of
+    replacing it. Forked batch workers share the file, every record is
+    written with one flush so their lines do not interleave; records
+    counts the lines of this process.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._lock = threading.Lock()
+        if path == "-":
+            self._file, self._owned = sys.stdout, False
+        else:
+            self._file, self._owned = open(path, 'a' if append else 'w', encoding='utf-8'), True
+        self.records = 0
+
+    def write(self, record):
+        """Write one record and flush it."""
+
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+
+    def close(self):
+        """Close output file, stdout stays open."""
+
+        with self._lock:
+            if self._owned:
+                self._file.close()
+            else:
+                self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,91 @@
+"""@package docstring
+Shared fixtures of the unittest suite.
+
+Importing this module puts src/ on sys.path, as cli.py and main.py
+expect to be run from there.
+"""
+import os
+import sys
+import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+## Unsigned one-page sample document of the repository.
+UNSIGNED_PDF = os.path.join(ROOT, "unsigned.pdf")
+
+
+def make_certificate(common_name, issuer=None, ca=False, days=1, not_before=None, key_size=2048,
+                     authority_key_id=True):
+    """(private key, certificate), self-signed unless issuer is a (key, certificate) pair."""
+
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    issuer_key, issuer_cert = issuer or (private_key, None)
+    not_before = not_before or datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=5)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(issuer_cert.subject if issuer_cert is not None else name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(not_before)
+        .not_valid_after(not_before + datetime.timedelta(days=days))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(private_key.public_key()), critical=False)
+        .add_extension(x509.KeyUsage(
+            digital_signature=not ca, content_commitment=not ca, key_encipherment=False, data_encipherment=False,
+            key_agreement=False, key_cert_sign=ca, crl_sign=ca, encipher_only=False, decipher_only=False
+        ), critical=True)
+    )
+    if authority_key_id:
+        builder = builder.add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_key.public_key()), critical=False
+        )
+    return private_key, builder.sign(issuer_key, hashes.SHA256())
+
+
+def write_pem(directory, name, private_key=None, cert=None):
+    """Write an unencrypted PKCS#8 key and/or certificate as PEM, return their paths."""
+
+    from cryptography.hazmat.primitives import serialization
+
+    key_file = cert_file = None
+    if private_key is not None:
+        key_file = os.path.join(directory, f"{name}.key")
+        with open(key_file, "wb") as f:
+            f.write(private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ))
+    if cert is not None:
+        cert_file = os.path.join(directory, f"{name}.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return key_file, cert_file
+
+
+def write_signer_files(directory):
+    """Write an unencrypted PKCS#8 key and self-signed signing certificate, return their paths."""
+
+    return write_pem(directory, "signer", *make_certificate("Test Signer"))
+
+
+def write_encrypted_pdf(path, user_password, owner_password="owner"):
+    """Write UNSIGNED_PDF encrypted with AES-256 and the given passwords."""
+
+    from pyhanko.pdf_utils.reader import PdfFileReader
+    from pyhanko.pdf_utils.writer import copy_into_new_writer
+
+    with open(UNSIGNED_PDF, "rb") as source:
+        writer = copy_into_new_writer(PdfFileReader(source))
+        writer.encrypt(owner_password, user_password)
+        with open(path, "wb") as f:
+            writer.write(f)
+    return path
@@ -0,0 +1,164 @@
+"""@package docstring
+Signing archive members: other members pass through, failed members are
+copied unchanged and the manifest lists the SHA-256 of every output file.
+"""
+import io
+import os
+import json
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import unittest
+
+import support  # noqa: F401, puts src on the path
+
+MEMBERS = {
+    "docs/a.pdf": b"%PDF-1.7 a",
+    "docs/bad.pdf": b"%PDF-1.7 bad",
+    "notes.txt": b"not a pdf",
+    "signing-manifest.json": b"{}",
+}
+## 2020-01-02 03:04:06 local time
+MTIME = (2020, 1, 2, 3, 4, 6)
+
+
+def sign_stream(input_stream, output_stream):
+    """Stand-in signer appending a marker, failing for "bad" documents."""
+
+    data = input_stream.read()
+    if b"bad" in data:
+        raise ValueError("cannot sign")
+    output_stream.write(data + b" signed")
+
+
+class ArchiveBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_zip(self):
+        path = os.path.join(self.tmp_dir, "batch.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr(zipfile.ZipInfo("docs/", MTIME), b"")
+            for name, data in MEMBERS.items():
+                info = zipfile.ZipInfo(name, MTIME)
+                info.external_attr = 0o640 << 16
+                archive.writestr(info, data)
+        return path
+
+    def write_tar(self):
+        import datetime
+
+        path = os.path.join(self.tmp_dir, "batch.tar.gz")
+        with tarfile.open(path, "w:gz") as archive:
+            directory = tarfile.TarInfo("docs")
+            directory.type = tarfile.DIRTYPE
+            archive.addfile(directory)
+            for name, data in MEMBERS.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o640
+                info.mtime = int(datetime.datetime(*MTIME).timestamp())
+                archive.addfile(info, io.BytesIO(data))
+        return path
+
+    def read_zip(self, path):
+        with zipfile.ZipFile(path) as archive:
+            return {info.filename: (info, archive.read(info)) for info in archive.infolist()}
+
+    def read_tar(self, path):
+        with tarfile.open(path) as archive:
+            return {info.name: (info, archive.extractfile(info).read() if info.isfile() else None)
+                    for info in archive.getmembers()}
+
+    def check_results(self, results, members):
+        by_name = {result.name: result for result in results}
+        self.assertEqual(by_name["docs/a.pdf"].action, "signed")
+        self.assertEqual(by_name["docs/bad.pdf"].action, "failed")
+        self.assertEqual(by_name["docs/bad.pdf"].error, "cannot sign")
+        self.assertEqual(by_name["notes.txt"].action, "passed")
+        self.assertEqual(members["docs/a.pdf"][1], MEMBERS["docs/a.pdf"] + b" signed")
+        # failed and other members are copied unchanged
+        self.assertEqual(members["docs/bad.pdf"][1], MEMBERS["docs/bad.pdf"])
+        self.assertEqual(members["notes.txt"][1], MEMBERS["notes.txt"])
+
+        manifest = json.loads(members["signing-manifest.json"][1])
+        self.assertNotIn("signing-manifest.json", [member["name"] for member in manifest["members"]])
+        for member in manifest["members"]:
+            # None for directories
+            if member["sha256"] is not None:
+                data = members[member["name"]][1]
+                self.assertEqual(member["sha256"], hashlib.sha256(data).hexdigest(), member["name"])
+                self.assertEqual(member["size"], len(data))
+
+    def test_zip(self):
+        from archive_batch import sign_archive, archive_output_path
+
+        input_path = self.write_zip()
+        output_path = archive_output_path(input_path)
+        self.assertEqual(os.path.basename(output_path), "batch_signed.zip")
+        results = sign_archive(input_path, output_path, sign_stream)
+        members = self.read_zip(output_path)
+        self.check_results(results, members)
+        self.assertEqual(list(members)[:2], ["docs/", "docs/a.pdf"])
+        for name in ("docs/a.pdf", "notes.txt"):
+            info = members[name][0]
+            self.assertEqual(info.date_time, MTIME)
+            self.assertEqual(info.external_attr >> 16, 0o640)
+
+    def test_tar_to_zip(self):
+        from archive_batch import sign_archive
+
+        output_path = os.path.join(self.tmp_dir, "out.zip")
+        results = sign_archive(self.write_tar(), output_path, sign_stream)
+        members = self.read_zip(output_path)
+        self.check_results(results, members)
+        self.assertTrue(members["docs/"][0].is_dir())
+        self.assertEqual(members["notes.txt"][0].date_time, MTIME)
+        # the directory has mtime 0
+        self.assertEqual(members["docs/"][0].date_time, (1980, 1, 1, 0, 0, 0))
+
+    def test_tar(self):
+        from archive_batch import sign_archive, archive_output_path
+
+        input_path = self.write_tar()
+        output_path = archive_output_path(input_path, os.path.join(self.tmp_dir, "signed"))
+        self.assertTrue(output_path.endswith(os.path.join("signed", "batch_signed.tar.gz")))
+        results = sign_archive(input_path, output_path, sign_stream)
+        members = self.read_tar(output_path)
+        self.check_results(results, members)
+        self.assertTrue(members["docs"][0].isdir())
+        self.assertEqual(members["notes.txt"][0].mode, 0o640)
+
+    def test_interrupted_run_leaves_no_output(self):
+        from archive_batch import sign_archive
+
+        def interrupt(input_stream, output_stream):
+            raise KeyboardInterrupt
+
+        output_path = os.path.join(self.tmp_dir, "out.zip")
+        with self.assertRaises(KeyboardInterrupt):
+            sign_archive(self.write_zip(), output_path, interrupt)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["batch.zip"])
+
+    def test_verify(self):
+        from archive_batch import verify_archive
+
+        def verify_stream(input_stream, name):
+            if name.endswith("bad.pdf"):
+                raise ValueError("broken")
+            return [{'field': "Signature1"}]
+
+        results = {result.name: result for result in verify_archive(self.write_zip(), verify_stream)}
+        self.assertEqual(results["docs/a.pdf"].action, "verified")
+        self.assertEqual(results["docs/bad.pdf"].action, "failed")
+        self.assertEqual(results["notes.txt"].action, "skipped")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""@package docstring
+Certificate inventory: incremental scans and chain health, including an
+intermediate CA named like its root.
+"""
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+
+from support import make_certificate, write_pem
+
+
+class CertificateInventoryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = make_certificate("Test Root CA", ca=True, days=3650)
+        cls.intermediate = make_certificate("Test Intermediate CA", issuer=cls.root, ca=True, days=1825)
+
+    def setUp(self):
+        from cert_inventory import CertificateInventory
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cert_dir = os.path.join(self.tmp_dir, "certs")
+        os.mkdir(self.cert_dir)
+        self.inventory = CertificateInventory(os.path.join(self.tmp_dir, "certificates.db"))
+        self.write("root", self.root)
+        self.write("intermediate", self.intermediate)
+
+    def tearDown(self):
+        self.inventory.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write(self, name, pair):
+        return write_pem(self.cert_dir, name, cert=pair[1])[1]
+
+    def health(self, **kwargs):
+        self.inventory.scan([self.cert_dir])
+        return {health.subject.split(": ")[-1]: health for health in self.inventory.health(**kwargs)}
+
+    def test_healthy_chain(self):
+        self.write("signer", make_certificate("Signer", issuer=self.intermediate, days=365))
+        report = self.health()
+        self.assertEqual({subject: health.status for subject, health in report.items()},
+                         {"Test Root CA": "ok", "Test Intermediate CA": "ok", "Signer": "ok"})
+        self.assertEqual(report["Signer"].chain_expires, report["Signer"].not_after)
+
+    def test_expiring_and_expired(self):
+        self.write("signer", make_certificate("Signer", issuer=self.intermediate, days=10))
+        self.assertEqual(self.health()["Signer"].status, "expiring")
+        later = datetime.datetime.now(datetime.UTC) + datetime.timedelta(days=11)
+        report = self.inventory.health(now=later)
+        # most severe first
+        self.assertEqual((report[0].subject, report[0].status), ("Common Name: Signer", "expired"))
+
+    def test_chain_expires_with_intermediate(self):
+        short_lived = make_certificate("Short Intermediate CA", issuer=self.root, ca=True, days=20)
+        self.write("short", short_lived)
+        self.write("signer", make_certificate("Signer", issuer=short_lived, days=365))
+        signer = self.health()["Signer"]
+        self.assertEqual(signer.status, "expiring")
+        self.assertEqual(signer.chain_expires, self.health()["Short Intermediate CA"].not_after)
+        self.assertIn("Short Intermediate CA", signer.problem)
+
+    def test_broken_chains(self):
+        outside_ca = make_certificate("Outside CA", ca=True, days=365)
+        not_a_ca = make_certificate("Plain Signer", days=365)
+        self.write("plain", not_a_ca)
+        self.write("orphan", make_certificate("Orphan", issuer=outside_ca, days=365))
+        self.write("misissued", make_certificate("Misissued", issuer=not_a_ca, days=365))
+        # same name as the intermediate, but signed by another key
+        impostor = make_certificate("Test Intermediate CA", ca=True, days=365)
+        self.write("forged", make_certificate("Forged", issuer=impostor, days=365, authority_key_id=False))
+        report = self.health()
+        self.assertEqual(report["Orphan"].problem, "issuer not found")
+        self.assertEqual(report["Misissued"].problem, "issuer Common Name: Plain Signer is not a CA")
+        self.assertTrue(report["Forged"].problem.startswith("signature does not verify"))
+        for subject in ("Orphan", "Misissued", "Forged"):
+            self.assertEqual(report[subject].status, "broken")
+        self.assertEqual(report["Plain Signer"].status, "ok")
+
+    def test_intermediate_named_like_its_root(self):
+        root = make_certificate("Contoso CA", ca=True, days=3650)
+        intermediate = make_certificate("Contoso CA", issuer=root, ca=True, days=1825, authority_key_id=False)
+        intermediate_file = self.write("contoso-intermediate", intermediate)
+        signer_file = self.write("contoso-signer", make_certificate("Contoso Signer", issuer=intermediate, days=365))
+
+        # without the root, the intermediate must not be taken for its own issuer
+        self.inventory.scan([self.cert_dir])
+        report = self.inventory.health(paths=[intermediate_file, signer_file])
+        self.assertEqual({health.status for health in report}, {"broken"})
+        self.assertEqual({health.problem for health in report}, {"issuer not found"})
+
+        root_file = self.write("contoso-root", root)
+        self.inventory.scan([self.cert_dir])
+        report = self.inventory.health(paths=[root_file, intermediate_file, signer_file])
+        self.assertEqual([health.status for health in report], ["ok", "ok", "ok"])
+
+    def test_incremental_scan(self):
+        first = self.inventory.scan([self.cert_dir])
+        self.assertEqual((first.parsed, first.removed, first.errors), (2, 0, []))
+        self.assertEqual(self.inventory.scan([self.cert_dir]).parsed, 0)
+
+        broken_file = os.path.join(self.cert_dir, "broken.pem")
+        with open(broken_file, "wb") as f:
+            f.write(b"not a certificate")
+        os.remove(os.path.join(self.cert_dir, "root.pem"))
+        result = self.inventory.scan([self.cert_dir])
+        self.assertEqual((result.parsed, result.removed), (1, 1))
+        self.assertEqual([path for path, _ in result.errors], [broken_file])
+        self.assertEqual(self.health()["Test Intermediate CA"].problem, "issuer not found")
+
+
+if __name__ == '__main__':
+    unittest.main()
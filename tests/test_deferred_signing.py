@@ -0,0 +1,114 @@
+"""@package docstring
+Two-phase signing leaves no output behind for documents that fail and
+opens encrypted documents with the batch credentials.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import UNSIGNED_PDF, make_certificate, write_encrypted_pdf
+
+
+class ShortReplyBackend:
+    """Backend wrapper answering with one signature less than asked for."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get_certificates(self):
+        return self.backend.get_certificates()
+
+    def sign_digests(self, digests, md_algorithm):
+        return self.backend.sign_digests(digests, md_algorithm)[:-1]
+
+
+class FailingBackend(ShortReplyBackend):
+    def sign_digests(self, digests, md_algorithm):
+        raise ConnectionError("signer unreachable")
+
+
+class DeferredBatchSignerTest(unittest.TestCase):
+
+    def setUp(self):
+        from asn1crypto import x509 as asn1_x509
+        from cryptography.hazmat.primitives import serialization
+        from deferred_signing import LocalKeyBackend
+
+        self.tmp_dir = tempfile.mkdtemp()
+        private_key, cert = make_certificate("Deferred Signer")
+        self.backend = LocalKeyBackend(
+            private_key, asn1_x509.Certificate.load(cert.public_bytes(serialization.Encoding.DER))
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def sign(self, backend, count=2):
+        from signing import build_signature_meta
+        from deferred_signing import DeferredBatchSigner, field_spec_for
+
+        jobs = [
+            (UNSIGNED_PDF, os.path.join(self.tmp_dir, f"signed{i}.pdf"), build_signature_meta("Signature1"),
+             field_spec_for("Signature1", True, (10, 10, 100, 60), 0))
+            for i in range(count)
+        ]
+        return DeferredBatchSigner(backend).sign_documents(jobs)
+
+    def test_signs_batch(self):
+        results = self.sign(self.backend)
+        self.assertTrue(all(result.error is None for result in results))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["signed0.pdf", "signed1.pdf"])
+
+    def test_failing_signer_leaves_no_output(self):
+        results = self.sign(FailingBackend(self.backend))
+        self.assertTrue(all(isinstance(result.error, ConnectionError) for result in results))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_short_reply_fails_whole_chunk(self):
+        results = self.sign(ShortReplyBackend(self.backend))
+        self.assertTrue(all(result.error is not None for result in results))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_unreadable_input_leaves_no_output(self):
+        from signing import build_signature_meta
+        from deferred_signing import DeferredBatchSigner
+
+        broken = os.path.join(self.tmp_dir, "broken.pdf")
+        with open(broken, "wb") as f:
+            f.write(b"not a pdf")
+        output_file = os.path.join(self.tmp_dir, "broken_signed.pdf")
+        results = DeferredBatchSigner(self.backend).sign_documents(
+            [(broken, output_file, build_signature_meta("Signature1"), None)]
+        )
+        self.assertIsNotNone(results[0].error)
+        self.assertEqual(os.listdir(self.tmp_dir), ["broken.pdf"])
+
+    def test_encrypted_input_uses_credentials(self):
+        from pyhanko.pdf_utils.reader import PdfFileReader
+        from pyhanko.pdf_utils.crypt import pdfmac
+        from pyhanko.sign.validation import validate_pdf_signature
+        from signing import build_signature_meta
+        from deferred_signing import DeferredBatchSigner
+        from pdf_encryption import PdfCredentials
+
+        encrypted = write_encrypted_pdf(os.path.join(self.tmp_dir, "encrypted.pdf"), "s3cret")
+        output_file = os.path.join(self.tmp_dir, "encrypted_signed.pdf")
+        job = (encrypted, output_file, build_signature_meta("Signature1"), None)
+        results = DeferredBatchSigner(self.backend).sign_documents([job])
+        self.assertIsNotNone(results[0].error)
+        self.assertFalse(os.path.exists(output_file))
+
+        results = DeferredBatchSigner(self.backend, credentials=PdfCredentials(["wrong", "s3cret"])).sign_documents([job])
+        self.assertIsNone(results[0].error)
+        with open(output_file, "rb") as f:
+            reader = PdfFileReader(f)
+            self.assertTrue(reader.encrypted)
+            reader.decrypt("s3cret")
+            # raises without the ISO 32004 MAC token of the signature
+            pdfmac.validate_pdf_mac(reader)
+            self.assertTrue(validate_pdf_signature(reader.embedded_signatures[0]).intact)
+
+
+if __name__ == '__main__':
+    unittest.main()
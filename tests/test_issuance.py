@@ -0,0 +1,54 @@
+"""@package docstring
+Issuance records: serials are unique per issuer only.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import make_certificate
+
+
+class IssuanceDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        from issuance import IssuanceDatabase
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db = IssuanceDatabase(os.path.join(self.tmp_dir, "issued.db"))
+        self.ca1 = make_certificate("CA 1", ca=True)
+        self.ca2 = make_certificate("CA 2", ca=True)
+        _, cert = make_certificate("Leaf", issuer=self.ca1)
+        self.serial = cert.serial_number
+        self.db.record(cert, self.ca1[0].public_key())
+        # a second CA that happens to use the same serial
+        self.db.record(cert, self.ca2[0].public_key())
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def revoked_serials(self, ca):
+        return [serial for serial, _, _ in self.db.entries(ca[0].public_key(), revoked_only=True)]
+
+    def test_ambiguous_serial_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.db.revoke(self.serial, "key_compromise")
+        self.assertEqual(self.revoked_serials(self.ca1), [])
+        self.assertEqual(self.revoked_serials(self.ca2), [])
+
+    def test_revoke_for_issuer(self):
+        self.assertEqual(self.db.revoke(self.serial, "key_compromise", issuer_public_key=self.ca1[0].public_key()), 1)
+        self.assertEqual(self.revoked_serials(self.ca1), [self.serial])
+        self.assertEqual(self.revoked_serials(self.ca2), [])
+        # once only one good record is left, the serial is no longer ambiguous
+        self.assertEqual(self.db.revoke(self.serial), 1)
+        self.assertEqual(self.revoked_serials(self.ca2), [self.serial])
+
+    def test_unknown_reason(self):
+        with self.assertRaises(ValueError):
+            self.db.revoke(self.serial, "no_reason", issuer_public_key=self.ca1[0].public_key())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""@package docstring
+Leases of the SQLite job broker: expiry and re-lease, heartbeats, retries
+up to max_attempts, and workers losing their lease.
+"""
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import contextlib
+
+import support  # noqa: F401, puts src on the path
+
+
+class SQLiteJobBrokerTest(unittest.TestCase):
+
+    def setUp(self):
+        from job_queue import SQLiteJobBroker
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "jobs.db")
+        self.broker = SQLiteJobBroker(self.path)
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_lease_in_order(self):
+        ids = self.broker.enqueue([("a.pdf", "out/a.pdf", {'field_name': "Sig"}), ("b.pdf", "out/b.pdf", None)])
+        first = self.broker.lease("w1")
+        second = self.broker.lease("w2")
+        self.assertEqual((first.id, second.id), tuple(ids))
+        self.assertEqual((first.options, second.options), ({'field_name': "Sig"}, {}))
+        self.assertIsNone(self.broker.lease("w3"))
+        self.assertTrue(self.broker.complete(first))
+        self.assertEqual(self.broker.counts(), {'pending': 0, 'leased': 1, 'done': 1, 'failed': 0})
+
+    def test_expired_lease_is_leased_again(self):
+        self.broker.enqueue([("a.pdf", "out/a.pdf", {})])
+        stalled = self.broker.lease("w1", visibility_timeout=-1)
+        retry = self.broker.lease("w2")
+        self.assertEqual(retry.id, stalled.id)
+        self.assertEqual(retry.attempts, 2)
+        self.assertNotEqual(retry.lease_token, stalled.lease_token)
+        # the stalled worker can neither renew nor finish the job
+        self.assertFalse(self.broker.heartbeat(stalled))
+        self.assertFalse(self.broker.complete(stalled))
+        self.assertFalse(self.broker.fail(stalled, "late"))
+        self.assertTrue(self.broker.complete(retry))
+
+    def test_heartbeat_keeps_lease(self):
+        self.broker.enqueue([("a.pdf", "out/a.pdf", {})])
+        job = self.broker.lease("w1", visibility_timeout=-1)
+        self.assertTrue(self.broker.heartbeat(job, visibility_timeout=60))
+        self.assertIsNone(self.broker.lease("w2"))
+        self.assertTrue(self.broker.complete(job))
+
+    def test_fail_until_max_attempts(self):
+        self.broker.enqueue([("a.pdf", "out/a.pdf", {})], max_attempts=2)
+        job = self.broker.lease("w1")
+        self.assertTrue(self.broker.fail(job, ValueError("first")))
+        self.assertEqual(self.broker.counts()['pending'], 1)
+        job = self.broker.lease("w1")
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(self.broker.fail(job, ValueError("second")))
+        self.assertIsNone(self.broker.lease("w1"))
+        self.assertEqual(self.broker.counts()['failed'], 1)
+        self.assertEqual(self.broker.failed_jobs(), [(job.id, "a.pdf", 2, "second")])
+
+    def test_expired_last_attempt_fails(self):
+        self.broker.enqueue([("a.pdf", "out/a.pdf", {})], max_attempts=1)
+        self.broker.lease("w1", visibility_timeout=-1)
+        self.assertIsNone(self.broker.lease("w2"))
+        self.assertEqual(self.broker.failed_jobs()[0][3], "lease expired")
+
+
+class RunWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        from job_queue import SQLiteJobBroker
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "jobs.db")
+        self.broker = SQLiteJobBroker(self.path)
+
+    def tearDown(self):
+        self.broker.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_done_and_failed(self):
+        from job_queue import run_worker
+
+        self.broker.enqueue([("good.pdf", "out/good.pdf", {}), ("bad.pdf", "out/bad.pdf", {})], max_attempts=1)
+
+        def process_job(job):
+            if job.pdf_file == "bad.pdf":
+                raise ValueError("cannot sign")
+
+        self.assertEqual(run_worker(self.broker, process_job, exit_when_idle=True), (1, 1))
+        self.assertEqual(self.broker.failed_jobs()[0][3], "cannot sign")
+
+    def test_lost_lease_discards_result(self):
+        from job_queue import run_worker
+
+        self.broker.enqueue([("a.pdf", "out/a.pdf", {})])
+        messages = []
+
+        def process_job(job):
+            if job.attempts == 1:
+                # another node took the first attempt over
+                with contextlib.closing(sqlite3.connect(self.path)) as other, other:
+                    other.execute("UPDATE jobs SET lease_token = 'other' WHERE id = ?", (job.id,))
+                # until the heartbeat, every third of the visibility timeout, notices and the lease expires
+                time.sleep(0.4)
+
+        done, failed = run_worker(self.broker, process_job, visibility_timeout=0.3, exit_when_idle=True,
+                                  log=messages.append)
+        self.assertEqual((done, failed), (1, 0))
+        self.assertIn("lost", messages[0])
+        self.assertIn("done", messages[1])
+
+if __name__ == '__main__':
+    unittest.main()
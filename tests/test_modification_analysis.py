@@ -0,0 +1,103 @@
+"""@package docstring
+Difference analysis levels against a revision that tampers with the page
+after signing. Run `python -m unittest discover tests` from the
+repository root.
+"""
+import io
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from support import UNSIGNED_PDF, write_signer_files
+
+
+def tamper_page_contents(signed_file, output_file):
+    """Append a revision replacing the content stream of the first page."""
+
+    from pyhanko.pdf_utils import generic
+    from pyhanko.pdf_utils.incremental_writer import IncrementalPdfFileWriter
+
+    with open(signed_file, "rb") as f:
+        data = io.BytesIO(f.read())
+    writer = IncrementalPdfFileWriter(data)
+    page_ref = writer.root['/Pages']['/Kids'].raw_get(0)
+    page = page_ref.get_object()
+    contents = generic.StreamObject(stream_data=b"BT /F1 24 Tf 72 720 Td (Tampered) Tj ET")
+    page['/Contents'] = writer.add_object(contents)
+    writer.update_container(page)
+    writer.write_in_place()
+    with open(output_file, "wb") as f:
+        f.write(data.getvalue())
+
+
+class TamperedRevisionTest(unittest.TestCase):
+    """A later revision replacing /Contents must never be reported valid."""
+
+    @classmethod
+    def setUpClass(cls):
+        from pyhanko.sign import signers
+        from signing import build_signature_meta, sign_document
+
+        # pyHanko logs every rejected diff with a traceback
+        cls.pyhanko_logger = logging.getLogger("pyhanko")
+        cls.log_level = cls.pyhanko_logger.level
+        cls.pyhanko_logger.setLevel(logging.CRITICAL)
+        cls.tmp_dir = tempfile.mkdtemp()
+        key_file, cls.cert_file = write_signer_files(cls.tmp_dir)
+        signer = signers.SimpleSigner.load(key_file, cls.cert_file)
+        cls.signed_file = os.path.join(cls.tmp_dir, "signed.pdf")
+        sign_document(UNSIGNED_PDF, cls.signed_file, signer, build_signature_meta("Signature1"), create_field=True)
+        cls.tampered_file = os.path.join(cls.tmp_dir, "tampered.pdf")
+        tamper_page_contents(cls.signed_file, cls.tampered_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pyhanko_logger.setLevel(cls.log_level)
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def validate(self, path, level):
+        from pyhanko.keys import load_cert_from_pemder
+        from pyhanko.pdf_utils.reader import PdfFileReader
+        from pyhanko_certvalidator import ValidationContext
+        from modification_analysis import validate_signature
+
+        with open(path, "rb") as doc:
+            sig = PdfFileReader(doc).embedded_signatures[0]
+            context = ValidationContext(trust_roots=[load_cert_from_pemder(self.cert_file)])
+            return validate_signature(sig, context, level=level)
+
+    def test_levels(self):
+        from modification_analysis import signature_verdict
+
+        expected = {"always": "INVALID", "on-failure": "INVALID", "off": "UNCHECKED"}
+        for level, verdict in expected.items():
+            with self.subTest(level=level):
+                status = self.validate(self.tampered_file, level)
+                self.assertEqual(signature_verdict(status), verdict)
+                self.assertIs(status.docmdp_ok, None if level == "off" else False)
+
+    def test_untampered_is_valid_at_every_level(self):
+        from modification_analysis import ANALYSIS_LEVELS, signature_verdict
+
+        for level in ANALYSIS_LEVELS:
+            with self.subTest(level=level):
+                self.assertEqual(signature_verdict(self.validate(self.signed_file, level)), "VALID")
+
+    def test_verify_exit_code(self):
+        from cli import cli
+
+        runner = CliRunner()
+        for level in ("always", "on-failure", "off"):
+            with self.subTest(level=level):
+                result = runner.invoke(cli, ["verify", "--trust-root", self.cert_file, "--revocation-mode", "off",
+                                             "--analysis-level", level, self.tampered_file])
+                self.assertEqual(result.exit_code, 1, result.output)
+                self.assertNotIn("\tVALID\t", result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
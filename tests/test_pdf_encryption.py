@@ -0,0 +1,85 @@
+"""@package docstring
+Encrypted documents are unlocked with the batch passwords, trying the one
+that opened the same encryption dictionary before first.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from support import UNSIGNED_PDF, write_encrypted_pdf
+
+
+class PdfCredentialsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.encrypted = write_encrypted_pdf(os.path.join(cls.tmp_dir, "encrypted.pdf"), "s3cret")
+        cls.other = write_encrypted_pdf(os.path.join(cls.tmp_dir, "other.pdf"), "s3cret")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def unlock(self, credentials, path):
+        """AuthResult of unlocking path and the passwords tried."""
+
+        from pyhanko.pdf_utils.reader import PdfFileReader
+
+        with open(path, "rb") as f:
+            reader = PdfFileReader(f)
+            with mock.patch.object(PdfFileReader, "decrypt", autospec=True,
+                                   side_effect=PdfFileReader.decrypt) as decrypt:
+                result = credentials.unlock(reader, path)
+            # the document is readable with the key set by authenticate()
+            reader.root['/Pages']
+        return result, [call.args[1] for call in decrypt.call_args_list]
+
+    def test_known_password_is_tried_first(self):
+        from pyhanko.pdf_utils.crypt import AuthStatus
+        from pdf_encryption import PdfCredentials
+
+        credentials = PdfCredentials(["wrong", "also wrong", "s3cret"])
+        result, tried = self.unlock(credentials, self.encrypted)
+        self.assertEqual(result.status, AuthStatus.USER)
+        self.assertEqual(tried, ["wrong", "also wrong", "s3cret"])
+        self.assertEqual((credentials.key_cache.hits, credentials.key_cache.misses), (0, 1))
+
+        # a further revision of the same document
+        result, tried = self.unlock(credentials, self.encrypted)
+        self.assertEqual(result.status, AuthStatus.USER)
+        self.assertEqual(tried, ["s3cret"])
+        self.assertEqual(credentials.key_cache.hits, 1)
+
+    def test_other_encryption_dictionary_misses(self):
+        from pdf_encryption import PdfCredentials
+
+        credentials = PdfCredentials(["wrong", "s3cret"])
+        self.unlock(credentials, self.encrypted)
+        # same password, but its own /O and /U entries
+        _, tried = self.unlock(credentials, self.other)
+        self.assertEqual(tried, ["wrong", "s3cret"])
+        self.assertEqual((credentials.key_cache.hits, credentials.key_cache.misses), (0, 2))
+
+    def test_wrong_passwords(self):
+        from pdf_encryption import PdfCredentials, PasswordError
+
+        credentials = PdfCredentials(["wrong"], {"other*.pdf": "s3cret"})
+        with self.assertRaises(PasswordError):
+            self.unlock(credentials, self.encrypted)
+        # the per file password of a matching pattern comes first
+        _, tried = self.unlock(credentials, self.other)
+        self.assertEqual(tried, ["s3cret"])
+
+    def test_plain_document(self):
+        from pyhanko.pdf_utils.reader import PdfFileReader
+        from pdf_encryption import PdfCredentials
+
+        with open(UNSIGNED_PDF, "rb") as f:
+            self.assertIsNone(PdfCredentials().unlock(PdfFileReader(f)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""@package docstring
+Signing through the PKCS#11 session pool against a SoftHSM token.
+
+Skipped when softhsm2-util or the SoftHSM module is missing; set
+SOFTHSM2_MODULE to the module path if it is not in a standard location.
+Run `python -m unittest discover tests` from the repository root.
+"""
+import os
+import queue
+import shutil
+import tempfile
+import unittest
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from support import UNSIGNED_PDF, write_signer_files
+
+SOFTHSM_MODULES = (
+    "/usr/lib/softhsm/libsofthsm2.so",
+    "/usr/lib/x86_64-linux-gnu/softhsm/libsofthsm2.so",
+    "/usr/lib64/pkcs11/libsofthsm2.so",
+    "/usr/local/lib/softhsm/libsofthsm2.so",
+    "/opt/homebrew/lib/softhsm/libsofthsm2.so",
+)
+TOKEN_LABEL = "pool-test"
+KEY_LABEL = "pool-key"
+USER_PIN = "1234"
+
+
+def find_softhsm_module():
+    """SoftHSM module path, or None."""
+
+    candidates = [os.environ.get("SOFTHSM2_MODULE")] + list(SOFTHSM_MODULES)
+    return next((path for path in candidates if path and os.path.exists(path)), None)
+
+
+@unittest.skipUnless(shutil.which("softhsm2-util") and find_softhsm_module(), "SoftHSM is not installed")
+class PKCS11SessionPoolTest(unittest.TestCase):
+    """Session pool against a fresh SoftHSM token."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        token_dir = os.path.join(cls.tmp_dir, "tokens")
+        os.makedirs(token_dir)
+        conf_file = os.path.join(cls.tmp_dir, "softhsm2.conf")
+        with open(conf_file, "w") as f:
+            f.write(f"directories.tokendir = {token_dir}\nobjectstore.backend = file\n")
+        cls.previous_conf = os.environ.get("SOFTHSM2_CONF")
+        os.environ["SOFTHSM2_CONF"] = conf_file
+
+        key_file, cls.cert_file = write_signer_files(cls.tmp_dir)
+        subprocess.run(["softhsm2-util", "--init-token", "--free", "--label", TOKEN_LABEL,
+                        "--pin", USER_PIN, "--so-pin", "4321"], check=True, capture_output=True)
+        subprocess.run(["softhsm2-util", "--import", key_file, "--token", TOKEN_LABEL, "--label", KEY_LABEL,
+                        "--id", "01", "--pin", USER_PIN], check=True, capture_output=True)
+        cls.module = find_softhsm_module()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.previous_conf is None:
+            os.environ.pop("SOFTHSM2_CONF", None)
+        else:
+            os.environ["SOFTHSM2_CONF"] = cls.previous_conf
+        shutil.rmtree(cls.tmp_dir, ignore_errors=True)
+
+    def tearDown(self):
+        from pkcs11_backend import close_session_pools
+
+        # closing every session also logs the token out
+        close_session_pools()
+
+    def pool(self, user_pin=USER_PIN, key_label=KEY_LABEL, size=2):
+        from pkcs11_backend import get_session_pool
+
+        return get_session_pool(self.module, token_label=TOKEN_LABEL, user_pin=user_pin, key_label=key_label,
+                                cert_file=self.cert_file, size=size)
+
+    def sign_and_validate(self, pool, name):
+        from pyhanko.keys import load_cert_from_pemder
+        from pyhanko.pdf_utils.reader import PdfFileReader
+        from pyhanko.sign.validation import validate_pdf_signature
+        from pyhanko_certvalidator import ValidationContext
+        from signing import build_signature_meta, sign_document
+
+        output_file = os.path.join(self.tmp_dir, f"{name}.pdf")
+        with pool.signer(timeout=30) as signer:
+            sign_document(UNSIGNED_PDF, output_file, signer,
+                          build_signature_meta("Signature1"), create_field=True)
+        with open(output_file, "rb") as doc:
+            sig = PdfFileReader(doc).embedded_signatures[0]
+            status = validate_pdf_signature(
+                sig, ValidationContext(trust_roots=[load_cert_from_pemder(self.cert_file)])
+            )
+        return status
+
+    def test_sign_through_pool(self):
+        pool = self.pool(size=2)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            statuses = list(executor.map(lambda i: self.sign_and_validate(pool, f"signed{i}"), range(6)))
+        self.assertTrue(all(status.bottom_line for status in statuses))
+        self.assertLessEqual(len(pool._sessions), 2)
+
+    def test_failed_key_lookup_frees_slot(self):
+        pool = self.pool(key_label="missing-key", size=1)
+        for _ in range(3):
+            # a leaked session would exhaust the pool and end in queue.Empty
+            with self.assertRaises(Exception) as raised:
+                with pool.signer(timeout=1):
+                    pass
+            self.assertNotIsInstance(raised.exception, queue.Empty)
+        self.assertEqual(pool._sessions, [])
+
+    def test_corrected_pin_gets_new_pool(self):
+        import pkcs11
+
+        wrong_pool = self.pool(user_pin="0000")
+        with self.assertRaises(pkcs11.PKCS11Error):
+            with wrong_pool.signer(timeout=1):
+                pass
+        pool = self.pool()
+        self.assertIsNot(pool, wrong_pool)
+        self.assertTrue(self.sign_and_validate(pool, "corrected").bottom_line)
+
+    def test_pool_per_size(self):
+        self.assertIsNot(self.pool(size=1), self.pool(size=2))
+        self.assertIs(self.pool(size=2), self.pool(size=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
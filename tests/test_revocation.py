@@ -0,0 +1,137 @@
+"""@package docstring
+The revocation cache reuses CRLs until their nextUpdate, and data without
+nextUpdate for max_age seconds, in memory and on disk.
+"""
+import os
+import time
+import shutil
+import datetime
+import tempfile
+import unittest
+
+from support import make_certificate
+
+
+class FakeResponse:
+    """requests response with content and status."""
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code != 200:
+            raise requests.HTTPError(f"{self.status_code}")
+
+
+class FakeSession:
+    """requests session serving one CRL per URL."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        return self.responses.get(url) or FakeResponse(b"", 404)
+
+
+def make_crl(next_update_days):
+    """DER CRL of a new CA with nextUpdate that many days from now, or none."""
+
+    from asn1crypto import crl
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+
+    private_key, cert = make_certificate("Revocation Test CA", ca=True)
+    next_update = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=next_update_days or 1)
+    builder = x509.CertificateRevocationListBuilder().issuer_name(cert.subject)
+    builder = builder.last_update(next_update - datetime.timedelta(days=7)).next_update(next_update)
+    data = builder.sign(private_key, hashes.SHA256()).public_bytes(serialization.Encoding.DER)
+    if next_update_days is None:
+        # optional in RFC 5280, cryptography always writes it; the cache does not check signatures
+        crl_list = crl.CertificateList.load(data)
+        crl_list['tbs_cert_list']['next_update'] = None
+        data = crl_list.dump(force=True)
+    return data
+
+
+class RevocationCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.crls = {
+            "http://ca.test/fresh.crl": FakeResponse(make_crl(1)),
+            "http://ca.test/expired.crl": FakeResponse(make_crl(-1)),
+            "http://ca.test/undated.crl": FakeResponse(make_crl(None)),
+        }
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.session = FakeSession(self.crls)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def cache(self, max_age=3600):
+        from revocation import RevocationCache
+
+        return RevocationCache(self.cache_dir, max_age=max_age, session=self.session)
+
+    def test_reused_until_next_update(self):
+        cache = self.cache()
+        first = cache.get_crl("http://ca.test/fresh.crl")
+        second = cache.get_crl("http://ca.test/fresh.crl")
+        self.assertEqual(first.dump(), second.dump())
+        self.assertEqual((cache.fetches, cache.hits), (1, 1))
+        # a new process reads the file instead of fetching again
+        cache = self.cache()
+        cache.get_crl("http://ca.test/fresh.crl")
+        self.assertEqual((cache.fetches, cache.hits), (0, 1))
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_past_next_update_is_fetched_again(self):
+        cache = self.cache()
+        cache.get_crl("http://ca.test/expired.crl")
+        cache.get_crl("http://ca.test/expired.crl")
+        self.assertEqual(cache.fetches, 2)
+
+    def test_max_age_without_next_update(self):
+        url = "http://ca.test/undated.crl"
+        cache = self.cache(max_age=3600)
+        cache.get_crl(url)
+        cache.get_crl(url)
+        self.assertEqual((cache.fetches, cache.hits), (1, 1))
+
+        cache = self.cache(max_age=0)
+        cache.get_crl(url)
+        self.assertEqual(cache.fetches, 1)
+
+        # the age of a cached file is that of its last fetch
+        for name in os.listdir(os.path.join(self.cache_dir, "crl")):
+            old = time.time() - 7200
+            os.utime(os.path.join(self.cache_dir, "crl", name), (old, old))
+        cache = self.cache(max_age=3600)
+        cache.get_crl(url)
+        self.assertEqual(cache.fetches, 1)
+
+    def test_fetch_error(self):
+        from pyhanko_certvalidator import errors
+
+        cache = self.cache()
+        with self.assertRaises(errors.CRLFetchError):
+            cache.get_crl("http://ca.test/missing.crl")
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_clear(self):
+        cache = self.cache()
+        cache.get_crl("http://ca.test/fresh.crl")
+        cache.clear()
+        cache.get_crl("http://ca.test/fresh.crl")
+        self.assertEqual(cache.fetches, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""@package docstring
+Size-aware scheduling: largest files first, memory budget admission, the
+cap on large files and merging of worker process results.
+"""
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import support  # noqa: F401, puts src on the path
+
+
+class ConcurrencyProbe:
+    """Batch function recording start order and concurrent jobs."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.started = []
+        self.running = set()
+        self.peak = 0
+        self.alongside = {}
+
+    def __call__(self, path):
+        name = os.path.basename(path)
+        with self.lock:
+            self.started.append(name)
+            self.running.add(name)
+            self.peak = max(self.peak, len(self.running))
+            for other in self.running:
+                self.alongside.setdefault(other, set()).update(self.running - {other})
+        time.sleep(self.delay)
+        with self.lock:
+            self.running.discard(name)
+        return name.upper()
+
+
+class SizeAwareSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write(self, name, size):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        return path
+
+    def test_largest_first(self):
+        from scheduler import SizeAwareScheduler
+
+        paths = [self.write("small", 10), self.write("large", 3000), self.write("medium", 500)]
+        probe = ConcurrencyProbe(delay=0)
+        results, report = SizeAwareScheduler(max_workers=1).run(probe, paths)
+        self.assertEqual(probe.started, ["large", "medium", "small"])
+        # results keep the input order
+        self.assertEqual(results, ["SMALL", "LARGE", "MEDIUM"])
+        self.assertEqual(report.jobs, 3)
+
+    def test_exceptions_are_results(self):
+        from scheduler import SizeAwareScheduler
+
+        def fail_odd(path):
+            if path.endswith("1"):
+                raise ValueError(path)
+            return path
+
+        paths = [self.write(f"file{i}", 100) for i in range(3)]
+        results, _ = SizeAwareScheduler(max_workers=2).run(fail_odd, paths)
+        self.assertEqual(results[0], paths[0])
+        self.assertIsInstance(results[1], ValueError)
+
+    def test_memory_budget(self):
+        from scheduler import SizeAwareScheduler, JOB_OVERHEAD
+
+        paths = [self.write(f"file{i}", 1000) for i in range(5)]
+        scheduler = SizeAwareScheduler(max_workers=4, memory_budget=2 * JOB_OVERHEAD + 2000, cost_factor=1)
+        probe = ConcurrencyProbe()
+        results, report = scheduler.run(probe, paths)
+        self.assertEqual(len(probe.started), 5)
+        self.assertEqual(probe.peak, 2)
+        self.assertEqual(report.peak_concurrency, 2)
+        self.assertLessEqual(report.peak_bytes_in_flight, scheduler.memory_budget)
+
+    def test_job_over_budget_runs_alone(self):
+        from scheduler import SizeAwareScheduler, JOB_OVERHEAD
+
+        paths = [self.write("huge", 50000)] + [self.write(f"file{i}", 100) for i in range(3)]
+        scheduler = SizeAwareScheduler(max_workers=4, memory_budget=4 * JOB_OVERHEAD, cost_factor=1000)
+        probe = ConcurrencyProbe()
+        scheduler.run(probe, paths)
+        self.assertEqual(probe.started[0], "huge")
+        self.assertEqual(probe.alongside.get("huge", set()), set())
+
+    def test_large_file_cap(self):
+        from scheduler import SizeAwareScheduler
+
+        paths = [self.write(f"large{i}", 5000) for i in range(3)] + [self.write(f"small{i}", 10) for i in range(2)]
+        scheduler = SizeAwareScheduler(max_workers=4, large_file_size=1000, large_workers=1)
+        probe = ConcurrencyProbe()
+        scheduler.run(probe, paths)
+        for name in ("large0", "large1", "large2"):
+            self.assertFalse({other for other in probe.alongside.get(name, ()) if other.startswith("large")})
+        # small files fill the workers a large one leaves free
+        self.assertGreater(probe.peak, 1)
+
+
+@unittest.skipUnless(__import__("scheduler").PROCESSES_AVAILABLE, "needs fork")
+class ProcessSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        from metrics import REGISTRY
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.tmp_dir, f"file{i}")
+            with open(path, "wb") as f:
+                f.write(b"\0" * (i + 1) * 100)
+            self.paths.append(path)
+        self.jobs = REGISTRY.counter("test_scheduler_jobs_total", "Jobs run by the scheduler tests.", ["kind"])
+        self.seconds = REGISTRY.histogram("test_scheduler_job_seconds", "Job durations of the scheduler tests.")
+        REGISTRY.drain()
+
+    def tearDown(self):
+        from tracing import disable_tracing, drain_spans
+
+        disable_tracing()
+        drain_spans()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_results_metrics_and_spans_are_merged(self):
+        from scheduler import SizeAwareScheduler
+        from tracing import enable_tracing, drain_spans, span
+
+        def job(path):
+            with span("test_job", file=os.path.basename(path)):
+                self.jobs.inc(kind="file")
+                self.seconds.observe(0.5)
+            if path.endswith("3"):
+                raise ValueError("no good")
+            return os.getpid(), os.path.basename(path)
+
+        enable_tracing()
+        scheduler = SizeAwareScheduler(max_workers=2, processes=True)
+        self.assertTrue(scheduler.processes)
+        results, _ = scheduler.run(job, self.paths)
+
+        self.assertEqual([name for _, name in results[:3]], ["file0", "file1", "file2"])
+        self.assertNotIn(os.getpid(), [pid for pid, _ in results[:3]])
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(self.jobs.value(kind="file"), 4)
+        self.assertEqual(self.seconds.count(), 4)
+        spans = [s for s in drain_spans() if s[0] == "test_job"]
+        self.assertEqual(sorted(s[6]['file'] for s in spans), ["file0", "file1", "file2", "file3"])
+        # worker spans keep distinct ids and are tracked per process
+        self.assertEqual(len({s[1] for s in spans}), 4)
+        self.assertNotIn(threading.get_ident(), {s[3] for s in spans})
+
+    def test_unpicklable_result(self):
+        from scheduler import SizeAwareScheduler
+
+        def job(path):
+            # locks cannot be pickled back to the parent
+            raise ValueError(threading.Lock())
+
+        results, _ = SizeAwareScheduler(max_workers=2, processes=True).run(job, self.paths[:2])
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()